@@ -1,122 +1,200 @@
-import google.generativeai as genai
-import os
-from dotenv import load_dotenv
 import re
 import uuid
 import pandas as pd
 import streamlit as st
 import time
 import json
+from llm_client import generate_content, stream_content
+from prompt_builder import job_text
 
-load_dotenv()
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-
-def get_gemini_response(prompt, resume_text, jd_text):
-    model = genai.GenerativeModel('gemini-2.0-flash-lite')
-    response = model.generate_content(prompt)
+def get_gemini_response(prompt, resume_text, jd_text, call_site="match"):
+    response = generate_content(prompt, call_site=call_site)
     return response.text if response and response.text else "No response generated."
 
 
-def extract_details_with_gemini(resume_text):
+def stream_gemini_response(prompt, call_site="match"):
     """
-    Use Gemini to extract structured details from the resume text.
+    Streaming variant of get_gemini_response: yields text chunks as they arrive.
     """
-    try:
-        # Define the prompt for Gemini
-        prompt = f"""
-        You are an AI assistant designed to extract structured information from resumes.
-        Extract the following details from the resume text provided:
-        {{
-        - Full Name : <candidate's full name> 
-        - Email : <candidate's email address>
-        - Phone Number : <candidate's phone number>
-        - Education : <candidate's education details>
-        - Skills : <candidate's skills>
-        - Experience : <candidate's work experience>
-        }}
-
-        Provide the output in JSON format with keys: full_name, email, phone_number, education, skills, experience.
-        If any field is not found, use an empty string instead of null.
+    produced = False
+    for chunk in stream_content(prompt, call_site=call_site):
+        produced = produced or bool(chunk)
+        yield chunk
+    if not produced:
+        yield "No response generated."
+
+
+RESUME_LIST_FIELDS = ("skills", "key_strengths", "areas_for_development", "relevant_experience",
+                      "achievements", "certifications")
+
+RESUME_ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "full_name": {"type": "string"},
+        "email": {"type": "string"},
+        "phone_number": {"type": "string"},
+        "education": {"type": "string", "description": "Degrees, institutions and dates"},
+        "skills": {"type": "array", "items": {"type": "string"},
+                   "description": "Technical skills: languages, frameworks, tools"},
+        "experience": {"type": "string", "description": "Work history, projects and internships"},
+        "profession": {"type": "string", "description": "Current profession, e.g. student, software engineer"},
+        "key_strengths": {"type": "array", "items": {"type": "string"}, "description": "3-5 words each"},
+        "areas_for_development": {"type": "array", "items": {"type": "string"}, "description": "3-5 words each"},
+        "relevant_experience": {"type": "array", "items": {"type": "string"}, "description": "5-7 words each"},
+        "achievements": {"type": "array", "items": {"type": "string"}, "description": "5-7 words each"},
+        "certifications": {"type": "array", "items": {"type": "string"}, "description": "5-7 words each"},
+    },
+    "required": ["full_name", "email", "phone_number", "education", "skills", "experience", "profession",
+                 "key_strengths", "areas_for_development", "relevant_experience", "achievements",
+                 "certifications"],
+}
+
+
+def analyze_resume(resume_text):
+    """
+    One structured Gemini call covering the contact fields stored on the
+    candidate profile and the categories of the persona table.
+
+    Returns a dict with every RESUME_ANALYSIS_SCHEMA key (empty strings or
+    lists for anything not found), or None if the call failed.
+    """
+    prompt = f"""
+        You are an HR analyst. Perform a resume analysis: extract the candidate's contact details,
+        education, skills and experience, and summarise their profession, key strengths, areas for
+        development, relevant experience, achievements and certifications.
+        Use concise language. Extract information directly from the resume; do not add external
+        information or make assumptions. Use an empty string or empty list for anything not found.
 
         Resume Text:
         {resume_text}
         """
+    try:
+        response = generate_content(prompt, call_site="resume_analysis", generation_config={
+            "response_mime_type": "application/json",
+            "response_schema": RESUME_ANALYSIS_SCHEMA,
+        })
+        data = json.loads(response.text)
+    except Exception as e:
+        print(f"Error analyzing resume with Gemini: {e}")
+        return None
 
-        # Generate response using Gemini
-        model = genai.GenerativeModel('gemini-2.0-flash-lite')
-        response = model.generate_content(prompt)
-        print(f"Gemini API Response: {response}")
-
-        # Extract the text content from the response
-        response_text = response.text if response and response.text else None
-
-        if response_text:
-            # More robust JSON extraction
-            # First, try to find JSON pattern in the response
-            json_match = re.search(r'({[\s\S]*})', response_text)
-            if json_match:
-                json_str = json_match.group(1)
-            else:
-                # If no clear JSON pattern, clean up markdown formatting
-                json_str = response_text.replace('```json', '').replace('```', '').strip()
-            
-            # Parse the JSON
-            data = json.loads(json_str)
-            
-            # Replace any None/null values with empty strings
-            for key in data:
-                if data[key] is None:
-                    data[key] = ""
-                    
-            # Generate a unique identifier to append to username if needed
-            unique_id = str(uuid.uuid4())[:8]
-            
-            # If email is empty, create a placeholder
-            if not data.get("email"):
-                data["email"] = f"user_{unique_id}@example.com"
-                
-            # Ensure full_name is unique by adding a unique identifier if needed
-            if data.get("full_name"):
-                data["original_full_name"] = data["full_name"]
-                data["full_name"] = f"{data['full_name']}_{unique_id}"
-            
-            return data
+    analysis = {}
+    for key in RESUME_ANALYSIS_SCHEMA["properties"]:
+        value = data.get(key)
+        if key in RESUME_LIST_FIELDS:
+            analysis[key] = [str(item) for item in value] if isinstance(value, list) else []
         else:
-            print("No response text received from Gemini.")
-            # Return default values with unique identifiers
-            unique_id = str(uuid.uuid4())[:8]
-            return {
-                "full_name": f"User_{unique_id}",
-                "email": f"user_{unique_id}@example.com",
-                "phone_number": "",
-                "education": "",
-                "skills": "",
-                "experience": ""
-            }
-    except json.JSONDecodeError as e:
-        print(f"JSON Decode Error: {e}, Response: {response.text if response else 'No response'}")
-        # Return default values with unique identifiers
-        unique_id = str(uuid.uuid4())[:8]
-        return {
-            "full_name": f"User_{unique_id}",
-            "email": f"user_{unique_id}@example.com",
-            "phone_number": "",
-            "education": "",
-            "skills": "",
-            "experience": ""
-        }
-    except Exception as e:
-        print(f"Error extracting details with Gemini: {e}")
-        # Return default values with unique identifiers
-        unique_id = str(uuid.uuid4())[:8]
-        return {
-            "full_name": f"User_{unique_id}",
-            "email": f"user_{unique_id}@example.com",
-            "phone_number": "",
-            "education": "",
-            "skills": "",
-            "experience": ""
-        }
+            analysis[key] = str(value) if value is not None else ""
+    return analysis
+
+
+def profile_fields(analysis):
+    """
+    Candidate profile columns (full_name, email, phone_number, education,
+    skills, experience) from a resume analysis, with placeholders so sign-up
+    can proceed when the analysis failed or left the name or email empty.
+    """
+    analysis = analysis or {}
+    # Generate a unique identifier to keep names and placeholder emails unique
+    unique_id = str(uuid.uuid4())[:8]
+    full_name = analysis.get("full_name")
+    return {
+        "full_name": f"{full_name}_{unique_id}" if full_name else f"User_{unique_id}",
+        "original_full_name": full_name or "",
+        "email": analysis.get("email") or f"user_{unique_id}@example.com",
+        "phone_number": analysis.get("phone_number", ""),
+        "education": analysis.get("education", ""),
+        "skills": ", ".join(analysis.get("skills", [])),
+        "experience": analysis.get("experience", ""),
+    }
+
+
+def _table_cell(value):
+    """Keep a value on one line and free of the table's column separator."""
+    return " ".join(str(value).replace("|", "/").split())
+
+
+def _bullets(items):
+    return " <br> ".join(f"* {_table_cell(item)}" for item in items) or "None listed"
+
+
+def render_persona_table(analysis):
+    """
+    Render the markdown persona table (the stored `evaluation`) from a resume
+    analysis, in the same Category/Details layout the UI parses.
+    """
+    rows = [
+        ("Name", _table_cell(analysis["full_name"])),
+        ("Profession", _table_cell(analysis["profession"])),
+        ("Education", _table_cell(analysis["education"])),
+        ("Key Strengths", _bullets(analysis["key_strengths"])),
+        ("Areas for Development", _bullets(analysis["areas_for_development"])),
+        ("Technical Skills", _table_cell(", ".join(analysis["skills"]))),
+        ("Relevant Experience", _bullets(analysis["relevant_experience"])),
+        ("Achievements", _bullets(analysis["achievements"])),
+        ("Certifications", _bullets(analysis["certifications"])),
+    ]
+    lines = ["| Category | Details |", "|---|---|"]
+    lines.extend(f"| {category} | {details or 'Not listed'} |" for category, details in rows)
+    return "\n".join(lines) + "\n"
+
+
+def generate_persona(resume_text):
+    """
+    Generate the markdown persona table (evaluation) for a resume.
+    """
+    analysis = analyze_resume(resume_text)
+    return render_persona_table(analysis) if analysis else "No response generated."
+
+
+COURSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "skill": {"type": "string"},
+        "name": {"type": "string"},
+        "url": {"type": "string"},
+    },
+    "required": ["skill", "name", "url"],
+}
+
+ROADMAP_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "missing_skills": {"type": "array", "items": {"type": "string"}},
+        "free_courses": {"type": "array", "items": COURSE_SCHEMA},
+        "paid_courses": {"type": "array", "items": COURSE_SCHEMA},
+        "steps": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "title": {"type": "string"},
+                    "duration_weeks": {"type": "integer"},
+                },
+                "required": ["title", "duration_weeks"],
+            },
+        },
+    },
+    "required": ["missing_skills", "free_courses", "paid_courses", "steps"],
+}
+
+
+def build_roadmap_prompt(resume_text, job_description):
+    return f"""
+        You are a career development expert. Analyze the candidate's resume against the job description to identify skill gaps.
+        
+        Resume:
+        {resume_text}
+        
+        Job Description:
+        {job_text(job_description)}
+        
+        Create a structured learning plan:
+        - missing_skills: the key skills the candidate needs to develop based on the job requirements (only the 5-7 most important).
+        - free_courses: for each missing skill, one free online course or resource with its name and URL.
+        - paid_courses: for each missing skill, one paid course that offers more comprehensive learning, with its name and URL.
+        - steps: a learning path of 5-7 steps, each with an estimated duration in weeks.
+        """
 
 
 def generate_roadmap_for_candidate(resume_text, job_description):
@@ -128,51 +206,103 @@ def generate_roadmap_for_candidate(resume_text, job_description):
         job_description (str): The job description or job role
         
     Returns:
-        str: A structured roadmap with missing skills and recommended courses
+        str: The roadmap as ROADMAP_SCHEMA JSON, ready to store, or None if generation failed
     """
     try:
-        # Define the prompt for roadmap generation
-        roadmap_prompt = f"""
-        You are a career development expert. Analyze the candidate's resume against the job description to identify skill gaps.
-        
-        Resume:
-        {resume_text}
-        
+        # Generate the roadmap using Gemini, constrained to the roadmap schema
+        response = generate_content(build_roadmap_prompt(resume_text, job_description), call_site="roadmap",
+                                    generation_config={
+                                        "response_mime_type": "application/json",
+                                        "response_schema": ROADMAP_SCHEMA,
+                                    })
+        # Round-trip through json so only valid JSON is ever stored
+        return json.dumps(json.loads(response.text), ensure_ascii=False)
+    except Exception as e:
+        print(f"Error generating roadmap: {e}")
+        return None
+
+
+def generate_gap_roadmap(missing_skills, job_description):
+    """
+    Generate the course and step plan for a skill gap that was computed locally
+    (see skills.skill_gap). The plan depends only on the gap and the job, so it
+    can be shared by every candidate with the same gap.
+
+    Returns:
+        str: The roadmap as ROADMAP_SCHEMA JSON, or None if generation failed
+    """
+    gap = ", ".join(missing_skills) if missing_skills else "none (the candidate covers the listed requirements)"
+    prompt = f"""
+        You are a career development expert. A candidate is preparing for the job below and is missing these skills: {gap}.
+
         Job Description:
-        {job_description}
-        
-        Create a structured learning plan with the following sections:
-        
-        1. Missing Skills
-        List the key skills that the candidate needs to develop based on the job requirements (list only 5-7 most important skills).
-        
-        2. Free Course Links
-        For each missing skill, recommend one free online course or resource. Include the course name and URL in markdown format: [Course Name](URL)
-        
-        3. Paid Course Links
-        For each missing skill, recommend one paid course that offers more comprehensive learning. Include the course name and URL in markdown format: [Course Name](URL)
-        
-        4. Step-by-Step Learning Roadmap
-        Create a structured learning path with 5-7 steps, each with an estimated time frame (in weeks/months).
-        
-        Format your response with clear section headers.
+        {job_text(job_description)}
+
+        Create a structured learning plan:
+        - free_courses: for each missing skill, one free online course or resource with its name and URL.
+        - paid_courses: for each missing skill, one paid course that offers more comprehensive learning, with its name and URL.
+        - steps: a learning path of 5-7 steps, each with an estimated duration in weeks. If no skills are missing, plan steps that deepen the job's core skills.
         """
-        
-        # Generate the roadmap using Gemini
-        model = genai.GenerativeModel('gemini-2.0-flash-lite')
-        response = model.generate_content(roadmap_prompt)
-        return response.text if response and response.text else "No roadmap generated."
+    try:
+        response = generate_content(prompt, call_site="roadmap", generation_config={
+            "response_mime_type": "application/json",
+            "response_schema": ROADMAP_SCHEMA,
+        })
+        roadmap = json.loads(response.text)
+        # The gap is known locally; do not let the model restate it
+        roadmap["missing_skills"] = list(missing_skills)
+        return json.dumps(roadmap, ensure_ascii=False)
     except Exception as e:
         print(f"Error generating roadmap: {e}")
-        return f"Error generating roadmap: {str(e)}"
+        return None
+
+
+def _structured_roadmap(roadmap):
+    """parse_roadmap result for a ROADMAP_SCHEMA dict."""
+    steps = [step for step in roadmap.get("steps") or [] if isinstance(step, dict)]
+    return {
+        "missing_skills": [str(skill) for skill in roadmap.get("missing_skills") or []],
+        "free_courses": [(course.get("name", ""), course.get("url", "")) for course in roadmap.get("free_courses") or []],
+        "paid_courses": [(course.get("name", ""), course.get("url", "")) for course in roadmap.get("paid_courses") or []],
+        "roadmap_steps": [
+            f"Step {i}: {step.get('title', '')} ({step.get('duration_weeks', '?')} weeks)"
+            for i, step in enumerate(steps, 1)
+        ],
+        "steps": steps,
+    }
+
+
+def roadmap_markdown(roadmap_text):
+    """Markdown rendering of a stored roadmap; legacy free-text roadmaps are returned as they are."""
+    if not roadmap_text or not roadmap_text.lstrip().startswith("{"):
+        return roadmap_text
+    parsed = parse_roadmap(roadmap_text)
+    lines = ["**Missing Skills**"] + [f"- {skill}" for skill in parsed["missing_skills"]]
+    lines += ["", "**Free Course Links**"] + [f"- [{name}]({url})" for name, url in parsed["free_courses"]]
+    lines += ["", "**Paid Course Links**"] + [f"- [{name}]({url})" for name, url in parsed["paid_courses"]]
+    lines += ["", "**Step-by-Step Learning Roadmap**"] + [f"- {step}" for step in parsed["roadmap_steps"]]
+    return "\n".join(lines)
+
 
-    
 def parse_roadmap(roadmap_text):
-    parsed_data = {"missing_skills": [], "free_courses": [], "paid_courses": [], "roadmap_steps": []}
+    """
+    Turn a stored roadmap into lists of missing skills, (name, url) courses and
+    step descriptions. Structured JSON roadmaps are read directly; the regex
+    scan is only used for free-text roadmaps stored before structured output.
+    """
+    parsed_data = {"missing_skills": [], "free_courses": [], "paid_courses": [], "roadmap_steps": [], "steps": []}
 
     if roadmap_text is None:
         return parsed_data
 
+    if roadmap_text.lstrip().startswith("{"):
+        try:
+            roadmap = json.loads(roadmap_text)
+        except json.JSONDecodeError:
+            roadmap = None
+        if isinstance(roadmap, dict):
+            return _structured_roadmap(roadmap)
+
     missing_skills_section = re.search(r"Missing Skills.*?(?=Free Course Links)", roadmap_text, re.DOTALL)
     if missing_skills_section:
         parsed_data["missing_skills"] = [skill.strip() for skill in missing_skills_section.group(0).split("\n") if skill.strip()]
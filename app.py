@@ -1,21 +1,66 @@
 import streamlit as st
+import db_profiler
+import tracing
 from login_ui import LoginUI
 from hr_ui import HRUI
 from candidate_ui import CandidateUI
 from database import initialize_db
 
-initialize_db()
+db_profiler.begin_rerun()
 
-if "logged_in" not in st.session_state:
-    st.session_state["logged_in"] = False
-    st.session_state["progress"] = {}
+with tracing.span("streamlit.rerun", root=True, role=st.session_state.get("user_role", "anonymous")):
+    # Creates or migrates the schema on the first rerun; the connection goes back to the pool
+    conn, _ = initialize_db()
+    conn.close()
 
-if not st.session_state["logged_in"]:
-    login_ui = LoginUI(st.session_state)
-    login_ui.render()
-elif st.session_state["user_role"] == "hr":
-    hr_ui = HRUI(st.session_state)
-    hr_ui.render()
-else:
-    candidate_ui = CandidateUI(st.session_state)
-    candidate_ui.render()
\ No newline at end of file
+    if "logged_in" not in st.session_state:
+        st.session_state["logged_in"] = False
+        st.session_state["progress"] = {}
+
+    if not st.session_state["logged_in"]:
+        with tracing.span("render.login"):
+            login_ui = LoginUI(st.session_state)
+            login_ui.render()
+    elif st.session_state["user_role"] == "hr":
+        with tracing.span("render.hr"):
+            hr_ui = HRUI(st.session_state)
+            hr_ui.render()
+    else:
+        with tracing.span("render.candidate", view=st.session_state.get("current_view", "")):
+            candidate_ui = CandidateUI(st.session_state)
+            candidate_ui.render()
+
+# Debug sidebar for HR users: per-rerun SQL summary and sampled traces
+if st.session_state.get("logged_in") and st.session_state.get("user_role") == "hr":
+    summary = db_profiler.rerun_summary()
+    with st.sidebar.expander("🛠️ Query Profile"):
+        st.write(f"{summary['statements']} statements on {summary['connections']} connections, "
+                 f"{summary['sql_ms']:.1f} ms in SQL of {summary['render_ms']:.0f} ms render")
+        for query in summary["top_queries"]:
+            st.caption(f"{query['count']}× {query['total_ms']:.1f} ms — {query['fingerprint'][:120]}")
+        slow_queries = list(db_profiler.PROFILER.slow_queries)
+        if slow_queries:
+            st.write(f"Slow queries (≥ {db_profiler.SLOW_QUERY_MS:.0f} ms):")
+            for entry in slow_queries[-5:]:
+                st.code(f"{entry['elapsed_ms']:.1f} ms  {entry['fingerprint']}\n" + "\n".join(entry["plan"]))
+
+    with st.sidebar.expander("🔥 Sampled Traces"):
+        traces = tracing.recent_traces()
+        if not traces:
+            st.caption(f"No sampled traces yet (sample rate {tracing.TRACE_SAMPLE_RATE:.0%}).")
+        else:
+            trace = traces[-1 - st.number_input("Trace (0 = latest)", 0, len(traces) - 1, 0)]
+            root = min(trace.spans, key=lambda s: s.start_ns)
+            total_ns = max(1, root.end_ns - root.start_ns)
+            st.caption(f"trace {trace.trace_id} — {root.duration_ms:.0f} ms")
+            bars = []
+            for s in sorted(trace.spans, key=lambda s: (s.start_ns, s.depth)):
+                left = (s.start_ns - root.start_ns) / total_ns * 100
+                width = max(0.5, (s.end_ns - s.start_ns) / total_ns * 100)
+                color = {"llm": "#e4572e", "db": "#29335c", "pdf": "#f3a712"}.get(s.name.split(".")[0], "#669bbc")
+                bars.append(
+                    f'<div title="{s.name} {s.duration_ms:.1f} ms" style="margin-left:{left:.1f}%;width:{width:.1f}%;'
+                    f'background:{color};color:white;font-size:10px;white-space:nowrap;overflow:hidden;margin-bottom:1px">'
+                    f'{s.name} {s.duration_ms:.1f} ms</div>'
+                )
+            st.markdown("".join(bars), unsafe_allow_html=True)
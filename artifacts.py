@@ -0,0 +1,195 @@
+"""
+Shared, size-bounded store for large per-session artifacts.
+
+Persona evaluations, match analyses and roadmaps shown on a page used to be
+kept in st.session_state for the whole session, so server memory grew with
+every session until it expired. They now live in one process-wide store
+and session_state keeps only their ids:
+
+    remember(session_state, "match_response", text)
+    text = recall(session_state, "match_response")
+
+The store keeps at most ARTIFACT_MEMORY_BYTES in memory. The least recently
+used artifacts beyond that are spilled to files under ARTIFACT_SPILL_DIR
+and read back on their next use. Beyond ARTIFACT_SPILL_BYTES on disk, the
+oldest spilled artifacts are dropped. Every artifact is also stored in the
+database, so a dropped one makes recall() return the default and the page
+reloads it. usage() reports bytes per session and in total.
+"""
+import atexit
+import json
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+
+ARTIFACT_MEMORY_BYTES = int(os.getenv("ARTIFACT_MEMORY_BYTES", str(64 * 1024 * 1024)))
+ARTIFACT_SPILL_BYTES = int(os.getenv("ARTIFACT_SPILL_BYTES", str(1024 * 1024 * 1024)))
+ARTIFACT_SPILL_DIR = os.getenv("ARTIFACT_SPILL_DIR", os.path.join(tempfile.gettempdir(), "smart-hiring-artifacts"))
+
+SESSION_KEY = "artifact_session"
+
+
+class ArtifactStore:
+    """
+    LRU store of JSON-serializable values, owned by sessions. Values are kept
+    encoded, so their size is known exactly and a spill is a plain write.
+    """
+
+    def __init__(self, max_bytes=ARTIFACT_MEMORY_BYTES, max_spill_bytes=ARTIFACT_SPILL_BYTES, spill_dir=ARTIFACT_SPILL_DIR):
+        self.max_bytes = max_bytes
+        self.max_spill_bytes = max_spill_bytes
+        # One directory per process, removed on exit
+        self.spill_dir = os.path.join(spill_dir, str(os.getpid()))
+        self._lock = threading.Lock()
+        # artifact_id -> (session, encoded value), least recently used first
+        self._memory = OrderedDict()
+        # artifact_id -> (session, size), oldest spill first
+        self._spilled = OrderedDict()
+        self._memory_bytes = 0
+        self._spill_bytes = 0
+        self.spills = 0
+        self.drops = 0
+
+    def _path(self, artifact_id):
+        return os.path.join(self.spill_dir, artifact_id)
+
+    def put(self, session, value):
+        """Store value for the session and return its artifact id."""
+        encoded = json.dumps(value, ensure_ascii=False).encode()
+        artifact_id = uuid.uuid4().hex
+        with self._lock:
+            self._memory[artifact_id] = (session, encoded)
+            self._memory_bytes += len(encoded)
+            self._evict()
+        return artifact_id
+
+    def get(self, artifact_id, default=None):
+        """The stored value, or default when the id is unknown or was dropped."""
+        with self._lock:
+            if artifact_id in self._memory:
+                self._memory.move_to_end(artifact_id)
+                encoded = self._memory[artifact_id][1]
+            elif artifact_id in self._spilled:
+                session, size = self._spilled.pop(artifact_id)
+                self._spill_bytes -= size
+                try:
+                    with open(self._path(artifact_id), "rb") as f:
+                        encoded = f.read()
+                    os.remove(self._path(artifact_id))
+                except OSError as e:
+                    print(f"Could not read spilled artifact {artifact_id}: {e}")
+                    return default
+                # Back in memory as the most recently used
+                self._memory[artifact_id] = (session, encoded)
+                self._memory_bytes += len(encoded)
+                self._evict()
+            else:
+                return default
+        return json.loads(encoded)
+
+    def discard(self, artifact_id):
+        with self._lock:
+            self._remove(artifact_id)
+
+    def discard_session(self, session):
+        """Drop every artifact the session owns."""
+        with self._lock:
+            owned = [artifact_id for artifact_id, (owner, _) in (*self._memory.items(), *self._spilled.items())
+                     if owner == session]
+            for artifact_id in owned:
+                self._remove(artifact_id)
+
+    def _remove(self, artifact_id):
+        if artifact_id in self._memory:
+            self._memory_bytes -= len(self._memory.pop(artifact_id)[1])
+        elif artifact_id in self._spilled:
+            self._spill_bytes -= self._spilled.pop(artifact_id)[1]
+            try:
+                os.remove(self._path(artifact_id))
+            except OSError:
+                pass
+
+    def _evict(self):
+        # Keep the artifact just stored or read in memory even if it alone is over the limit
+        while self._memory_bytes > self.max_bytes and len(self._memory) > 1:
+            artifact_id, (session, encoded) = self._memory.popitem(last=False)
+            self._memory_bytes -= len(encoded)
+            try:
+                os.makedirs(self.spill_dir, exist_ok=True)
+                with open(self._path(artifact_id), "wb") as f:
+                    f.write(encoded)
+            except OSError as e:
+                print(f"Could not spill artifact {artifact_id}: {e}")
+                self.drops += 1
+                continue
+            self._spilled[artifact_id] = (session, len(encoded))
+            self._spill_bytes += len(encoded)
+            self.spills += 1
+        while self._spill_bytes > self.max_spill_bytes and self._spilled:
+            self._remove(next(iter(self._spilled)))
+            self.drops += 1
+
+    def usage(self):
+        """Bytes and artifact counts in memory and on disk, in total and per session."""
+        with self._lock:
+            sessions = {}
+            for session, encoded in self._memory.values():
+                stats = sessions.setdefault(session, {"artifacts": 0, "memory_bytes": 0, "disk_bytes": 0})
+                stats["artifacts"] += 1
+                stats["memory_bytes"] += len(encoded)
+            for session, size in self._spilled.values():
+                stats = sessions.setdefault(session, {"artifacts": 0, "memory_bytes": 0, "disk_bytes": 0})
+                stats["artifacts"] += 1
+                stats["disk_bytes"] += size
+            return {
+                "artifacts": len(self._memory) + len(self._spilled),
+                "memory_bytes": self._memory_bytes,
+                "disk_bytes": self._spill_bytes,
+                "max_memory_bytes": self.max_bytes,
+                "max_disk_bytes": self.max_spill_bytes,
+                "spills": self.spills,
+                "drops": self.drops,
+                "sessions": sessions,
+            }
+
+    def close(self):
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+
+ARTIFACTS = ArtifactStore()
+atexit.register(ARTIFACTS.close)
+
+
+def session_id(session_state):
+    """The id the session's artifacts are stored under, created on first use."""
+    if SESSION_KEY not in session_state:
+        session_state[SESSION_KEY] = uuid.uuid4().hex
+    return session_state[SESSION_KEY]
+
+
+def remember(session_state, name, value):
+    """Store value in the shared store and keep only its id in session_state[name]."""
+    forget(session_state, name)
+    session_state[name] = None if value is None else ARTIFACTS.put(session_id(session_state), value)
+
+
+def recall(session_state, name, default=None):
+    """The value remember() stored under name, or default."""
+    artifact_id = session_state.get(name)
+    return default if artifact_id is None else ARTIFACTS.get(artifact_id, default)
+
+
+def forget(session_state, name):
+    """Drop the artifact stored under name, if any."""
+    artifact_id = session_state.pop(name, None)
+    if artifact_id is not None:
+        ARTIFACTS.discard(artifact_id)
+
+
+def forget_session(session_state):
+    """Drop every artifact of the session, e.g. on logout."""
+    if SESSION_KEY in session_state:
+        ARTIFACTS.discard_session(session_state[SESSION_KEY])
@@ -0,0 +1,47 @@
+"""
+Streaming batch processing for candidate-wide operations.
+
+Analyze All, scoring every candidate against a new job and scoring pending
+candidates read their rows a chunk at a time with keyset pagination
+(`WHERE key > last ORDER BY key LIMIT n`), run the chunk's LLM calls
+concurrently on the fan-out pool of the current priority class, and persist
+the chunk's results before the next chunk is read. Memory then depends on
+BATCH_CHUNK_SIZE rather than on the number of candidates, no connection is
+held while the LLM works, and an interrupted run keeps the chunks it finished.
+"""
+import os
+from functools import partial
+
+from llm_client import fan_out
+
+BATCH_CHUNK_SIZE = int(os.getenv("BATCH_CHUNK_SIZE", "50"))
+
+
+def keyset_chunks(fetch_page, chunk_size=BATCH_CHUNK_SIZE, start=0):
+    """
+    Yield lists of rows from fetch_page(after, limit), which returns up to
+    `limit` rows whose first column is an increasing key greater than `after`.
+    Stops after the first short page.
+    """
+    after = start
+    while True:
+        rows = fetch_page(after, chunk_size)
+        if rows:
+            yield rows
+        if len(rows) < chunk_size:
+            return
+        after = rows[-1][0]
+
+
+def process_chunks(chunks, work, persist=None):
+    """
+    Run work(row) concurrently for every row of each chunk, keyed by the row's
+    first column, then call persist(results) before reading the next chunk.
+    Yields (chunk, results, errors) per chunk, as fan_out returns them. Work
+    runs on the LLM fan-out pool, so it must not call Streamlit or fan out.
+    """
+    for chunk in chunks:
+        results, errors = fan_out({row[0]: partial(work, row) for row in chunk})
+        if persist is not None and results:
+            persist(results)
+        yield chunk, results, errors
@@ -0,0 +1,712 @@
+"""
+End-to-end benchmark for the core hiring flows.
+
+Seeds a synthetic database (candidates, jobs and PDF resumes, see
+data_generator.py) in a scratch directory, replaces the Gemini client with a simulated model that sleeps for a
+configurable latency, and times each flow. Results are printed as a table and
+written as JSON so runs can be compared over time.
+
+Usage:
+    python benchmark.py --candidates 200 --jobs 10 --llm-latency-ms 20
+    python benchmark.py --database-url postgresql://bench@localhost/bench_scratch --compare benchmark_results.json
+"""
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import random
+import resource
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from functools import partial
+
+import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+
+
+class SimulatedResponse:
+    def __init__(self, text, prompt):
+        self.text = text
+        self.usage_metadata = SimulatedUsage(len(prompt) // 4, len(text) // 4)
+
+
+class SimulatedUsage:
+    def __init__(self, prompt_token_count, candidates_token_count):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+        self.total_token_count = prompt_token_count + candidates_token_count
+
+
+class SimulatedStream:
+    def __init__(self, text, prompt, delay, chunks=8):
+        self.text = text
+        self.prompt = prompt
+        self.delay = delay
+        self.chunks = chunks
+        self.usage_metadata = None
+
+    def __iter__(self):
+        size = max(1, len(self.text) // self.chunks)
+        pieces = [self.text[i:i + size] for i in range(0, len(self.text), size)] or [""]
+        time.sleep(self.delay * 0.2)
+        for index, piece in enumerate(pieces):
+            if index:
+                time.sleep(self.delay * 0.8 / max(1, len(pieces) - 1))
+            yield SimulatedResponse(piece, "")
+        self.usage_metadata = SimulatedUsage(len(self.prompt) // 4, len(self.text) // 4)
+
+
+class SimulatedLLM:
+    """
+    Stand-in for genai.GenerativeModel. Answers each prompt with canned text
+    of the right shape after sleeping for latency_ms plus up to jitter_ms, plus
+    ms_per_1k_prompt_tokens for every thousand prompt tokens. A tail_rate share
+    of calls take tail_ms longer, and while failing is set every call raises
+    ServiceUnavailable.
+    """
+
+    def __init__(self, latency_ms, jitter_ms, seed, ms_per_1k_prompt_tokens=0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.ms_per_1k_prompt_tokens = ms_per_1k_prompt_tokens
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.tail_rate = 0.0
+        self.tail_ms = 0.0
+        self.failing = False
+
+    def model_factory(self):
+        llm = self
+
+        class GenerativeModel:
+            def __init__(self, model_name, *args, **kwargs):
+                self.model_name = model_name
+
+            def generate_content(self, prompt, *args, stream=False, **kwargs):
+                if stream:
+                    return llm.stream(prompt)
+                return llm.generate(prompt)
+
+        return GenerativeModel
+
+    def _next_call(self, prompt):
+        with self.lock:
+            self.calls += 1
+            delay = self.latency_ms + self.random.random() * self.jitter_ms
+            delay += len(prompt) / 4 / 1000.0 * self.ms_per_1k_prompt_tokens
+            if self.random.random() < self.tail_rate:
+                delay += self.tail_ms
+            noise = self.random.gauss(0, 5)
+        return delay / 1000.0, noise
+
+    def generate(self, prompt):
+        delay, noise = self._next_call(prompt)
+        if self.failing:
+            raise google_exceptions.ServiceUnavailable("simulated outage")
+        time.sleep(delay)
+        return SimulatedResponse(self.answer(prompt, noise), prompt)
+
+    @staticmethod
+    def similarity(prompt, noise):
+        """Skill overlap between the prompt's resume and job sections, so rankings are meaningful."""
+        from skills import extract_skills
+
+        resume, _, job = prompt.partition("Job Description:")
+        job_skills = extract_skills(job)
+        overlap = len(extract_skills(resume) & job_skills) / max(1, len(job_skills))
+        return round(min(100.0, max(0.0, 25 + 70 * overlap + noise)), 2)
+
+    def stream(self, prompt):
+        """First chunk after a fifth of the latency, the rest spread over later chunks."""
+        delay, noise = self._next_call(prompt)
+        if self.failing:
+            raise google_exceptions.ServiceUnavailable("simulated outage")
+        return SimulatedStream(self.answer(prompt, noise), prompt, delay)
+
+    def answer(self, prompt, noise):
+        if "similarity score" in prompt:
+            return str(self.similarity(prompt, noise))
+        if "resume analysis" in prompt:
+            return json.dumps(SAMPLE_ANALYSIS)
+        if "analyze resumes against job descriptions" in prompt:
+            return SAMPLE_MATCH
+        if "learning plan" in prompt:
+            return SAMPLE_ROADMAP
+        return "Summary: Python, SQL and cloud experience required."
+
+
+SAMPLE_ANALYSIS = {
+    "full_name": "Sim Candidate",
+    "email": "sim.candidate@example.com",
+    "phone_number": "555-0100",
+    "education": "B.Sc. Computer Science",
+    "skills": ["Python", "SQL", "Docker"],
+    "experience": "Software Engineer, 3 years",
+    "profession": "Software Engineer",
+    "key_strengths": ["Backend services", "Data modelling"],
+    "areas_for_development": ["Cloud certifications"],
+    "relevant_experience": ["Built payment APIs"],
+    "achievements": ["Hackathon winner"],
+    "certifications": [],
+}
+
+SAMPLE_PERSONA = """| Category | Details |
+|---|---|
+| Name | Sim Candidate |
+| Profession | Software Engineer |
+| Education | B.Sc. Computer Science |
+| Key Strengths | * Backend services <br> * Data modelling |
+| Areas for Development | * Cloud certifications |
+| Technical Skills | Python, SQL, Docker |
+| Relevant Experience | * Built payment APIs |
+| Achievements | * Hackathon winner |
+| Certifications | * None listed |
+"""
+
+SAMPLE_MATCH = """| Category | Job Description Highlights | Resume Alignment | Assessment |
+|---|---|---|---|
+| ✔️ Core Skills | Python, SQL | Strong Python and SQL | Strong |
+| ✔️ Education | CS degree | B.Sc. Computer Science | Strong |
+| ⚠️ Industry Experience | 5 years backend | 3 years backend | Moderate |
+| ✔️ Projects | API design | Payment APIs | Good |
+"""
+
+SAMPLE_ROADMAP = json.dumps({
+    "missing_skills": ["Kubernetes", "Terraform"],
+    "free_courses": [
+        {"skill": "Kubernetes", "name": "Kubernetes Basics", "url": "https://kubernetes.io/docs/tutorials/"},
+        {"skill": "Terraform", "name": "Terraform Tutorials", "url": "https://developer.hashicorp.com/terraform/tutorials"},
+    ],
+    "paid_courses": [
+        {"skill": "Kubernetes", "name": "CKA Course", "url": "https://www.udemy.com/course/cka/"},
+        {"skill": "Terraform", "name": "Terraform Associate", "url": "https://www.udemy.com/course/terraform/"},
+    ],
+    "steps": [
+        {"title": "Container fundamentals", "duration_weeks": 2},
+        {"title": "Kubernetes workloads", "duration_weeks": 4},
+        {"title": "Infrastructure as code", "duration_weeks": 3},
+    ],
+})
+
+
+SEARCH_QUERIES = ["Kubernetes AND Go", "Python", '"data pipeline"', "C# OR Java", "Terra*"]
+SKILL_FILTERS = [("Python", "SQL"), ("Kubernetes", "Go", "Terraform"), ("k8s", "Docker"), ("React", "TypeScript", "GraphQL")]
+
+
+class SQLCounter:
+    """
+    Counts connections and statements by wrapping sqlite3.connect. PostgreSQL
+    runs read the query profiler instead, which counts an executemany once.
+    """
+
+    def __init__(self, dialect="sqlite"):
+        self.lock = threading.Lock()
+        self.dialect = dialect
+        self._connections = 0
+        self._statements = 0
+        self._connect = sqlite3.connect
+
+    @property
+    def connections(self):
+        if self.dialect == "sqlite":
+            return self._connections
+        import db_profiler
+        return db_profiler.PROFILER.connections
+
+    @property
+    def statements(self):
+        if self.dialect == "sqlite":
+            return self._statements
+        import db_profiler
+        with db_profiler.PROFILER._lock:
+            return sum(stats.count for stats in db_profiler.PROFILER.queries.values())
+
+    def install(self):
+        counter = self
+
+        def connect(*args, **kwargs):
+            conn = counter._connect(*args, **kwargs)
+            with counter.lock:
+                counter._connections += 1
+            conn.set_trace_callback(counter._on_statement)
+            return conn
+
+        sqlite3.connect = connect
+
+    def _on_statement(self, statement):
+        with self.lock:
+            self._statements += 1
+
+
+def percentile(samples, pct):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = max(0, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+def time_flow(name, iterations, run, llm, sql):
+    """Run a flow `iterations` times and summarise latency and resource use."""
+    samples = []
+    llm_before, stmts_before, conns_before = llm.calls, sql.statements, sql.connections
+    for i in range(iterations):
+        start = time.perf_counter()
+        run(i)
+        samples.append((time.perf_counter() - start) * 1000.0)
+    return {
+        "flow": name,
+        "iterations": iterations,
+        "p50_ms": percentile(samples, 50),
+        "p95_ms": percentile(samples, 95),
+        "mean_ms": sum(samples) / len(samples),
+        "llm_calls": llm.calls - llm_before,
+        "llm_calls_per_iteration": (llm.calls - llm_before) / iterations,
+        "sql_statements": sql.statements - stmts_before,
+        "sql_statements_per_iteration": (sql.statements - stmts_before) / iterations,
+        "connections": sql.connections - conns_before,
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def run_benchmarks(args):
+    import database
+    import prompt_builder
+    import ranking
+    import score_matrix
+    import storage
+    from data_generator import generate_dataset, make_resume, write_pdf
+    from candidate_ui import CandidateUI
+    from hr_ui import HRUI
+
+    # Installed first: pooled connections opened while seeding are reused by the flows
+    sql = SQLCounter(storage.dialect())
+    sql.install()
+
+    rng = random.Random(args.seed)
+    dataset = generate_dataset(args.candidates, args.jobs, args.scores_per_candidate, args.seed,
+                               general_evaluation=SAMPLE_PERSONA)
+    candidate_ids = dataset["candidate_ids"]
+    job_roles = dataset["job_roles"]
+    job_descriptions = dataset["job_descriptions"]
+
+    prompt_builder.PROMPT_MODE = args.prompt_mode
+    llm = SimulatedLLM(args.llm_latency_ms, args.llm_jitter_ms, args.seed, args.ms_per_1k_prompt_tokens)
+    genai.GenerativeModel = llm.model_factory()
+
+    def register(i):
+        resume = make_resume(rng, args.candidates + i)
+        resume_path = f"resumes/new{i}.pdf"
+        write_pdf(resume_path, resume["lines"])
+        database.register_user(
+            f"new{i}", "password", "candidate", resume["full_name"], resume["email"],
+            resume["phone_number"], resume["education"], resume["skills"], resume["experience"],
+            resume_path, None,
+        )
+
+    def post_job(i):
+        database.post_job_opening(
+            f"Bench Role {i}", f"Bench Role {i}. Required skills: Python, SQL, Docker.",
+            "Full-time", None, 1,
+        )
+
+    def post_job_double_submit(i):
+        # Two submissions of the same form (double click / rerun) run the heavy work once
+        from idempotency import run_once
+        job = (f"Bench Role D{i}", f"Bench Role D{i}. Required skills: Go, Kubernetes.", "Full-time", None, 1)
+        submit_form = lambda: run_once(1, "post_job", list(job), lambda: database.post_job_opening(*job))
+        threads = [threading.Thread(target=submit_form) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def search(i):
+        database.search_candidates(SEARCH_QUERIES[i % len(SEARCH_QUERIES)], page=1 + i % 3)
+
+    def skill_filter(i):
+        index = ranking.SKILL_INDEX.get()
+        for user_id in index.candidates_with_all(SKILL_FILTERS[i % len(SKILL_FILTERS)], limit=50):
+            index.coverage(user_id, SKILL_FILTERS[(i + 1) % len(SKILL_FILTERS)])
+
+    def rank(i):
+        ranking.rank_candidates(job_descriptions[i % len(job_descriptions)], k=args.rerank_k)
+
+    def update_profile(i):
+        # Even iterations upload a new resume (rescored in the background), odd ones re-upload it unchanged
+        user_id = candidate_ids[(i // 2) % len(candidate_ids)]
+        resume_path = f"resumes/update{i // 2}.pdf"
+        if i % 2 == 0:
+            write_pdf(resume_path, make_resume(rng, args.candidates + args.iterations + i)["lines"])
+        CandidateUI({"user_id": user_id}).update_profile_in_db(resume_path)
+
+    def summary_burst(i):
+        # Concurrent sessions opening the same job at once
+        from utils import summarize_job_description
+        threads = [threading.Thread(target=summarize_job_description, args=(job_descriptions[i % len(job_descriptions)],))
+                   for _ in range(args.burst_sessions)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def concurrent_sessions(i):
+        # Page renders from many sessions at once, sharing the connection pool
+        def session(j):
+            candidate_id = candidate_ids[(i * args.burst_sessions + j) % len(candidate_ids)]
+            job_role = job_roles[j % len(job_roles)]
+            database.login_user(f"synthetic_{candidate_id}", "password")
+            database.get_candidate_profile(candidate_id)
+            database.count_unread_roadmaps(candidate_id)
+            database.get_open_jobs(candidate_id, limit=10)
+            database.get_applied_jobs(candidate_id)
+            database.has_applied(candidate_id, job_role)
+            database.get_applicant_scores(job_role)
+            database.get_score_statuses(job_role)
+            database.store_idempotent_result(f"bench-{i}-{j}", "bench", "{}")
+
+        threads = [threading.Thread(target=session, args=(j,)) for j in range(args.burst_sessions)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def recommend(i):
+        CandidateUI({"user_id": candidate_ids[i % len(candidate_ids)]}).get_recommended_jobs()
+
+    def scan(i):
+        ranked = score_matrix.SCORE_MATRIX.top_k(job_roles[i % len(job_roles)], k=len(candidate_ids))
+        database.get_candidate_names(user_id for user_id, score in ranked if score >= 30)
+
+    def session_artifacts(i):
+        # HR sessions opening an analysis: session_state keeps ids, the shared store keeps the text
+        import artifacts
+        for j in range(args.burst_sessions):
+            session_state = {}
+            artifacts.remember(session_state, "evaluation", SAMPLE_PERSONA)
+            artifacts.remember(session_state, "match_response", SAMPLE_PERSONA)
+            artifacts.recall(session_state, "evaluation")
+            artifacts.recall(session_state, "match_response")
+
+    def score_overview(i):
+        score_matrix.SCORE_MATRIX.role_summary(threshold=70)
+        score_matrix.SCORE_MATRIX.top_k_per_role(k=1)
+        score_matrix.SCORE_MATRIX.histograms()
+        score_matrix.SCORE_MATRIX.best_fits(candidate_ids[i % len(candidate_ids)])
+
+    def apply(i):
+        CandidateUI({"user_id": candidate_ids[i % len(candidate_ids)]}).apply_for_job(job_roles[i % len(job_roles)])
+
+    def analyze_all(i):
+        HRUI({"user_id": 1}).analyze_all(
+            database.get_roadmap_candidate_chunks(snapshot=True), job_descriptions[i % len(job_descriptions)],
+            job_roles[i % len(job_roles)], f"bench-{i}", database.count_roadmap_candidates(snapshot=True),
+        )
+
+    @contextlib.contextmanager
+    def batch_load():
+        """Keep batch-class scoring work queued for the duration of a flow."""
+        import llm_client
+        from utils import calculate_similarity_score
+
+        stop = threading.Event()
+
+        def run_batch():
+            with llm_client.llm_priority(llm_client.BATCH):
+                round_number = 0
+                while not stop.is_set():
+                    round_number += 1
+                    llm_client.fan_out({
+                        j: partial(calculate_similarity_score, f"Batch resume {round_number}-{j}", job_descriptions[j % len(job_descriptions)])
+                        for j in range(64)
+                    })
+
+        thread = threading.Thread(target=run_batch)
+        thread.start()
+        time.sleep(2 * args.llm_latency_ms / 1000.0)
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def interactive_under_batch(i):
+        # A candidate waiting on a handful of scores while batch work saturates the LLM
+        import llm_client
+        from utils import calculate_similarity_score_simple
+        llm_client.fan_out({
+            j: partial(calculate_similarity_score_simple, f"Interactive resume {i}-{j}", job_descriptions[j % len(job_descriptions)])
+            for j in range(4)
+        })
+
+    @contextlib.contextmanager
+    def heavy_reports(snapshot):
+        """Keep HR report scans running against the snapshot or the live database for the duration of a flow."""
+        stop = threading.Event()
+
+        def run_reports():
+            while not stop.is_set():
+                for _ in database.get_roadmap_candidate_chunks(snapshot=snapshot):
+                    pass
+                for job_role in job_roles:
+                    database.get_applicant_scores(job_role, snapshot=snapshot)
+
+        threads = [threading.Thread(target=run_reports) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+    def candidate_write(i):
+        # The small writes a candidate session makes while HR reports run
+        candidate_id = candidate_ids[i % len(candidate_ids)]
+        database.update_resume_path(candidate_id, f"resumes/{candidate_id}.pdf", f"bench-{i}")
+        database.store_idempotent_result(f"write-{i}-{time.perf_counter_ns()}", "bench", "{}")
+
+    @contextlib.contextmanager
+    def outage():
+        """Every LLM call fails for the duration of a flow; the breaker is reset afterwards."""
+        import llm_client
+        llm.failing = True
+        try:
+            yield
+        finally:
+            llm.failing = False
+            llm_client.BREAKER.reset()
+
+    @contextlib.contextmanager
+    def slow_tail(hedge):
+        """5% of LLM calls take 20x the usual latency; with hedge, slow calls get a second request."""
+        import llm_client
+        llm.tail_rate, llm.tail_ms = 0.05, 20 * args.llm_latency_ms
+        hedge_after = llm_client.HEDGE_AFTER_SECONDS
+        if hedge:
+            llm_client.HEDGE_AFTER_SECONDS = 3 * (args.llm_latency_ms + args.llm_jitter_ms) / 1000.0
+        try:
+            yield
+        finally:
+            llm.tail_rate, llm.tail_ms = 0.0, 0.0
+            llm_client.HEDGE_AFTER_SECONDS = hedge_after
+
+    def score_batch(label, i):
+        # Sixteen scores one screen waits on, with prompts not seen before
+        import llm_client
+        from utils import calculate_similarity_score
+        llm_client.fan_out({
+            j: partial(calculate_similarity_score, f"{label} resume {i}-{j}", job_descriptions[j % len(job_descriptions)])
+            for j in range(16)
+        })
+
+    service = {}
+
+    @contextlib.contextmanager
+    def service_server():
+        """Run the HTTP service in this process for a flow, with one keep-alive client connection."""
+        import http.client
+        import service as service_module
+        server = service_module.ServiceServer(("127.0.0.1", 0), service_module.ServiceHandler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        service["connection"] = http.client.HTTPConnection("127.0.0.1", server.server_port)
+        try:
+            yield
+        finally:
+            service.pop("connection").close()
+            server.shutdown()
+            server.server_close()
+            thread.join()
+
+    def service_batch_score(i):
+        # An ATS scoring 20 candidates against a role over one reused connection
+        body = json.dumps({
+            "job_role": job_roles[i % len(job_roles)],
+            "candidate_ids": [candidate_ids[(i * 20 + j) % len(candidate_ids)] for j in range(20)],
+        })
+        connection = service["connection"]
+        connection.request("POST", "/batch-score", body, {"Content-Type": "application/json"})
+        response = connection.getresponse()
+        if response.status != 200:
+            raise RuntimeError(f"batch-score returned {response.status}: {response.read()}")
+        response.read()
+
+    flows = [
+        ("register_user", args.iterations, register),
+        ("post_job_opening", args.batch_iterations, post_job),
+        ("post_job_double_submit", args.batch_iterations, post_job_double_submit),
+        ("update_profile", args.iterations, update_profile),
+        ("get_recommended_jobs", args.iterations, recommend),
+        ("summary_burst", args.iterations, summary_burst),
+        ("scan_candidates", args.iterations, scan),
+        ("score_overview", args.iterations, score_overview),
+        ("session_artifacts", args.iterations, session_artifacts),
+        ("rank_candidates", args.iterations, rank),
+        ("search_candidates", args.iterations, search),
+        ("skill_filter", args.iterations, skill_filter),
+        ("apply_for_job", args.iterations, apply),
+        ("concurrent_sessions", args.iterations, concurrent_sessions),
+        ("analyze_all_roadmaps", args.batch_iterations, analyze_all),
+        ("interactive_under_batch", args.iterations, interactive_under_batch, batch_load),
+        ("writes_during_live_reports", args.iterations, candidate_write, partial(heavy_reports, False)),
+        ("writes_during_snapshot_reports", args.iterations, candidate_write, partial(heavy_reports, True)),
+        ("service_batch_score", args.iterations, service_batch_score, service_server),
+        ("scoring_during_outage", args.iterations, partial(score_batch, "Outage"), outage),
+        ("scoring_slow_tail", args.iterations, partial(score_batch, "Tail"), partial(slow_tail, False)),
+        ("scoring_slow_tail_hedged", args.iterations, partial(score_batch, "Hedged"), partial(slow_tail, True)),
+    ]
+    results = []
+    for name, iterations, run, *background in flows:
+        if args.flows and name not in args.flows:
+            continue
+        with background[0]() if background else contextlib.nullcontext():
+            results.append(time_flow(name, iterations, run, llm, sql))
+        print_result(results[-1])
+    return results, ranking_recall(job_descriptions[:args.recall_jobs])
+
+
+def ranking_recall(job_descriptions, relevant=10):
+    """
+    Score every candidate against each job with the LLM scorer and report how
+    many of the `relevant` best ones the local stage-one ranking puts in its top k.
+    """
+    from functools import partial
+
+    import ranking
+    from llm_client import fan_out
+    from prompt_builder import candidate_text
+    from utils import calculate_similarity_score
+
+    if not job_descriptions:
+        return {}
+    index, profiles = ranking.CANDIDATE_INDEX.get()
+    report = {}
+    for job_description in job_descriptions:
+        exhaustive, _ = fan_out({
+            user_id: partial(calculate_similarity_score, candidate_text(row[6], row[3], row[4], row[5]), job_description)
+            for user_id, row in profiles.items()
+        })
+        ranked_ids = [user_id for user_id, _ in index.search(job_description)]
+        for k, recall in ranking.recall_report(ranked_ids, exhaustive, relevant=relevant).items():
+            report.setdefault(k, []).append(recall)
+    report = {k: sum(values) / len(values) for k, values in report.items()}
+    print("ranking recall of top-%d by exhaustive scoring: %s" % (
+        relevant, "  ".join(f"@{k}={recall:.2f}" for k, recall in report.items())))
+    return report
+
+
+def print_result(result):
+    print(
+        f"{result['flow']:<22} p50={result['p50_ms']:9.1f}ms p95={result['p95_ms']:9.1f}ms "
+        f"llm/it={result['llm_calls_per_iteration']:7.1f} sql/it={result['sql_statements_per_iteration']:8.1f} "
+        f"conns={result['connections']:5d} rss={result['peak_rss_kb']}KB"
+    )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the core hiring flows against a simulated LLM.")
+    parser.add_argument("--candidates", type=int, default=200, help="Number of seeded candidates")
+    parser.add_argument("--jobs", type=int, default=10, help="Number of seeded job postings")
+    parser.add_argument("--scores-per-candidate", type=int, default=10, help="Seeded score rows per candidate")
+    parser.add_argument("--llm-latency-ms", type=float, default=20.0, help="Simulated LLM latency per call")
+    parser.add_argument("--llm-jitter-ms", type=float, default=10.0, help="Random extra latency per call")
+    parser.add_argument("--ms-per-1k-prompt-tokens", type=float, default=0.0,
+                        help="Simulated extra latency per thousand prompt tokens")
+    parser.add_argument("--prompt-mode", choices=("compact", "full"), default="compact",
+                        help="Candidate/job representation used in prompts (see prompt_builder.py)")
+    parser.add_argument("--compare", help="Earlier results JSON to compare this run against")
+    parser.add_argument("--rerank-k", type=int, default=20, help="Shortlist size for rank_candidates")
+    parser.add_argument("--burst-sessions", type=int, default=8,
+                        help="Concurrent sessions in summary_burst and concurrent_sessions")
+    parser.add_argument("--recall-jobs", type=int, default=3,
+                        help="Seeded jobs to score exhaustively for the ranking recall report (0 to skip)")
+    parser.add_argument("--iterations", type=int, default=10, help="Iterations for interactive flows")
+    parser.add_argument("--batch-iterations", type=int, default=2, help="Iterations for batch flows")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--flows", nargs="*", help="Only run the named flows")
+    parser.add_argument("--workdir",
+                        help="Directory to create each run's scratch directory in (default: the system temp dir); "
+                             "every run starts from a fresh database")
+    parser.add_argument("--database-url",
+                        help="Run against this database instead of users.db in the workdir, e.g. an empty "
+                             "postgresql:// database (see storage.py)")
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write JSON results")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    output = os.path.abspath(args.output)
+    if args.workdir:
+        os.makedirs(args.workdir, exist_ok=True)
+    # A reused database would serve idempotency, plan cache and score hits from earlier runs
+    workdir = tempfile.mkdtemp(prefix="smart_hiring_bench_", dir=args.workdir)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(workdir)
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+
+    results, recall = run_benchmarks(args)
+    from llm_client import METRICS as LLM_METRICS
+    from artifacts import ARTIFACTS
+    import storage
+
+    report = {
+        "timestamp": datetime.datetime.now().isoformat(),
+        "python": platform.python_version(),
+        # The database URL may hold a password
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "database_url")},
+        "workdir": workdir,
+        "database": storage.get_backend().pool_stats(),
+        "artifacts": {key: value for key, value in ARTIFACTS.usage().items() if key != "sessions"},
+        "flows": results,
+        "ranking_recall": recall,
+        "llm_call_sites": {
+            call_site: {key: value for key, value in stats.items() if key != "buckets"}
+            for call_site, stats in LLM_METRICS.snapshot().items()
+        },
+    }
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(json.load(f), report)
+
+
+def _change(before, after):
+    if not before or before is None or after is None:
+        return "     n/a"
+    return f"{(after - before) / before * 100.0:+7.1f}%"
+
+
+def print_comparison(baseline, report):
+    """Per-flow p50 and per-call-site prompt token / latency change against a baseline report."""
+    print(f"\nCompared with {baseline['config'].get('prompt_mode', 'full')} run of {baseline['timestamp']}:")
+    flows = {result["flow"]: result for result in baseline["flows"]}
+    for result in report["flows"]:
+        before = flows.get(result["flow"])
+        if before:
+            print(f"{result['flow']:<22} p50 {before['p50_ms']:9.1f}ms -> {result['p50_ms']:9.1f}ms "
+                  f"{_change(before['p50_ms'], result['p50_ms'])}")
+    sites = baseline.get("llm_call_sites", {})
+    for call_site, stats in report["llm_call_sites"].items():
+        before = sites.get(call_site)
+        if not before or not before["calls"] or not stats["calls"]:
+            continue
+        tokens_before = before["prompt_tokens"] / before["calls"]
+        tokens_after = stats["prompt_tokens"] / stats["calls"]
+        print(f"{call_site:<22} prompt tokens/call {tokens_before:8.0f} -> {tokens_after:8.0f} "
+              f"{_change(tokens_before, tokens_after)}  p50 {_change(before['p50'], stats['p50'])}")
+
+
+if __name__ == "__main__":
+    main()
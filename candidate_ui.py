@@ -1,13 +1,26 @@
 import streamlit as st
+import io
 import os
-from database import initialize_db, get_candidate_profile, get_candidate_roadmaps, mark_roadmap_as_read, is_employee
+import tracing
+from database import (get_candidate_profile, get_candidate_roadmaps, mark_roadmap_as_read, is_employee, content_hash, text_hash, enqueue_rescore,
+                      count_unread_roadmaps, get_applied_jobs, get_resume_state, update_resume_path, update_candidate_resume,
+                      get_persona, has_applied, get_open_jobs, start_application, save_application, get_job_description)
 from pdf_processor import input_pdf_text
-from ai_response import generate_roadmap_for_candidate, get_gemini_response, parse_roadmap
-from utils import calculate_similarity_score_simple
+from ai_response import analyze_resume, profile_fields, render_persona_table, generate_roadmap_for_candidate, parse_roadmap, roadmap_markdown, stream_gemini_response
 from utils import calculate_similarity_score
-import datetime
 import pandas as pd
-from utils import summarize_job_description
+from utils import summarize_job_description, is_degraded
+from google.api_core import exceptions as google_exceptions
+from llm_client import submit, CircuitOpenError, FAN_OUT_DEADLINE_SECONDS
+from prompt_builder import candidate_text, job_text, normalize
+from ranking import recommend_jobs, invalidate_candidate_index
+from idempotency import run_once
+from artifacts import forget, forget_session
+
+# Outcomes of a profile update (all truthy; False means it failed)
+PROFILE_UNCHANGED = "unchanged"
+PROFILE_UPDATED = "updated"
+PROFILE_RESCORING = "rescoring"
 
 
 class CandidateUI:
@@ -40,11 +53,7 @@ class CandidateUI:
         is_emp = is_employee(self.session_state["user_id"])
         
         # Get unread roadmap count
-        conn, cursor = initialize_db()
-        cursor.execute("SELECT COUNT(*) FROM roadmap_notifications WHERE candidate_id = ? AND is_read = 0", 
-                      (self.session_state["user_id"],))
-        unread_count = cursor.fetchone()[0]
-        conn.close()
+        unread_count = count_unread_roadmaps(self.session_state["user_id"])
         
         # Display status badge
         if is_emp:
@@ -70,6 +79,7 @@ class CandidateUI:
             self.session_state["current_view"] = "Training Roadmaps"
             
         if st.sidebar.button("Logout"):
+            forget_session(self.session_state)
             self.session_state["logged_in"] = False
             self.session_state["username"] = None
             st.rerun()
@@ -182,9 +192,14 @@ class CandidateUI:
                 # Update the profile in the database
                 success = self.update_profile_in_db(temp_resume_path)
 
-                if success:
+                if success == PROFILE_UNCHANGED:
+                    st.info("This resume has the same content as your current one, so your profile is unchanged.")
+                elif success:
                     st.success("✅ Profile updated successfully!")
-                    st.info("Your new persona and similarity scores have been updated.")
+                    if success == PROFILE_RESCORING:
+                        st.info("Your new persona is ready. Your similarity scores are refreshing in the background.")
+                    else:
+                        st.info("Your new persona has been updated; your similarity scores still apply.")
                 else:
                     st.error("❌ Failed to update profile. Please try again.")
             except Exception as e:
@@ -193,20 +208,8 @@ class CandidateUI:
     def display_applied_jobs(self):
         """Display jobs the candidate has already applied for."""
         st.title("📋 Applied Jobs")
-        conn, cursor = initialize_db()
-
         # Fetch applied jobs for the candidate
-        cursor.execute(
-            """
-            SELECT job_postings.job_role, job_postings.job_description
-            FROM resumes
-            JOIN job_postings ON resumes.job_role = job_postings.job_role
-            WHERE resumes.candidate_profile_id = ? AND resumes.has_applied = 1
-            """,
-            (self.session_state["user_id"],)
-        )
-        applied_jobs = cursor.fetchall()
-        conn.close()
+        applied_jobs = get_applied_jobs(self.session_state["user_id"])
 
         if applied_jobs:
             for job_role, job_description in applied_jobs:
@@ -228,88 +231,51 @@ class CandidateUI:
         else:
             st.info("You have not applied for any jobs yet.")
 
+    @tracing.traced("action.update_profile")
     def update_profile_in_db(self, resume_path):
-        """Update the candidate's profile in the database."""
+        """
+        Update the candidate's profile from a new resume. Returns PROFILE_UNCHANGED
+        when the resume content is the same as before (nothing is regenerated),
+        PROFILE_UPDATED when the profile changed but its scoring input did not,
+        PROFILE_RESCORING when scores are being refreshed in the background, or
+        False on failure.
+        """
+        user_id = self.session_state["user_id"]
         try:
-            conn, cursor = initialize_db()
+            old_resume_hash, old_text_hash, old_resume_text, old_skills, old_experience, old_education = get_resume_state(user_id)
 
-            # Read the new resume text
+            # Read the new resume; a byte-identical upload or one whose text only changed
+            # in whitespace, page numbers or headers keeps the existing persona and scores
             with open(resume_path, "rb") as f:
-                resume_text = input_pdf_text(f)
-
-            # Generate a new persona (evaluation)
-            evaluation_prompt = """
-                You are an HR analyst tasked with creating a user persona from a resume. Analyze the provided resume and output the persona in a table format.
-                        The table should have two columns: "Category" and "Details".
-                        The "Category" column must include the following rows:
-                        * Name
-                        * Profession
-                        * Education
-                        * Key Strengths
-                        * Areas for Development
-                        * Technical Skills
-                        * Relevant Experience
-                        * Achievements
-                        * Certifications
-                        The "Details" column should contain the corresponding information extracted from the resume, formatted as follows:
-                        * **Name:** The full name of the candidate.
-                        * **Profession:** The candidate's current profession (e.g., student, software engineer).
-                        * **Education:** The candidate's educational qualifications (degrees, institutions, and dates).
-                        * **Key Strengths:** A concise summary of the candidate's core skills and abilities. Use bullet points for each strength. **Keep descriptions very brief and to the point (no more than 3-5 words per bullet point).**
-                        * **Areas for Development:** Potential areas where the candidate could grow or needs more experience. Use bullet points. **Keep descriptions very brief and to the point (no more than 3-5 words per bullet point).**
-                        * **Technical Skills:** A list of technical skills, including programming languages, frameworks, tools, etc.
-                        * **Relevant Experience:** A concise summary of the candidate's work history, projects, and internships. Use bullet points to list each experience. **Summarize each experience in no more than 5-7 words.**
-                        * **Achievements:** Notable accomplishments and awards. Use bullet points. **Summarize each achievement in no more than 5-7 words.**
-                        * **Certifications:** List of certifications. Use bullet points. **Summarize each certification in no more than 5-7 words.**
-                        Formatting and Style Guidelines:
-                        * The output must be in a table format.
-                        * Do not include any HTML tags or special characters.
-                        * Use concise language.
-                        * Extract information directly from the resume. Do not add any external information or make assumptions.
-                        Example Output Format:
-                        | Category | Details |
-                        |---|---|
-                        | Name | [Full Name] |
-                        | Profession | [Profession] |
-                        | Education | [Education Details] |
-                        | Key Strengths | * [Strength 1] <br> * [Strength 2] |
-                        | Areas for Development | * [Development Area 1] <br> * [Development Area 2] |
-                        | Technical Skills | [List of Skills] |
-                        | Relevant Experience | * [Experience 1] <br> * [Experience 2] |
-                        | Achievements | * [Achievement 1] <br> * [Achievement 2] |
-                        | Certifications | * [Certification 1] <br> * [Certification 2] |
-                        Here is the inputs:
-                        Resume: {text}
-            """
-            evaluation = get_gemini_response(evaluation_prompt.format(text=resume_text), resume_text, None)
-
-            # Update the evaluation in the resumes table for the "General" job role
-            cursor.execute(
-                "UPDATE resumes SET evaluation = ? WHERE candidate_profile_id = ? AND job_role = ?",
-                (evaluation, self.session_state["user_id"], "General"),
-            )
-
-            # Fetch all job roles and their descriptions
-            cursor.execute("SELECT job_role, job_description FROM job_postings")
-            job_postings = cursor.fetchall()
-
-            # Recalculate similarity scores for all job roles
-            for job_role, job_description in job_postings:
-                similarity_score = calculate_similarity_score(resume_text, job_description)
-                cursor.execute(
-                    "UPDATE resumes SET similarity_score = ? WHERE candidate_profile_id = ? AND job_role = ?",
-                    (similarity_score, self.session_state["user_id"], job_role),
-                )
-
-            # Update the resume path in the candidate_profiles table
-            cursor.execute(
-                "UPDATE candidate_profiles SET resume_path = ? WHERE user_id = ?",
-                (resume_path, self.session_state["user_id"]),
-            )
-
-            conn.commit()
-            conn.close()
-            return True
+                resume_bytes = f.read()
+            resume_hash = content_hash(resume_bytes)
+            if resume_hash != old_resume_hash:
+                resume_text = input_pdf_text(io.BytesIO(resume_bytes))
+                new_text_hash = text_hash(resume_text)
+            if resume_hash == old_resume_hash or new_text_hash == old_text_hash:
+                update_resume_path(user_id, resume_path, resume_hash)
+                return PROFILE_UNCHANGED
+
+            # Analyze the new resume once for both the profile fields and the persona (evaluation)
+            analysis = analyze_resume(resume_text)
+            if analysis is None:
+                return False
+            evaluation = render_persona_table(analysis)
+            fields = profile_fields(analysis)
+
+            # Scores only need refreshing when the text they are computed from changed
+            candidate = candidate_text(resume_text, fields["skills"], fields["experience"], fields["education"])
+            rescore = (candidate_text(normalize(resume_text), fields["skills"], fields["experience"], fields["education"])
+                       != candidate_text(old_resume_text, old_skills, old_experience, old_education))
+
+            # Store the new persona (evaluation) and the extracted profile fields
+            update_candidate_resume(user_id, resume_path, fields, resume_text, resume_hash, new_text_hash, evaluation, rescore)
+            invalidate_candidate_index()
+            if not rescore:
+                return PROFILE_UPDATED
+            # Rescore against every job off the request thread; views show the old scores as refreshing
+            enqueue_rescore(user_id, candidate)
+            return PROFILE_RESCORING
         except Exception as e:
             print(f"Error updating profile: {e}")
             return False
@@ -317,17 +283,11 @@ class CandidateUI:
     def view_persona(self, candidate_id):
         """Allow candidates to view their persona."""
         st.subheader("📝 User Persona")
-        conn, cursor = initialize_db()
         try:
             # Fetch the evaluation (persona) from the database
-            cursor.execute(
-                "SELECT evaluation FROM resumes WHERE candidate_profile_id = ? AND job_role = ?",
-                (candidate_id, "General"),  # "General" is the placeholder job role for persona
-            )
-            result = cursor.fetchone()
+            evaluation = get_persona(candidate_id)
 
-            if result and result[0]:  # Check if the evaluation exists
-                evaluation = result[0]
+            if evaluation:  # Check if the evaluation exists
 
                 # Extract the table from the evaluation response
                 table_start = evaluation.find("| Category |")
@@ -357,8 +317,6 @@ class CandidateUI:
                 st.warning("No persona found. Please upload your resume during registration.")
         except Exception as e:
             st.error(f"Could not display User Persona in table format: {e}")
-        finally:
-            conn.close()
 
     def search_jobs(self):
         st.title("Search for Jobs")
@@ -389,58 +347,10 @@ class CandidateUI:
         else:
             self.display_available_jobs(job_type_filter, internship_duration_filter)
 
+    @tracing.traced("action.recommend_jobs")
     def get_recommended_jobs(self):
         """Fetch recommended jobs based on resume similarity."""
-        conn, cursor = initialize_db()
-
-        # Fetch the candidate's resume path
-        cursor.execute("SELECT resume_path FROM candidate_profiles WHERE user_id = ?", (self.session_state["user_id"],))
-        resume_path = cursor.fetchone()[0]
-
-        # Fetch job roles the candidate has already applied for
-        cursor.execute(
-            "SELECT job_role FROM resumes WHERE candidate_profile_id = ? AND has_applied = 1",
-            (self.session_state["user_id"],)
-        )
-        applied_jobs = {row[0] for row in cursor.fetchall()}  # Use a set for faster lookups
-        conn.close()
-
-        if not resume_path or not os.path.exists(resume_path):
-            return []
-
-        try:
-            with open(resume_path, "rb") as f:
-                resume_text = input_pdf_text(f)
-
-            conn, cursor = initialize_db()
-            cursor.execute("SELECT job_id, job_role, job_description, job_type, internship_duration FROM job_postings")
-            jobs = cursor.fetchall()
-            conn.close()
-
-            recommendations = []
-            for job_id, job_role, job_description, job_type, internship_duration in jobs:
-                # Skip jobs the candidate has already applied for
-                if job_role in applied_jobs:
-                    continue
-
-                # Use the simple similarity logic for recommendations
-                similarity_score = calculate_similarity_score_simple(resume_text, job_description)
-                if similarity_score >= 80:  # Threshold for recommendations
-                    recommendations.append({
-                        "job_id": job_id,
-                        "job_role": job_role,
-                        "summary": summarize_job_description(job_description),
-                        "similarity_score": similarity_score,
-                        "job_type": job_type,
-                        "internship_duration": internship_duration,
-                    })
-
-            # Sort recommendations by similarity score (descending)
-            recommendations.sort(key=lambda x: x["similarity_score"], reverse=True)
-            return recommendations
-        except Exception as e:
-            print(f"Error generating recommendations: {e}")
-            return []
+        return recommend_jobs(self.session_state["user_id"])
 
     def display_recommended_jobs(self, job_type_filter=None, internship_duration_filter=None):
         """Display recommended jobs based on resume similarity and filters."""
@@ -460,19 +370,13 @@ class CandidateUI:
         if recommended_jobs:
             for job in recommended_jobs:
                 st.markdown(f"### {job['job_role']} ({job.get('job_type', 'N/A')})")
+                if is_degraded(job["similarity_score"]):
+                    st.caption("Match estimated from your skills while AI scoring is unavailable.")
                 with st.expander("View Job Description"):
                     st.write(job['summary'])  # Display the summarized job description in the dropdown
 
                 # Check if the candidate has already applied for this job
-                conn, cursor = initialize_db()
-                cursor.execute(
-                    "SELECT has_applied FROM resumes WHERE candidate_profile_id = ? AND job_role = ?",
-                    (self.session_state["user_id"], job['job_role']),
-                )
-                applied_status = cursor.fetchone()
-                conn.close()
-
-                if applied_status and applied_status[0] == 1:
+                if has_applied(self.session_state["user_id"], job['job_role']):
                     st.warning(f"You have already applied for the '{job['job_role']}' role.")
                 else:
                     if st.button(f"Apply for {job['job_role']}", key=f"apply_recommended_{job['job_id']}"):
@@ -485,50 +389,17 @@ class CandidateUI:
         st.subheader("📋 Available Jobs")
 
         # Fetch all jobs with pagination and filters
-        conn, cursor = initialize_db()
         jobs_per_page = 10
         if "page" not in self.session_state:
             self.session_state["page"] = 0
 
-        offset = self.session_state["page"] * jobs_per_page
-        query = """
-            SELECT job_id, job_role, job_description, job_type, internship_duration
-            FROM job_postings
-            WHERE job_role NOT IN (
-                SELECT job_role FROM resumes WHERE candidate_profile_id = ? AND has_applied = 1
-            )
-        """
-        params = [self.session_state["user_id"]]
-
-        # Apply filters
-        if job_type_filter != "All":
-            query += " AND job_type = ?"
-            params.append(job_type_filter)
-        if internship_duration_filter:
-            query += " AND (internship_duration >= ? OR internship_duration IS NULL)"
-            params.append(internship_duration_filter)
-
-        query += " LIMIT ? OFFSET ?"
-        params.extend([jobs_per_page, offset])
-
-        cursor.execute(query, tuple(params))
-        jobs = cursor.fetchall()
-
-        # Fetch total job count for pagination
-        cursor.execute(
-            """
-            SELECT COUNT(*)
-            FROM job_postings
-            WHERE job_role NOT IN (
-                SELECT job_role FROM resumes WHERE candidate_profile_id = ? AND has_applied = 1
-            )
-        """
-            + (" AND job_type = ?" if job_type_filter != "All" else "")
-            + (" AND (internship_duration >= ? OR internship_duration IS NULL)" if internship_duration_filter else ""),
-            tuple(params[:-2]),
+        jobs, total_jobs = get_open_jobs(
+            self.session_state["user_id"],
+            job_type=job_type_filter if job_type_filter != "All" else None,
+            min_duration=internship_duration_filter,
+            limit=jobs_per_page,
+            offset=self.session_state["page"] * jobs_per_page,
         )
-        total_jobs = cursor.fetchone()[0]
-        conn.close()
 
         if jobs:
             for job_id, job_role, job_description, job_type, internship_duration in jobs:
@@ -553,6 +424,7 @@ class CandidateUI:
         else:
             st.info("No job postings available at the moment.")
 
+    @tracing.traced("action.apply_for_job")
     def apply_for_job(self, selected_role):
         """Handle job application and generate match_response and roadmap."""
         candidate_profile = get_candidate_profile(self.session_state["user_id"])
@@ -561,89 +433,90 @@ class CandidateUI:
             try:
                 with open(resume_path, "rb") as f:
                     resume_text = input_pdf_text(f)
+                # Education, skills and experience columns of the profile
+                candidate = candidate_text(resume_text, candidate_profile[5], candidate_profile[6], candidate_profile[4])
                 st.success("✅ Resume Retrieved Successfully")
 
-                conn, cursor = initialize_db()
-
-                try:
-                    # Check if the candidate already has a record for the selected job role
-                    cursor.execute(
-                        "SELECT id, match_response, roadmap FROM resumes WHERE candidate_profile_id = ? AND job_role = ?",
-                        (self.session_state["user_id"], selected_role),
-                    )
-                    existing_record = cursor.fetchone()
-
+                # Prompt for the match analysis
+                input_prompts = {
+                    "match_response": """
+                        You are an AI assistant designed to analyze resumes against job descriptions.
+                        Analyze the following resume and job description.
+                        Evaluate the resume based on the following core categories:
+                        * Core Skills
+                        * Education
+                        * Industry Experience
+                        * Projects
+                        In addition to these core categories, identify 2-3 more categories that are highly relevant to this specific job description. Examples of additional categories include: AI/ML Development, Application of AI/ML, Deployment, Key Strengths, Areas for Focus, Communication Skills, Leadership Experience, Research Experience, etc.
+                        For each identified category (both core and additional):
+                        1. Assess the strength of alignment between the resume and the job description for that category.
+                        2. If the resume demonstrates strong alignment with the job description for the category, precede the category with a checkmark (✔️).
+                        3. If the resume demonstrates poor alignment with the job description for the category, precede the category with a warning symbol (⚠️).
+                        4. When determining the Assessment use these guidelines: "Strong" means a very high level of compatibility, "Moderate" means some compatibility, and "Poor" means low or no compatibility.
+                        Provide the output in a markdown table format. The table should have four columns: 'Category', 'Job Description Highlights', 'Resume Alignment', and 'Assessment'.
+                        The first row of the table should be the header row with the column names:
+                        For the 'Category' column, list the categories (both core and additional), each preceded by the appropriate symbol (✔️ or ⚠️) as described above.
+                        For the 'Job Description Highlights' column, extract key requirements and responsibilities from the job description provided. Keep the descriptions **very brief and to the point**, focusing on the essential keywords. Do not exceed 15 words.
+                        For the 'Resume Alignment' column, provide a **concise and descriptive analysis** of how the resume aligns with the corresponding job description highlight. Focus on the key strengths and relevant experience. Keep the descriptions **very brief and to the point**. Do not exceed 15 words.
+                        For the 'Assessment' column, use one of these values: 'Strong', 'Good', 'Moderate'.
+                        Here are the inputs:
+                        JD:{jd}
+                        Resume:{text}
+                        Output the table in markdown format.
+                    """
+                }
+
+                def apply():
+                    # Use the existing match_response and roadmap if an earlier application has them
+                    existing_record = start_application(self.session_state["user_id"], selected_role)
                     if existing_record:
-                        # Update the has_applied column if the record already exists
-                        cursor.execute(
-                            "UPDATE resumes SET has_applied = 1, application_date = ? WHERE candidate_profile_id = ? AND job_role = ?",
-                            (datetime.datetime.now(), self.session_state["user_id"], selected_role),
-                        )
-                        
-                        # Use existing match_response and roadmap if available
-                        if existing_record[1] and existing_record[2]:
-                            self.session_state["match_response"] = existing_record[1]
-                            self.session_state["roadmap"] = existing_record[2]
-                            conn.commit()
-                            return
-                    else:
-                        # Insert a new record if it doesn't exist
-                        cursor.execute(
-                            "INSERT INTO resumes (candidate_profile_id, job_role, application_date, has_applied) VALUES (?, ?, ?, ?)",
-                            (self.session_state["user_id"], selected_role, datetime.datetime.now(), 1),
-                        )
-
-                    # Generate match_response and roadmap
-                    input_prompts = {
-                        "match_response": """
-                            You are an AI assistant designed to analyze resumes against job descriptions.
-                            Analyze the following resume and job description.
-                            Evaluate the resume based on the following core categories:
-                            * Core Skills
-                            * Education
-                            * Industry Experience
-                            * Projects
-                            In addition to these core categories, identify 2-3 more categories that are highly relevant to this specific job description. Examples of additional categories include: AI/ML Development, Application of AI/ML, Deployment, Key Strengths, Areas for Focus, Communication Skills, Leadership Experience, Research Experience, etc.
-                            For each identified category (both core and additional):
-                            1. Assess the strength of alignment between the resume and the job description for that category.
-                            2. If the resume demonstrates strong alignment with the job description for the category, precede the category with a checkmark (✔️).
-                            3. If the resume demonstrates poor alignment with the job description for the category, precede the category with a warning symbol (⚠️).
-                            4. When determining the Assessment use these guidelines: "Strong" means a very high level of compatibility, "Moderate" means some compatibility, and "Poor" means low or no compatibility.
-                            Provide the output in a markdown table format. The table should have four columns: 'Category', 'Job Description Highlights', 'Resume Alignment', and 'Assessment'.
-                            The first row of the table should be the header row with the column names:
-                            For the 'Category' column, list the categories (both core and additional), each preceded by the appropriate symbol (✔️ or ⚠️) as described above.
-                            For the 'Job Description Highlights' column, extract key requirements and responsibilities from the job description provided. Keep the descriptions **very brief and to the point**, focusing on the essential keywords. Do not exceed 15 words.
-                            For the 'Resume Alignment' column, provide a **concise and descriptive analysis** of how the resume aligns with the corresponding job description highlight. Focus on the key strengths and relevant experience. Keep the descriptions **very brief and to the point**. Do not exceed 15 words.
-                            For the 'Assessment' column, use one of these values: 'Strong', 'Good', 'Moderate'.
-                            Here are the inputs:
-                            JD:{jd}
-                            Resume:{text}
-                            Output the table in markdown format.
-                        """
-                    }
-
-                    # Generate match_response
-                    prompt = input_prompts["match_response"].format(text=resume_text, jd=selected_role)
-                    self.session_state["match_response"] = get_gemini_response(prompt, resume_text, selected_role)
-                    
-                    # Generate roadmap using the dedicated function
-                    self.session_state["roadmap"] = generate_roadmap_for_candidate(resume_text, selected_role)
-
-                    cursor.execute(
-                        "UPDATE resumes SET match_response = ?, roadmap = ? WHERE candidate_profile_id = ? AND job_role = ?",
-                        (
-                            self.session_state["match_response"],
-                            self.session_state["roadmap"],
-                            self.session_state["user_id"],
-                            selected_role,
-                        ),
-                    )
+                        return {"match_response": existing_record[0], "roadmap": existing_record[1]}
 
-                    conn.commit()
-                    st.success("✅ Application submitted successfully!")
+                    job = job_text(get_job_description(selected_role) or selected_role)
+                    # The roadmap does not depend on the match analysis, so generate it
+                    # in the background while match_response streams
+                    roadmap_future = submit(generate_roadmap_for_candidate, candidate, job)
 
-                finally:
-                    conn.close()
+                    # Stream match_response so the analysis table renders as it is generated
+                    prompt = input_prompts["match_response"].format(text=candidate, jd=job)
+                    st.subheader("📊 Match Analysis")
+                    try:
+                        match_response = st.write_stream(stream_gemini_response(prompt))
+                    except (CircuitOpenError, google_exceptions.GoogleAPIError) as e:
+                        # Nothing is saved, so applying again generates the analysis from scratch
+                        print(f"Error generating match analysis: {e}")
+                        roadmap_future.cancel()
+                        st.warning("The match analysis could not be generated right now. Please try applying again in a few minutes.")
+                        return None
+
+                    st.subheader("🗺️ Learning Roadmap")
+                    try:
+                        roadmap = roadmap_future.result(timeout=FAN_OUT_DEADLINE_SECONDS)
+                    except TimeoutError:
+                        roadmap = None
+                    if roadmap is None:
+                        st.warning("Roadmap could not be generated. It will be generated next time you open this job.")
+                    if roadmap:
+                        st.markdown(roadmap_markdown(roadmap))
+
+                    save_application(self.session_state["user_id"], selected_role, match_response, roadmap)
+                    st.success("✅ Application submitted successfully!")
+                    return {"match_response": match_response, "roadmap": roadmap}
+
+                # A second click while this application is still being generated waits for it
+                # instead of generating it again; finished applications are reused from resumes
+                result, duplicate = run_once(self.session_state["user_id"], "apply_for_job",
+                                             {"job_role": selected_role, "candidate": candidate}, apply,
+                                             remember=None)
+                if result is None:
+                    if duplicate:
+                        st.warning("The match analysis could not be generated right now. Please try applying again in a few minutes.")
+                    return
+                if duplicate:
+                    st.info("This application was already being submitted; showing its result.")
+                    st.markdown(result["match_response"] or "")
+                    if result["roadmap"]:
+                        st.markdown(roadmap_markdown(result["roadmap"]))
 
             except FileNotFoundError:
                 st.error("❌ Resume file not found.")
@@ -652,12 +525,9 @@ class CandidateUI:
             st.error("❌ Resume not found")
 
     def clear_session_state(self):
-        if "evaluation" in self.session_state:
-            del self.session_state["evaluation"]
-        if "match_response" in self.session_state:
-            del self.session_state["match_response"]
-        if "roadmap" in self.session_state:
-            del self.session_state["roadmap"]
+        forget(self.session_state, "evaluation")
+        forget(self.session_state, "match_response")
+        forget(self.session_state, "roadmap")
         if "free_courses" in self.session_state:
             del self.session_state["free_courses"]
         if "paid_courses" in self.session_state:
@@ -0,0 +1,259 @@
+"""
+Deterministic synthetic data for scale testing.
+
+Populates the schema created by `initialize_db` with candidates, job postings
+and similarity score rows, and writes multi-page PDF resumes that
+`pdf_processor.input_pdf_text` can parse. The same seed always produces the
+same dataset.
+
+Usage:
+    python data_generator.py --candidates 100000 --jobs 5000 --scores-per-candidate 20
+"""
+import argparse
+import os
+import random
+import time
+
+import storage
+from database import initialize_db, hash_password
+
+SKILL_VOCABULARY = {
+    "languages": ["Python", "Java", "Go", "Rust", "C++", "C#", "JavaScript", "TypeScript", "Kotlin", "Scala", "Ruby", "PHP", "SQL", "R"],
+    "web": ["React", "Angular", "Vue", "Django", "Flask", "FastAPI", "Spring Boot", "Node.js", "GraphQL", "REST APIs", "HTML", "CSS"],
+    "data": ["Pandas", "NumPy", "Spark", "Hadoop", "Kafka", "Airflow", "dbt", "Snowflake", "PostgreSQL", "MySQL", "MongoDB", "Redis", "Elasticsearch"],
+    "ml": ["TensorFlow", "PyTorch", "scikit-learn", "NLP", "Computer Vision", "LLMs", "MLOps", "Statistics", "Deep Learning"],
+    "cloud": ["AWS", "GCP", "Azure", "Docker", "Kubernetes", "Terraform", "Ansible", "CI/CD", "Linux", "Prometheus", "Git"],
+    "soft": ["Communication", "Leadership", "Agile", "Scrum", "Mentoring", "Stakeholder Management"],
+}
+ALL_SKILLS = [skill for group in SKILL_VOCABULARY.values() for skill in group]
+
+FIRST_NAMES = ["Aarav", "Priya", "Liam", "Olivia", "Noah", "Emma", "Wei", "Mei", "Carlos", "Sofia", "Yusuf", "Amara", "Ivan", "Anya", "Kenji", "Hana", "Rahul", "Sneha", "Lucas", "Chloe"]
+LAST_NAMES = ["Sharma", "Patel", "Smith", "Johnson", "Chen", "Wang", "Garcia", "Rodriguez", "Khan", "Okafor", "Ivanov", "Tanaka", "Kim", "Nguyen", "Brown", "Müller", "Rossi", "Silva", "Singh", "Lee"]
+COMPANIES = ["Acme Corp", "Globex", "Initech", "Umbrella Labs", "Hooli", "Stark Industries", "Wayne Tech", "Cyberdyne", "Soylent", "Vandelay Industries"]
+TITLES = ["Software Engineer", "Data Engineer", "Data Scientist", "ML Engineer", "Backend Developer", "Frontend Developer", "DevOps Engineer", "Cloud Architect", "Full Stack Developer", "Analytics Engineer"]
+SENIORITY = ["Junior", "", "Senior", "Staff", "Lead"]
+DEGREES = ["B.Tech in Computer Science", "B.Sc. in Information Technology", "M.Sc. in Data Science", "M.Tech in Software Engineering", "B.E. in Electronics", "MBA in Technology Management"]
+INSTITUTIONS = ["State University", "Institute of Technology", "City College", "National University", "Tech University"]
+JOB_TYPES = ["Full-time", "Part-time", "Internship"]
+BULLET_VERBS = ["Built", "Designed", "Migrated", "Optimized", "Led", "Automated", "Scaled", "Maintained", "Shipped", "Refactored"]
+BULLET_OBJECTS = ["a payments API", "the data pipeline", "a recommendation service", "CI/CD workflows", "the reporting dashboard", "a search index", "the ML training stack", "an internal CLI", "customer onboarding flows", "the monitoring setup"]
+
+
+def pdf_escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path, lines, lines_per_page=55):
+    """Write lines of text to a (possibly multi-page) PDF using the built-in Helvetica font."""
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)] or [[]]
+    # Object 1 is the catalog, 2 the page tree, 3 the font; each page then takes two objects.
+    page_ids = [4 + 2 * i for i in range(len(pages))]
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [" + " ".join(f"{pid} 0 R" for pid in page_ids).encode() + b"] /Count " + str(len(pages)).encode() + b" >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for page_id, page_lines in zip(page_ids, pages):
+        stream_lines = ["BT", "/F1 10 Tf", "13 TL", "50 780 Td"]
+        stream_lines.extend(f"({pdf_escape(line)}) Tj T*" for line in page_lines)
+        stream_lines.append("ET")
+        stream = "\n".join(stream_lines).encode("latin-1", errors="replace")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {page_id + 1} 0 R /Resources << /Font << /F1 3 0 R >> >> >>".encode()
+        )
+        objects.append(b"<< /Length " + str(len(stream)).encode() + b" >>\nstream\n" + stream + b"\nendstream")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def make_resume(rng, index):
+    """Build a synthetic resume as a dict of profile fields plus the text lines for the PDF."""
+    first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+    full_name = f"{first} {last}"
+    email = f"{first.lower()}.{last.lower()}{index}@example.com"
+    phone_number = f"+1-555-{rng.randint(100, 999)}-{rng.randint(1000, 9999)}"
+    focus = rng.choice(list(SKILL_VOCABULARY))
+    skills = rng.sample(SKILL_VOCABULARY[focus], min(len(SKILL_VOCABULARY[focus]), rng.randint(3, 7)))
+    skills += [s for s in rng.sample(ALL_SKILLS, rng.randint(2, 8)) if s not in skills]
+    education = f"{rng.choice(DEGREES)}, {rng.choice(INSTITUTIONS)} ({rng.randint(2005, 2024)})"
+
+    experience = []
+    lines = [full_name, email, phone_number, "", "SUMMARY",
+             f"{rng.choice(TITLES)} with {rng.randint(1, 15)} years of experience in {skills[0]} and {rng.choice(skills[1:])}.",
+             "", "SKILLS", ", ".join(skills), "", "EXPERIENCE"]
+    for _ in range(rng.randint(1, 10)):
+        role = f"{rng.choice(SENIORITY)} {rng.choice(TITLES)}".strip()
+        company = rng.choice(COMPANIES)
+        years = rng.randint(1, 5)
+        experience.append(f"{role} at {company} ({years} years)")
+        lines.append(f"{role} - {company} ({years} years)")
+        for _ in range(rng.randint(2, 6)):
+            lines.append(f"  - {rng.choice(BULLET_VERBS)} {rng.choice(BULLET_OBJECTS)} using {rng.choice(skills)}")
+    lines += ["", "EDUCATION", education]
+    if rng.random() < 0.5:
+        lines += ["", "CERTIFICATIONS"] + [f"  - {rng.choice(skills)} Certified Professional" for _ in range(rng.randint(1, 3))]
+
+    return {
+        "full_name": full_name,
+        "email": email,
+        "phone_number": phone_number,
+        "education": education,
+        "skills": ", ".join(skills),
+        "skill_list": skills,
+        "experience": "\n".join(experience),
+        "lines": lines,
+    }
+
+
+def make_job(rng, index):
+    """Build a synthetic job posting with a unique role title."""
+    title = f"{rng.choice(SENIORITY)} {rng.choice(TITLES)}".strip()
+    job_role = f"{title} #{index}"
+    focus = rng.choice(list(SKILL_VOCABULARY))
+    required = rng.sample(SKILL_VOCABULARY[focus], min(len(SKILL_VOCABULARY[focus]), rng.randint(3, 6)))
+    nice_to_have = rng.sample(ALL_SKILLS, 3)
+    job_type = rng.choice(JOB_TYPES)
+    description = (
+        f"{rng.choice(COMPANIES)} is hiring a {title}. "
+        f"Responsibilities: {rng.choice(BULLET_VERBS).lower()} {rng.choice(BULLET_OBJECTS)} and {rng.choice(BULLET_VERBS).lower()} {rng.choice(BULLET_OBJECTS)}. "
+        f"Required skills: {', '.join(required)}. Nice to have: {', '.join(nice_to_have)}. "
+        f"Qualifications: {rng.choice(DEGREES)} or equivalent, {rng.randint(0, 8)}+ years of experience."
+    )
+    return {
+        "job_role": job_role,
+        "job_description": description,
+        "job_type": job_type,
+        "internship_duration": rng.randint(2, 12) if job_type == "Internship" else None,
+        "skill_list": required + nice_to_have,
+    }
+
+
+def synthetic_score(rng, candidate_skills, job_skills):
+    """Score in [0, 100] driven by skill overlap with some noise, so rankings look realistic."""
+    overlap = len(set(candidate_skills) & set(job_skills)) / max(1, len(job_skills))
+    return round(min(100.0, max(0.0, 25 + 70 * overlap + rng.gauss(0, 8))), 2)
+
+
+def generate_dataset(num_candidates, num_jobs, scores_per_candidate=20, seed=42,
+                     resume_dir="resumes", write_pdfs=True, batch_size=5000, hr_user_id=1,
+                     general_evaluation=None):
+    """
+    Populate users.db in the current directory. Returns a summary dict with the
+    generated candidate ids and job roles.
+    """
+    rng = random.Random(seed)
+    os.makedirs(resume_dir, exist_ok=True)
+    conn, cursor = initialize_db()
+    sqlite = storage.dialect() == "sqlite"
+    if sqlite:
+        # Bulk load: durability does not matter for throwaway fixtures. The
+        # connection is pooled, so the setting is restored before it is returned.
+        cursor.execute("PRAGMA synchronous=OFF")
+
+    jobs = [make_job(rng, j) for j in range(num_jobs)]
+    cursor.executemany(
+        "INSERT INTO job_postings (job_role, job_description, job_type, internship_duration, posted_by) VALUES (?, ?, ?, ?, ?)",
+        [(job["job_role"], job["job_description"], job["job_type"], job["internship_duration"], hr_user_id) for job in jobs],
+    )
+    cursor.executemany(
+        "INSERT OR IGNORE INTO job_skills (job_id, skill_id) SELECT job_id, skill_id FROM job_postings, skills WHERE job_role = ? AND name = ?",
+        [(job["job_role"], skill) for job in jobs for skill in job["skill_list"]],
+    )
+
+    cursor.execute("SELECT COALESCE(MAX(id), 0) FROM users")
+    first_id = cursor.fetchone()[0] + 1
+    password = hash_password("password")
+    scores_per_candidate = min(scores_per_candidate, num_jobs)
+
+    users, profiles, resumes, candidate_skills = [], [], [], []
+    candidate_ids = []
+    score_rows = 0
+
+    def flush():
+        cursor.executemany("INSERT INTO users (id, username, password, role, email) VALUES (?, ?, ?, ?, ?)", users)
+        cursor.executemany(
+            "INSERT INTO candidate_profiles (user_id, full_name, email, phone_number, education, skills, experience, resume_path, resume_text) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            profiles,
+        )
+        cursor.executemany(
+            "INSERT INTO resumes (candidate_profile_id, job_role, evaluation, similarity_score, personalized_similarity_score) VALUES (?, ?, ?, ?, ?)",
+            resumes,
+        )
+        cursor.executemany(
+            "INSERT OR IGNORE INTO candidate_skills (candidate_id, skill_id) SELECT ?, skill_id FROM skills WHERE name = ?",
+            candidate_skills,
+        )
+        users.clear()
+        profiles.clear()
+        resumes.clear()
+        candidate_skills.clear()
+
+    for i in range(num_candidates):
+        user_id = first_id + i
+        candidate_ids.append(user_id)
+        resume = make_resume(rng, i)
+        resume_path = os.path.join(resume_dir, f"synthetic_{user_id}.pdf")
+        if write_pdfs:
+            write_pdf(resume_path, resume["lines"])
+
+        users.append((user_id, f"synthetic_{user_id}", password, "candidate", resume["email"]))
+        profiles.append((user_id, resume["full_name"], resume["email"], resume["phone_number"],
+                         resume["education"], resume["skills"], resume["experience"], resume_path,
+                         "\n".join(line.strip() for line in resume["lines"] if line.strip())))
+        resumes.append((user_id, "General", general_evaluation, None, None))
+        candidate_skills.extend((user_id, skill) for skill in resume["skill_list"])
+        for job in rng.sample(jobs, scores_per_candidate):
+            resumes.append((user_id, job["job_role"], None,
+                            synthetic_score(rng, resume["skill_list"], job["skill_list"]),
+                            synthetic_score(rng, resume["skill_list"], job["skill_list"])))
+            score_rows += 1
+
+        if len(resumes) >= batch_size:
+            flush()
+    flush()
+    # Candidates were inserted with explicit ids
+    storage.sync_sequence(cursor, "users")
+
+    conn.commit()
+    if sqlite:
+        cursor.execute("PRAGMA synchronous=FULL")
+    conn.close()
+    return {
+        "candidate_ids": candidate_ids,
+        "job_roles": [job["job_role"] for job in jobs],
+        "job_descriptions": [job["job_description"] for job in jobs],
+        "score_rows": score_rows,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a reproducible synthetic hiring dataset in the current directory.")
+    parser.add_argument("--candidates", type=int, default=1000)
+    parser.add_argument("--jobs", type=int, default=50)
+    parser.add_argument("--scores-per-candidate", type=int, default=20, help="Score rows per candidate (sampled jobs)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--resume-dir", default="resumes")
+    parser.add_argument("--no-pdfs", action="store_true", help="Skip writing PDF files")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    summary = generate_dataset(args.candidates, args.jobs, args.scores_per_candidate, args.seed,
+                               args.resume_dir, write_pdfs=not args.no_pdfs)
+    elapsed = time.perf_counter() - start
+    print(f"Generated {len(summary['candidate_ids'])} candidates, {len(summary['job_roles'])} jobs "
+          f"and {summary['score_rows']} score rows in {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,282 @@
-import sqlite3
 import hashlib
+import contextvars
+import io
+import itertools
 import os
-from utils import calculate_similarity_score_simple, calculate_similarity_score
-from ai_response import get_gemini_response
+import batch
+import storage
+from utils import calculate_similarity_score_simple, calculate_similarity_score, is_degraded
+from ai_response import generate_persona, generate_gap_roadmap, analyze_resume, profile_fields, render_persona_table, generate_roadmap_for_candidate
+from llm_client import fan_out, llm_priority, BATCH
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pdf_processor import input_pdf_text
+from prompt_builder import candidate_text, normalize
+from skills import skill_gap, gap_signature, extract_skills, SKILL_SYNONYMS
+from llm_client import METRICS as LLM_METRICS
 import datetime
+import threading
+import tracing
 
 def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest()
 
-def initialize_db():
-    db_file = "users.db"
-    print(f"Database file: {os.path.abspath(db_file)}")
-    new_db = not os.path.exists(db_file)
+def content_hash(data):
+    """Hash of an uploaded file's bytes."""
+    return hashlib.sha256(data).hexdigest()
 
-    # Set a timeout to handle database locks
-    conn = sqlite3.connect(db_file, check_same_thread=False, timeout=30)
-    cursor = conn.cursor()
+def text_hash(resume_text):
+    """Hash of extracted resume text, ignoring whitespace, page numbers and repeated headers."""
+    return hashlib.sha256(normalize(resume_text).encode()).hexdigest()
+
+def create_roadmap_plans_table(cursor):
+    # Roadmap plans shared by every candidate with the same skill gap for the same job description
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS roadmap_plans (
+            gap_signature TEXT NOT NULL,
+            jd_hash TEXT NOT NULL,
+            roadmap TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (gap_signature, jd_hash)
+        )
+    ''')
+
+# Full-text search indexes. SQLite uses external-content FTS5 tables, so the
+# text is stored once in the base table and triggers keep the index in sync.
+# PostgreSQL indexes a weighted tsvector of the same columns with GIN.
+SEARCH_TOKENIZER = "porter unicode61 tokenchars '+#'"
+SEARCH_TABLES = {
+    "candidate_search": ("candidate_profiles", "user_id", ("full_name", "skills", "experience", "education", "resume_text")),
+    "job_search": ("job_postings", "job_id", ("job_role", "job_description")),
+}
+# PostgreSQL weight of each column above, in the spirit of the bm25 weights in search_candidates and search_jobs
+SEARCH_WEIGHTS = {"candidate_search": "CABCC", "job_search": "AB"}
+
+def search_document(search_table):
+    """The PostgreSQL tsvector expression indexed for a search table."""
+    _, _, columns = SEARCH_TABLES[search_table]
+    return " || ".join(
+        f"setweight(to_tsvector('english', COALESCE({column}, '')), '{weight}')"
+        for column, weight in zip(columns, SEARCH_WEIGHTS[search_table])
+    )
+
+def create_search_tables(cursor):
+    if storage.dialect() == "postgresql":
+        for search_table, (base_table, _, _) in SEARCH_TABLES.items():
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{search_table} ON {base_table} USING GIN (({search_document(search_table)}))")
+        return
+    for search_table, (base_table, key, columns) in SEARCH_TABLES.items():
+        if storage.table_exists(cursor, search_table):
+            continue
+        column_list = ", ".join(columns)
+        new_values = ", ".join(f"new.{column}" for column in columns)
+        old_values = ", ".join(f"old.{column}" for column in columns)
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE {search_table} USING fts5({column_list}, content='{base_table}', "
+            f"content_rowid='{key}', tokenize=\"{SEARCH_TOKENIZER}\")"
+        )
+        cursor.execute(f'''
+            CREATE TRIGGER {search_table}_insert AFTER INSERT ON {base_table} BEGIN
+                INSERT INTO {search_table} (rowid, {column_list}) VALUES (new.{key}, {new_values});
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER {search_table}_delete AFTER DELETE ON {base_table} BEGIN
+                INSERT INTO {search_table} ({search_table}, rowid, {column_list}) VALUES ('delete', old.{key}, {old_values});
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER {search_table}_update AFTER UPDATE OF {column_list} ON {base_table} BEGIN
+                INSERT INTO {search_table} ({search_table}, rowid, {column_list}) VALUES ('delete', old.{key}, {old_values});
+                INSERT INTO {search_table} (rowid, {column_list}) VALUES (new.{key}, {new_values});
+            END
+        ''')
+        # Index rows that existed before the search table
+        cursor.execute(f"INSERT INTO {search_table} ({search_table}) VALUES ('rebuild')")
+
+def create_skill_tables(cursor):
+    # Skill taxonomy: canonical skills with their synonyms, and the skills each candidate and job mentions
+    if storage.table_exists(cursor, "skills"):
+        return
+    cursor.execute('''
+        CREATE TABLE skills (
+            skill_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE skill_synonyms (
+            synonym TEXT PRIMARY KEY,
+            skill_id INTEGER NOT NULL,
+            FOREIGN KEY (skill_id) REFERENCES skills (skill_id)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE candidate_skills (
+            candidate_id INTEGER NOT NULL,
+            skill_id INTEGER NOT NULL,
+            PRIMARY KEY (candidate_id, skill_id),
+            FOREIGN KEY (candidate_id) REFERENCES candidate_profiles (user_id),
+            FOREIGN KEY (skill_id) REFERENCES skills (skill_id)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE job_skills (
+            job_id INTEGER NOT NULL,
+            skill_id INTEGER NOT NULL,
+            PRIMARY KEY (job_id, skill_id),
+            FOREIGN KEY (job_id) REFERENCES job_postings (job_id),
+            FOREIGN KEY (skill_id) REFERENCES skills (skill_id)
+        )
+    ''')
+    cursor.execute("CREATE INDEX idx_candidate_skills_skill ON candidate_skills (skill_id)")
+    cursor.execute("CREATE INDEX idx_job_skills_skill ON job_skills (skill_id)")
 
-    # Enable Write-Ahead Logging (WAL) mode for better concurrency
-    cursor.execute("PRAGMA journal_mode=WAL;")
+    for name, synonyms in SKILL_SYNONYMS.items():
+        skill_id = storage.insert_returning_id(cursor, "INSERT INTO skills (name) VALUES (?)", (name,), "skill_id")
+        cursor.executemany("INSERT OR IGNORE INTO skill_synonyms (synonym, skill_id) VALUES (?, ?)",
+                           [(synonym, skill_id) for synonym in synonyms])
+
+    # Link candidates and jobs that existed before the taxonomy
+    cursor.execute("SELECT user_id, skills, resume_text FROM candidate_profiles")
+    for candidate_id, skills, resume_text in cursor.fetchall():
+        store_candidate_skills(cursor, candidate_id, skills, resume_text)
+    cursor.execute("SELECT job_id, job_description FROM job_postings")
+    for job_id, job_description in cursor.fetchall():
+        store_job_skills(cursor, job_id, job_description)
+
+def store_candidate_skills(cursor, candidate_id, skills, resume_text=None):
+    """
+    Replace the candidate's rows in candidate_skills with the canonical skills
+    named in their skills field, or in the resume text when that field is empty.
+    """
+    text = skills if skills and skills.strip() else resume_text
+    cursor.execute("DELETE FROM candidate_skills WHERE candidate_id = ?", (candidate_id,))
+    cursor.executemany(
+        "INSERT OR IGNORE INTO candidate_skills (candidate_id, skill_id) SELECT ?, skill_id FROM skills WHERE name = ?",
+        [(candidate_id, skill) for skill in extract_skills(text)],
+    )
+
+def store_job_skills(cursor, job_id, job_description):
+    """Replace the job's rows in job_skills with the canonical skills its description names."""
+    cursor.execute("DELETE FROM job_skills WHERE job_id = ?", (job_id,))
+    cursor.executemany(
+        "INSERT OR IGNORE INTO job_skills (job_id, skill_id) SELECT ?, skill_id FROM skills WHERE name = ?",
+        [(job_id, skill) for skill in extract_skills(job_description)],
+    )
+
+def create_score_changes_table(cursor):
+    # Append-only log of similarity score writes, so the score matrix can sync incrementally
+    if storage.table_exists(cursor, "score_changes"):
+        return
+    cursor.execute('''
+        CREATE TABLE score_changes (
+            change_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            candidate_id INTEGER NOT NULL,
+            job_role TEXT NOT NULL,
+            similarity_score REAL
+        )
+    ''')
+    if storage.dialect() == "postgresql":
+        cursor.execute('''
+            CREATE OR REPLACE FUNCTION record_score_change() RETURNS trigger AS $$
+            BEGIN
+                INSERT INTO score_changes (candidate_id, job_role, similarity_score)
+                VALUES (NEW.candidate_profile_id, NEW.job_role, NEW.similarity_score);
+                RETURN NEW;
+            END
+            $$ LANGUAGE plpgsql
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER resumes_score_insert AFTER INSERT ON resumes
+            FOR EACH ROW WHEN (NEW.job_role != 'General') EXECUTE FUNCTION record_score_change()
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER resumes_score_update AFTER UPDATE OF similarity_score ON resumes
+            FOR EACH ROW WHEN (NEW.job_role != 'General') EXECUTE FUNCTION record_score_change()
+        ''')
+        return
+    cursor.execute('''
+        CREATE TRIGGER resumes_score_insert AFTER INSERT ON resumes WHEN new.job_role != 'General' BEGIN
+            INSERT INTO score_changes (candidate_id, job_role, similarity_score)
+            VALUES (new.candidate_profile_id, new.job_role, new.similarity_score);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER resumes_score_update AFTER UPDATE OF similarity_score ON resumes WHEN new.job_role != 'General' BEGIN
+            INSERT INTO score_changes (candidate_id, job_role, similarity_score)
+            VALUES (new.candidate_profile_id, new.job_role, new.similarity_score);
+        END
+    ''')
+
+def create_idempotency_table(cursor):
+    # Results of completed heavy actions, so a repeated submission returns the first result
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS idempotency_keys (
+            idempotency_key TEXT PRIMARY KEY,
+            action TEXT NOT NULL,
+            result TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+def create_roadmap_drafts_table(cursor):
+    # Roadmaps generated by an Analyze All run, kept until HR sends them as notifications
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS roadmap_drafts (
+            run_id TEXT NOT NULL,
+            candidate_id INTEGER NOT NULL,
+            job_role TEXT NOT NULL,
+            roadmap TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (run_id, candidate_id)
+        )
+    ''')
+
+RESUME_UNIQUE_INDEX = "CREATE UNIQUE INDEX IF NOT EXISTS idx_resumes_candidate_role ON resumes (candidate_profile_id, job_role)"
+# False when migrate() found duplicates and left the index out
+_resume_unique_index = True
+
+def on_resume_conflict(action):
+    """ON CONFLICT clause for resumes inserts, empty when the database has no unique index to conflict on."""
+    return f" ON CONFLICT (candidate_profile_id, job_role) {action}" if _resume_unique_index else ""
+
+def create_resume_unique_index(conn, cursor):
+    """
+    One resumes row per (candidate, job role). Databases that already hold
+    duplicates keep working without the index; the duplicates are reported.
+    """
+    global _resume_unique_index
+    try:
+        cursor.execute(RESUME_UNIQUE_INDEX)
+    except storage.IntegrityError:
+        _resume_unique_index = False
+        # PostgreSQL refuses further statements in a failed transaction
+        conn.rollback()
+        cursor.execute('''
+            SELECT COUNT(*) FROM (
+                SELECT 1 FROM resumes GROUP BY candidate_profile_id, job_role HAVING COUNT(*) > 1
+            ) AS duplicates
+        ''')
+        print(f"Skipping unique index on resumes: {cursor.fetchone()[0]} (candidate, job role) pairs have duplicate rows")
+
+# Columns added after the first release, created on databases that predate them
+MIGRATED_COLUMNS = [
+    ("resumes", "application_date", "TEXT"),
+    ("candidate_profiles", "resume_text", "TEXT"),
+    ("candidate_profiles", "resume_hash", "TEXT"),
+    ("candidate_profiles", "text_hash", "TEXT"),
+    ("resumes", "score_status", "TEXT"),
+    ("resumes", "score_degraded", "INTEGER DEFAULT 0"),
+]
+
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+def migrate(conn, cursor):
+    """Create the schema, or bring an existing database up to date."""
+    print(storage.get_backend().describe())
+    new_db = not storage.table_exists(cursor, "users")
 
     if new_db:
         # Create users table
@@ -47,6 +304,9 @@ def initialize_db():
                 additional_information TEXT,
                 is_employee INTEGER DEFAULT 0,
                 hire_date TEXT,
+                resume_text TEXT,
+                resume_hash TEXT,
+                text_hash TEXT,
                 FOREIGN KEY (user_id) REFERENCES users (id)
             )
         ''')
@@ -87,6 +347,8 @@ def initialize_db():
                 similarity_score REAL,
                 personalized_similarity_score REAL,
                 has_applied INTEGER DEFAULT 0,       
+                score_status TEXT,
+                score_degraded INTEGER DEFAULT 0,
                 FOREIGN KEY (candidate_profile_id) REFERENCES candidate_profiles (user_id)
             )
         ''')
@@ -117,127 +379,202 @@ def initialize_db():
             )
         ''')
 
+        create_roadmap_plans_table(cursor)
+        create_search_tables(cursor)
+        create_skill_tables(cursor)
+        create_score_changes_table(cursor)
+        create_idempotency_table(cursor)
+        create_roadmap_drafts_table(cursor)
+        cursor.execute(RESUME_UNIQUE_INDEX)
+
         # Predefined HR users (example)
         hr_users = [
             ("hr1", hash_password("hrpass1"), "hr"),
             ("hr2", hash_password("hrpass2"), "hr"),
         ]
-
-        for user in hr_users:
-            try:
-                cursor.execute("INSERT INTO users (username, password, role) VALUES (?, ?, ?)", user)
-            except sqlite3.IntegrityError:
-                pass
+        cursor.executemany("INSERT INTO users (username, password, role) VALUES (?, ?, ?)", hr_users)
         conn.commit()
     else:
-        # Check if columns exist, if not, add them.
-        try:
-            cursor.execute("ALTER TABLE resumes ADD COLUMN application_date TEXT")
-            conn.commit()
-        except sqlite3.OperationalError:
-            pass
+        # Add the columns older databases are missing
+        existing = {}
+        for table, column, definition in MIGRATED_COLUMNS:
+            if table not in existing:
+                existing[table] = storage.columns(cursor, table)
+            if column not in existing[table]:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        create_roadmap_plans_table(cursor)
+        create_search_tables(cursor)
+        create_skill_tables(cursor)
+        create_score_changes_table(cursor)
+        create_idempotency_table(cursor)
+        create_roadmap_drafts_table(cursor)
+        conn.commit()
+        create_resume_unique_index(conn, cursor)
+        conn.commit()
 
+def initialize_db():
+    """
+    A pooled (connection, cursor) from the configured backend (see storage.py).
+    The first call in each process creates or migrates the schema. Close the
+    connection to return it to the pool.
+    """
+    global _schema_ready
+    conn = storage.connect()
+    cursor = conn.cursor()
+    if not _schema_ready:
+        with _schema_lock:
+            if not _schema_ready:
+                migrate(conn, cursor)
+                _schema_ready = True
     return conn, cursor
 
+def analytics_db():
+    """
+    (connection, cursor) for heavy HR reports. On SQLite they read a periodic
+    snapshot of the database; storage.snapshot_age() says how old it is.
+    """
+    if not _schema_ready:
+        initialize_db()[0].close()
+    conn = storage.analytics_connect()
+    return conn, conn.cursor()
 
-def register_user(username, password, role, full_name, email, phone_number, education, skills, experience, resume_path, additional_information):
+def _keyset_chunks(select, key, conditions=(), params=(), snapshot=False, chunk_size=None):
+    """
+    Rows of `select` in `key` order, as lists of at most chunk_size rows (see
+    batch.keyset_chunks). Each page is read on its own pooled connection, so
+    none is held between chunks. `key` must be the first selected column.
+    """
+    where = " AND ".join((*conditions, f"{key} > ?"))
+
+    def fetch_page(after, limit):
+        conn, cursor = analytics_db() if snapshot else initialize_db()
+        try:
+            cursor.execute(f"{select} WHERE {where} ORDER BY {key} LIMIT ?", (*params, after, limit))
+            return cursor.fetchall()
+        finally:
+            conn.close()
+
+    return batch.keyset_chunks(fetch_page, chunk_size or batch.BATCH_CHUNK_SIZE)
+
+
+@tracing.traced("action.register_user")
+def register_user(username, password, role, full_name, email, phone_number, education, skills, experience, resume_path, additional_information, evaluation=None):
+    """
+    Create the user and candidate profile, then store the persona and scores
+    against every job. Pass `evaluation` when the persona was already generated.
+    """
     try:
         hashed_password = hash_password(password)
-        with sqlite3.connect("users.db") as conn:
-            cursor = conn.cursor()
+        conn, cursor = initialize_db()
+        try:
+            # Skip the LLM work for a taken username; the unique constraint still catches races
+            cursor.execute("SELECT 1 FROM users WHERE username = ?", (username,))
+            if cursor.fetchone():
+                return False
+            # Fetch all job roles and their descriptions
+            cursor.execute("SELECT job_role, job_description FROM job_postings")
+            job_postings = cursor.fetchall()
+        finally:
+            # No connection (or write lock) is held while the LLM calls run
+            conn.close()
+
+        # Read the resume text
+        with open(resume_path, "rb") as f:
+            resume_bytes = f.read()
+        resume_text = input_pdf_text(io.BytesIO(resume_bytes))
 
+        # Scores use the compact profile representation; the persona needs the full resume
+        candidate = candidate_text(resume_text, skills, experience, education)
+
+        # The persona and every score are independent, so run them concurrently
+        calls = {}
+        if evaluation is None:
+            calls["persona"] = lambda: generate_persona(resume_text)
+        for job_role, job_description in job_postings:
+            # Use advanced logic for shortlisting
+            calls[("similarity", job_role)] = partial(calculate_similarity_score, candidate, job_description)
+            # Use simple logic for personalized recommendations
+            calls[("personalized", job_role)] = partial(calculate_similarity_score_simple, candidate, job_description)
+        results, errors = fan_out(calls)
+        for key, error in errors.items():
+            print(f"Registration LLM call {key} failed: {error}")
+        if evaluation is None:
+            evaluation = results.get("persona", "No response generated.")
+
+        # Everything is written in one short transaction
+        conn, cursor = initialize_db()
+        try:
             # Insert user into the users table
-            cursor.execute("INSERT INTO users (username, password, role, email) VALUES (?, ?, ?, ?)", 
-                           (username, hashed_password, role, email))
-            user_id = cursor.lastrowid
-
-            # Insert candidate profile into the candidate_profiles table
-            cursor.execute("INSERT INTO candidate_profiles (user_id, full_name, email, phone_number, education, skills, experience, resume_path, additional_information) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", 
-                           (user_id, full_name, email, phone_number, education, skills, experience, resume_path, additional_information))
-
-            # Read the resume text
-            with open(resume_path, "rb") as f:
-                resume_text = input_pdf_text(f)
-
-            # Generate persona (evaluation) from the resume
-            evaluation_prompt = """
-                You are an HR analyst tasked with creating a user persona from a resume. Analyze the provided resume and output the persona in a table format.
-                        The table should have two columns: "Category" and "Details".
-                        The "Category" column must include the following rows:
-                        * Name
-                        * Profession
-                        * Education
-                        * Key Strengths
-                        * Areas for Development
-                        * Technical Skills
-                        * Relevant Experience
-                        * Achievements
-                        * Certifications
-                        The "Details" column should contain the corresponding information extracted from the resume, formatted as follows:
-                        * **Name:** The full name of the candidate.
-                        * **Profession:** The candidate's current profession (e.g., student, software engineer).
-                        * **Education:** The candidate's educational qualifications (degrees, institutions, and dates).
-                        * **Key Strengths:** A concise summary of the candidate's core skills and abilities. Use bullet points for each strength. **Keep descriptions very brief and to the point (no more than 3-5 words per bullet point).**
-                        * **Areas for Development:** Potential areas where the candidate could grow or needs more experience. Use bullet points. **Keep descriptions very brief and to the point (no more than 3-5 words per bullet point).**
-                        * **Technical Skills:** A list of technical skills, including programming languages, frameworks, tools, etc.
-                        * **Relevant Experience:** A concise summary of the candidate's work history, projects, and internships. Use bullet points to list each experience. **Summarize each experience in no more than 5-7 words.**
-                        * **Achievements:** Notable accomplishments and awards. Use bullet points. **Summarize each achievement in no more than 5-7 words.**
-                        * **Certifications:** List of certifications. Use bullet points. **Summarize each certification in no more than 5-7 words.**
-                        Formatting and Style Guidelines:
-                        * The output must be in a table format.
-                        * Do not include any HTML tags or special characters.
-                        * Use concise language.
-                        * Extract information directly from the resume. Do not add any external information or make assumptions.
-                        Example Output Format:
-                        | Category | Details |
-                        |---|---|
-                        | Name | [Full Name] |
-                        | Profession | [Profession] |
-                        | Education | [Education Details] |
-                        | Key Strengths | * [Strength 1] <br> * [Strength 2] |
-                        | Areas for Development | * [Development Area 1] <br> * [Development Area 2] |
-                        | Technical Skills | [List of Skills] |
-                        | Relevant Experience | * [Experience 1] <br> * [Experience 2] |
-                        | Achievements | * [Achievement 1] <br> * [Achievement 2] |
-                        | Certifications | * [Certification 1] <br> * [Certification 2] |
-                        Here is the inputs:
-                        Resume: {text}
-                        """
-            evaluation = get_gemini_response(evaluation_prompt.format(text=resume_text), resume_text, None)
+            user_id = storage.insert_returning_id(
+                cursor, "INSERT INTO users (username, password, role, email) VALUES (?, ?, ?, ?)",
+                (username, hashed_password, role, email))
+
+            # Insert candidate profile into the candidate_profiles table, keeping the
+            # normalized resume text for local search and ranking, and content hashes
+            # so later uploads of the same resume can skip rescoring
+            cursor.execute("INSERT INTO candidate_profiles (user_id, full_name, email, phone_number, education, skills, experience, resume_path, additional_information, resume_text, resume_hash, text_hash) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", 
+                           (user_id, full_name, email, phone_number, education, skills, experience, resume_path, additional_information, normalize(resume_text),
+                            content_hash(resume_bytes), text_hash(resume_text)))
+            store_candidate_skills(cursor, user_id, skills, resume_text)
 
             # Store the persona in the resumes table with a placeholder job role ("General")
             cursor.execute("INSERT INTO resumes (candidate_profile_id, job_role, evaluation) VALUES (?, ?, ?)", 
                            (user_id, "General", evaluation))
 
-            # Fetch all job roles and their descriptions
-            cursor.execute("SELECT job_role, job_description FROM job_postings")
-            job_postings = cursor.fetchall()
-
             if job_postings:
-                # Calculate similarity scores for each job role
                 for job_role, job_description in job_postings:
-                    # Use advanced logic for shortlisting
-                    similarity_score = calculate_similarity_score(resume_text, job_description)
-                    # Use simple logic for personalized recommendations
-                    personalized_similarity_score = calculate_similarity_score_simple(resume_text, job_description)
+                    # Scores that failed or missed the deadline are stored as NULL rather than 0
+                    similarity_score = results.get(("similarity", job_role))
+                    personalized_similarity_score = results.get(("personalized", job_role))
 
                     # Store both scores in the database
                     cursor.execute("""
-                        INSERT INTO resumes (candidate_profile_id, job_role, similarity_score, personalized_similarity_score) 
-                        VALUES (?, ?, ?, ?)
-                    """, (user_id, job_role, similarity_score, personalized_similarity_score))
+                        INSERT INTO resumes (candidate_profile_id, job_role, similarity_score, personalized_similarity_score, score_degraded) 
+                        VALUES (?, ?, ?, ?, ?)
+                    """, (user_id, job_role, similarity_score, personalized_similarity_score,
+                          degraded_flag(similarity_score, personalized_similarity_score)))
             else:
                 # Mark the candidate as pending for future job postings
                 cursor.execute("INSERT INTO pending_candidates (candidate_profile_id) VALUES (?)", (user_id,))
 
             conn.commit()
+        finally:
+            conn.close()
         return True
-    except sqlite3.IntegrityError:
+    except storage.IntegrityError:
         return False
     except Exception as e:
         print(f"Error during registration: {e}")
         return False
 
+def register_candidate(username, password, resume_bytes):
+    """Save the resume and create the account. Returns "created", "taken" or "unreadable"."""
+    file_path = f"resumes/{username}.pdf"
+    with open(file_path, "wb") as f:
+        f.write(resume_bytes)
+
+    # Extract details from the resume using Gemini
+    with open(file_path, "rb") as f:
+        resume_text = input_pdf_text(f)
+
+    # One structured call yields both the profile fields and the persona
+    analysis = analyze_resume(resume_text)
+    if not analysis:
+        return "unreadable"
+
+    extracted_data = profile_fields(analysis)
+    full_name = extracted_data.get("full_name")
+    email = extracted_data.get("email")
+    phone_number = extracted_data.get("phone_number")
+    education = extracted_data.get("education")
+    skills = extracted_data.get("skills")
+    experience = extracted_data.get("experience")
+
+    if register_user(username, password, "candidate", full_name, email, phone_number, education, skills, experience, file_path, None,
+                     evaluation=render_persona_table(analysis)):
+        return "created"
+    return "taken"
+
 def login_user(username, password):
     hashed_password = hash_password(password)
     conn, cursor = initialize_db()
@@ -301,38 +638,507 @@ def get_resume_analysis(candidate_profile_id, job_role):
     finally:
         conn.close()
 
+def get_job_roles_posted_by(user_id):
+    """Roles of the jobs the HR user posted."""
+    conn, cursor = initialize_db()
+    try:
+        cursor.execute("SELECT job_role FROM job_postings WHERE posted_by = ?", (user_id,))
+        return [row[0] for row in cursor.fetchall()]
+    finally:
+        conn.close()
+
+ROADMAP_DRAFT_TTL_SECONDS = int(os.getenv("ROADMAP_DRAFT_TTL_SECONDS", "86400"))
+
+def count_roadmap_candidates(employees_only=False, snapshot=False):
+    """Number of candidates (or employees) Analyze All would process."""
+    conn, cursor = analytics_db() if snapshot else initialize_db()
+    try:
+        cursor.execute("SELECT COUNT(*) FROM candidate_profiles" + (" WHERE is_employee = 1" if employees_only else ""))
+        return cursor.fetchone()[0]
+    finally:
+        conn.close()
+
+def get_roadmap_candidate_chunks(employees_only=False, snapshot=False, chunk_size=None):
+    """
+    Lists of (user_id, full_name, resume_path, skills, experience, education)
+    for every candidate, or only employees, in user_id order.
+    snapshot=True reads through analytics_db().
+    """
+    return _keyset_chunks(
+        "SELECT user_id, full_name, resume_path, skills, experience, education FROM candidate_profiles", "user_id",
+        ("is_employee = 1",) if employees_only else (), snapshot=snapshot, chunk_size=chunk_size,
+    )
+
+def save_roadmap_drafts(run_id, job_role, roadmaps):
+    """Store the {candidate_id: roadmap} generated by an Analyze All run."""
+    conn, cursor = initialize_db()
+    try:
+        cursor.executemany(
+            """INSERT INTO roadmap_drafts (run_id, candidate_id, job_role, roadmap) VALUES (?, ?, ?, ?)
+               ON CONFLICT (run_id, candidate_id) DO UPDATE SET roadmap = excluded.roadmap, created_at = CURRENT_TIMESTAMP""",
+            [(run_id, candidate_id, job_role, roadmap) for candidate_id, roadmap in roadmaps.items()],
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+def get_roadmap_draft_names(run_id):
+    """(candidate_id, full_name) for each roadmap of the run, without the roadmaps themselves."""
+    conn, cursor = initialize_db()
+    try:
+        cursor.execute(
+            """SELECT d.candidate_id, c.full_name FROM roadmap_drafts d
+               JOIN candidate_profiles c ON c.user_id = d.candidate_id
+               WHERE d.run_id = ? ORDER BY d.candidate_id""",
+            (run_id,),
+        )
+        return cursor.fetchall()
+    finally:
+        conn.close()
+
+def get_roadmap_draft(run_id, candidate_id):
+    """The roadmap the run generated for the candidate, or None."""
+    conn, cursor = initialize_db()
+    try:
+        cursor.execute("SELECT roadmap FROM roadmap_drafts WHERE run_id = ? AND candidate_id = ?", (run_id, candidate_id))
+        row = cursor.fetchone()
+        return row[0] if row else None
+    finally:
+        conn.close()
+
+def discard_roadmap_drafts(run_id, max_age_seconds=ROADMAP_DRAFT_TTL_SECONDS):
+    """Delete the run's drafts, and any left behind by sessions older than max_age_seconds."""
+    cutoff = (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=max_age_seconds)).strftime("%Y-%m-%d %H:%M:%S")
+    conn, cursor = initialize_db()
+    try:
+        cursor.execute("DELETE FROM roadmap_drafts WHERE run_id = ? OR created_at < ?", (run_id, cutoff))
+        conn.commit()
+    finally:
+        conn.close()
+
+def notify_roadmap_drafts(run_id):
+    """
+    Send every roadmap of the run as an unread notification, replacing the
+    candidate's earlier one for the same job role. Returns how many were sent.
+    """
+    conn, cursor = initialize_db()
+    try:
+        cursor.execute(
+            """UPDATE roadmap_notifications SET notification_date = CURRENT_TIMESTAMP, is_read = 0,
+                   roadmap = (SELECT d.roadmap FROM roadmap_drafts d WHERE d.run_id = ?
+                              AND d.candidate_id = roadmap_notifications.candidate_id AND d.job_role = roadmap_notifications.job_role)
+               WHERE EXISTS (SELECT 1 FROM roadmap_drafts d WHERE d.run_id = ?
+                             AND d.candidate_id = roadmap_notifications.candidate_id AND d.job_role = roadmap_notifications.job_role)""",
+            (run_id, run_id),
+        )
+        cursor.execute(
+            """INSERT INTO roadmap_notifications (candidate_id, job_role, roadmap, notification_date, is_read)
+               SELECT d.candidate_id, d.job_role, d.roadmap, CURRENT_TIMESTAMP, 0 FROM roadmap_drafts d
+               WHERE d.run_id = ? AND NOT EXISTS (SELECT 1 FROM roadmap_notifications n
+                                                  WHERE n.candidate_id = d.candidate_id AND n.job_role = d.job_role)""",
+            (run_id,),
+        )
+        cursor.execute("SELECT COUNT(*) FROM roadmap_drafts WHERE run_id = ?", (run_id,))
+        sent = cursor.fetchone()[0]
+        conn.commit()
+        return sent
+    finally:
+        conn.close()
+
+def get_persona(candidate_id):
+    """The candidate's persona (stored under the "General" job role), or None."""
+    conn, cursor = initialize_db()
+    try:
+        cursor.execute(
+            "SELECT evaluation FROM resumes WHERE candidate_profile_id = ? AND job_role = ?",
+            (candidate_id, "General"),
+        )
+        row = cursor.fetchone()
+        return row[0] if row else None
+    finally:
+        conn.close()
+
+def get_candidate_analysis(candidate_id, job_role):
+    """(evaluation row, match_response row) for a candidate's application; a row is None when missing."""
+    conn, cursor = initialize_db()
+    try:
+        # Fetch evaluation (persona) independent of job role
+        cursor.execute("SELECT evaluation FROM resumes WHERE candidate_profile_id = ?", (candidate_id,))
+        persona = cursor.fetchone()
+        # Fetch match_response based on job role
+        cursor.execute("SELECT match_response FROM resumes WHERE candidate_profile_id = ? AND job_role = ?", (candidate_id, job_role))
+        return persona, cursor.fetchone()
+    finally:
+        conn.close()
+
+def count_unread_roadmaps(candidate_id):
+    conn, cursor = initialize_db()
+    try:
+        cursor.execute("SELECT COUNT(*) FROM roadmap_notifications WHERE candidate_id = ? AND is_read = 0", (candidate_id,))
+        return cursor.fetchone()[0]
+    finally:
+        conn.close()
+
+def get_applicant_scores(job_role, snapshot=False):
+    """
+    (full_name, email, similarity_score, resume_path, status) for the role's
+    applicants, where status is 'refreshing', 'stale', 'estimated' or None.
+    snapshot=True reads through analytics_db().
+    """
+    conn, cursor = analytics_db() if snapshot else initialize_db()
+    try:
+        cursor.execute('''
+            SELECT candidate_profiles.full_name, candidate_profiles.email, resumes.similarity_score, candidate_profiles.resume_path,
+                   COALESCE(resumes.score_status, CASE WHEN resumes.score_degraded = 1 THEN 'estimated' END)
+            FROM resumes
+            JOIN candidate_profiles ON resumes.candidate_profile_id = candidate_profiles.user_id
+            WHERE resumes.job_role = ? AND resumes.has_applied = 1
+        ''', (job_role,))
+        return cursor.fetchall()
+    finally:
+        conn.close()
+
+def get_applicants(job_role):
+    """(full_name, candidate_id, persona, is_employee) for the role's applicants."""
+    conn, cursor = initialize_db()
+    try:
+        cursor.execute('''
+            SELECT DISTINCT candidate_profiles.full_name, resumes.candidate_profile_id, resumes.evaluation,
+            candidate_profiles.is_employee
+            FROM resumes
+            JOIN candidate_profiles ON resumes.candidate_profile_id = candidate_profiles.user_id
+            WHERE resumes.job_role = ? AND resumes.has_applied = 1
+        ''', (job_role,))
+        return cursor.fetchall()
+    finally:
+        conn.close()
+
+def get_applied_jobs(candidate_id):
+    """(job_role, job_description) for the jobs the candidate applied for."""
+    conn, cursor = initialize_db()
+    try:
+        cursor.execute('''
+            SELECT job_postings.job_role, job_postings.job_description
+            FROM resumes
+            JOIN job_postings ON resumes.job_role = job_postings.job_role
+            WHERE resumes.candidate_profile_id = ? AND resumes.has_applied = 1
+        ''', (candidate_id,))
+        return cursor.fetchall()
+    finally:
+        conn.close()
+
+def has_applied(candidate_id, job_role):
+    conn, cursor = initialize_db()
+    try:
+        cursor.execute(
+            "SELECT has_applied FROM resumes WHERE candidate_profile_id = ? AND job_role = ?",
+            (candidate_id, job_role),
+        )
+        row = cursor.fetchone()
+        return bool(row and row[0] == 1)
+    finally:
+        conn.close()
+
+def get_open_jobs(candidate_id, job_type=None, min_duration=None, limit=10, offset=0):
+    """
+    (jobs, total) for the jobs the candidate has not applied for, optionally of
+    one job type and lasting at least min_duration months. jobs holds one page of
+    (job_id, job_role, job_description, job_type, internship_duration); total
+    counts every match.
+    """
+    where = """
+        FROM job_postings
+        WHERE job_role NOT IN (
+            SELECT job_role FROM resumes WHERE candidate_profile_id = ? AND has_applied = 1
+        )
+    """
+    params = [candidate_id]
+    if job_type:
+        where += " AND job_type = ?"
+        params.append(job_type)
+    if min_duration:
+        where += " AND (internship_duration >= ? OR internship_duration IS NULL)"
+        params.append(min_duration)
+    conn, cursor = initialize_db()
+    try:
+        cursor.execute("SELECT job_id, job_role, job_description, job_type, internship_duration" + where + " LIMIT ? OFFSET ?",
+                       tuple(params) + (limit, offset))
+        jobs = cursor.fetchall()
+        cursor.execute("SELECT COUNT(*)" + where, tuple(params))
+        return jobs, cursor.fetchone()[0]
+    finally:
+        conn.close()
+
+def start_application(candidate_id, job_role):
+    """
+    (match_response, roadmap) of an earlier complete application for the role,
+    which is marked applied again, or None when the analysis still has to be
+    generated and stored with save_application.
+    """
+    conn, cursor = initialize_db()
+    try:
+        cursor.execute(
+            "SELECT match_response, roadmap FROM resumes WHERE candidate_profile_id = ? AND job_role = ?",
+            (candidate_id, job_role),
+        )
+        row = cursor.fetchone()
+        if not (row and row[0] and row[1]):
+            return None
+        cursor.execute(
+            "UPDATE resumes SET has_applied = 1, application_date = ? WHERE candidate_profile_id = ? AND job_role = ?",
+            (datetime.datetime.now(), candidate_id, job_role),
+        )
+        conn.commit()
+        return row
+    finally:
+        conn.close()
+
+def save_application(candidate_id, job_role, match_response, roadmap):
+    """Mark the candidate as applied for the role with the generated analysis."""
+    conn, cursor = initialize_db()
+    try:
+        cursor.execute(
+            "UPDATE resumes SET has_applied = 1, application_date = ?, match_response = ?, roadmap = ? WHERE candidate_profile_id = ? AND job_role = ?",
+            (datetime.datetime.now(), match_response, roadmap, candidate_id, job_role),
+        )
+        if cursor.rowcount == 0:
+            cursor.execute(
+                "INSERT INTO resumes (candidate_profile_id, job_role, application_date, has_applied, match_response, roadmap) VALUES (?, ?, ?, ?, ?, ?)",
+                (candidate_id, job_role, datetime.datetime.now(), 1, match_response, roadmap),
+            )
+        conn.commit()
+    finally:
+        conn.close()
+
+def get_resume_state(candidate_id):
+    """(resume_hash, text_hash, resume_text, skills, experience, education) used to tell whether a new resume changes anything."""
+    conn, cursor = initialize_db()
+    try:
+        cursor.execute(
+            "SELECT resume_hash, text_hash, resume_text, skills, experience, education FROM candidate_profiles WHERE user_id = ?",
+            (candidate_id,),
+        )
+        return cursor.fetchone()
+    finally:
+        conn.close()
+
+def update_resume_path(candidate_id, resume_path, resume_hash):
+    """Point the profile at a re-uploaded resume whose content is unchanged."""
+    conn, cursor = initialize_db()
+    try:
+        cursor.execute("UPDATE candidate_profiles SET resume_path = ?, resume_hash = ? WHERE user_id = ?",
+                       (resume_path, resume_hash, candidate_id))
+        conn.commit()
+    finally:
+        conn.close()
+
+def update_candidate_resume(candidate_id, resume_path, fields, resume_text, resume_hash, new_text_hash, evaluation, refreshing):
+    """
+    Store the persona and profile fields extracted from a new resume, and flag
+    the candidate's scores as refreshing when they have to be recomputed.
+    """
+    conn, cursor = initialize_db()
+    try:
+        # Update the evaluation in the resumes table for the "General" job role
+        cursor.execute(
+            "UPDATE resumes SET evaluation = ? WHERE candidate_profile_id = ? AND job_role = ?",
+            (evaluation, candidate_id, "General"),
+        )
+        # Update the resume path and extracted fields in the candidate_profiles table
+        cursor.execute(
+            "UPDATE candidate_profiles SET resume_path = ?, phone_number = ?, education = ?, skills = ?, experience = ?, resume_text = ?, resume_hash = ?, text_hash = ? WHERE user_id = ?",
+            (resume_path, fields["phone_number"], fields["education"], fields["skills"], fields["experience"],
+             normalize(resume_text), resume_hash, new_text_hash, candidate_id),
+        )
+        store_candidate_skills(cursor, candidate_id, fields["skills"], resume_text)
+        if refreshing:
+            mark_scores_refreshing(cursor, candidate_id)
+        conn.commit()
+    finally:
+        conn.close()
+
+@tracing.traced("action.process_pending_scores")
+@llm_priority(BATCH)
 def process_pending_scores():
+    """
+    Score each pending candidate against every job, a chunk of candidates at a
+    time, and take the scored candidates off the pending list.
+    """
     conn, cursor = initialize_db()
+    try:
+        cursor.execute("SELECT job_role, job_description FROM job_postings")
+        job_postings = cursor.fetchall()
+    finally:
+        conn.close()
+
+    chunks = _keyset_chunks(
+        """SELECT p.candidate_profile_id, c.resume_path, c.skills, c.experience, c.education
+           FROM pending_candidates p JOIN candidate_profiles c ON c.user_id = p.candidate_profile_id""",
+        "p.candidate_profile_id",
+    )
+    for _, _, errors in batch.process_chunks(chunks, partial(_score_pending_candidate, job_postings), _store_pending_scores):
+        for candidate_id, error in errors.items():
+            if isinstance(error, FileNotFoundError):
+                print(f"Resume file not found for candidate ID {candidate_id}")
+            else:
+                print(f"Scoring pending candidate {candidate_id} failed: {error}")
+
+def _read_resume_file(resume_path, skills, experience, education):
+    with open(resume_path, "rb") as f:
+        resume_text = f.read().decode('utf-8', errors='ignore')
+    return candidate_text(resume_text, skills, experience, education)
+
+def _score_pending_candidate(job_postings, row):
+    """[(job_role, similarity_score, personalized_similarity_score)] for one pending candidate row."""
+    _, resume_path, skills, experience, education = row
+    candidate = _read_resume_file(resume_path, skills, experience, education)
+    return [
+        (job_role, calculate_similarity_score(candidate, job_description), calculate_similarity_score_simple(candidate, job_description))
+        for job_role, job_description in job_postings
+    ]
+
+def _store_pending_scores(scores):
+    conn, cursor = initialize_db()
+    try:
+        cursor.executemany("""
+            INSERT INTO resumes (candidate_profile_id, job_role, similarity_score, personalized_similarity_score, score_degraded) 
+            VALUES (?, ?, ?, ?, ?)
+        """ + on_resume_conflict(
+            "DO UPDATE SET similarity_score = excluded.similarity_score, "
+            "personalized_similarity_score = excluded.personalized_similarity_score, score_degraded = excluded.score_degraded"
+        ), [
+            (candidate_id, job_role, similarity_score, personalized_similarity_score,
+             degraded_flag(similarity_score, personalized_similarity_score))
+            for candidate_id, rows in scores.items()
+            for job_role, similarity_score, personalized_similarity_score in rows
+        ])
+        cursor.executemany("DELETE FROM pending_candidates WHERE candidate_profile_id = ?", [(candidate_id,) for candidate_id in scores])
+        conn.commit()
+    finally:
+        conn.close()
 
-    # Process pending candidates
-    cursor.execute("SELECT candidate_profile_id FROM pending_candidates")
-    pending_candidates = cursor.fetchall()
+# Score refreshes run off the request thread; they fan out on the LLM pool themselves
+RESCORE_WORKERS = int(os.getenv("RESCORE_WORKERS", "2"))
+_rescore_executor = ThreadPoolExecutor(max_workers=RESCORE_WORKERS, thread_name_prefix="rescore")
+# candidate_id -> generation of the newest queued rescore, until that rescore commits.
+# Generations come from one counter, so one is never reused for a candidate.
+_rescore_generations = {}
+_rescore_counter = itertools.count(1)
+_rescore_lock = threading.Lock()
 
-    cursor.execute("SELECT job_role, job_description FROM job_postings")
-    job_postings = cursor.fetchall()
+def degraded_flag(*scores):
+    """1 if any of the scores is a local estimate made while the LLM was unavailable, else 0."""
+    return int(any(is_degraded(score) for score in scores))
+
+def mark_scores_refreshing(cursor, candidate_id):
+    """Flag the candidate's job scores as refreshing; the old values stay readable until replaced."""
+    cursor.execute(
+        "UPDATE resumes SET score_status = 'refreshing' WHERE candidate_profile_id = ? AND job_role != 'General'",
+        (candidate_id,),
+    )
+
+def enqueue_rescore(candidate_id, candidate):
+    """
+    Rescore the candidate against every job in the background and return the
+    Future. If the candidate is updated again before it finishes, only the
+    newest rescore writes its scores.
+    """
+    with _rescore_lock:
+        generation = next(_rescore_counter)
+        _rescore_generations[candidate_id] = generation
+    context = contextvars.copy_context()
+    return _rescore_executor.submit(context.run, rescore_candidate, candidate_id, candidate, generation)
 
-    for candidate_id, in pending_candidates:
-        cursor.execute("SELECT resume_path FROM candidate_profiles WHERE user_id = ?", (candidate_id,))
-        resume_path = cursor.fetchone()[0]
+@tracing.traced("action.rescore_candidate")
+@llm_priority(BATCH)
+def rescore_candidate(candidate_id, candidate, generation=None):
+    """
+    Recompute the candidate's similarity score for every job and clear the
+    refreshing flag. Scores whose call failed keep their old value, flagged 'stale'.
+    """
+    conn, cursor = initialize_db()
+    try:
+        cursor.execute("SELECT job_role, job_description FROM job_postings")
+        job_postings = cursor.fetchall()
+    finally:
+        # The connection goes back to the pool while the scores are computed
+        conn.close()
+    results, errors = fan_out({
+        job_role: partial(calculate_similarity_score, candidate, job_description)
+        for job_role, job_description in job_postings
+    })
+    for job_role, error in errors.items():
+        print(f"Rescoring candidate {candidate_id} for {job_role} failed: {error}")
+    # The lock is held through the commit, so a newer update cannot queue its
+    # rescore between the generation check and these writes
+    with _rescore_lock:
+        if generation is not None and _rescore_generations.get(candidate_id) != generation:
+            # A newer profile update has queued its own rescore
+            return False
+        conn, cursor = initialize_db()
         try:
-            with open(resume_path, "rb") as f:
-                resume_text = f.read().decode('utf-8', errors='ignore')
-            for job_role, job_description in job_postings:
-                # Calculate both scores
-                similarity_score = calculate_similarity_score(resume_text, job_description)
-                personalized_similarity_score = calculate_similarity_score_simple(resume_text, job_description)
-
-                # Store both scores in the database
-                cursor.execute("""
-                    INSERT INTO resumes (candidate_profile_id, job_role, similarity_score, personalized_similarity_score) 
-                    VALUES (?, ?, ?, ?)
-                """, (candidate_id, job_role, similarity_score, personalized_similarity_score))
-            cursor.execute("DELETE FROM pending_candidates WHERE candidate_profile_id = ?", (candidate_id,))
-        except FileNotFoundError:
-            print(f"Resume file not found for candidate ID {candidate_id}")
+            for job_role, _ in job_postings:
+                if job_role in results:
+                    cursor.execute(
+                        "UPDATE resumes SET similarity_score = ?, score_status = NULL, score_degraded = ? WHERE candidate_profile_id = ? AND job_role = ?",
+                        (results[job_role], degraded_flag(results[job_role]), candidate_id, job_role),
+                    )
+                else:
+                    cursor.execute(
+                        "UPDATE resumes SET score_status = 'stale' WHERE candidate_profile_id = ? AND job_role = ?",
+                        (candidate_id, job_role),
+                    )
+            conn.commit()
+        finally:
+            conn.close()
+        if generation is not None:
+            # No newer rescore is queued, so the entry is no longer needed
+            del _rescore_generations[candidate_id]
+        return True
 
-    conn.commit()
-    conn.close()
+def get_score_statuses(job_role):
+    """
+    {candidate_id: status} for the role's scores that are refreshing, stale or
+    estimated (scored locally while the LLM was unavailable).
+    """
+    conn, cursor = initialize_db()
+    try:
+        cursor.execute(
+            """SELECT candidate_profile_id, COALESCE(score_status, 'estimated') FROM resumes
+               WHERE job_role = ? AND (score_status IS NOT NULL OR score_degraded = 1)""",
+            (job_role,),
+        )
+        return dict(cursor.fetchall())
+    finally:
+        conn.close()
+
+def get_idempotent_result(key, max_age_seconds):
+    """Stored JSON result for an idempotency key younger than max_age_seconds, or None."""
+    # created_at defaults to CURRENT_TIMESTAMP, which is UTC
+    cutoff = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=max_age_seconds)
+    conn, cursor = initialize_db()
+    try:
+        cursor.execute(
+            "SELECT result FROM idempotency_keys WHERE idempotency_key = ? AND created_at >= ?",
+            (key, cutoff.strftime("%Y-%m-%d %H:%M:%S")),
+        )
+        row = cursor.fetchone()
+        return row[0] if row else None
+    finally:
+        conn.close()
+
+def store_idempotent_result(key, action, result):
+    conn, cursor = initialize_db()
+    try:
+        cursor.execute(
+            """INSERT INTO idempotency_keys (idempotency_key, action, result) VALUES (?, ?, ?)
+               ON CONFLICT (idempotency_key) DO UPDATE
+               SET action = excluded.action, result = excluded.result, created_at = CURRENT_TIMESTAMP""",
+            (key, action, result),
+        )
+        conn.commit()
+    finally:
+        conn.close()
 
 def get_candidate_roadmaps(candidate_id):
     conn, cursor = initialize_db()
@@ -401,4 +1207,378 @@ def is_employee(user_id):
     cursor.execute("SELECT is_employee FROM candidate_profiles WHERE user_id = ?", (user_id,))
     result = cursor.fetchone()
     conn.close()
-    return result[0] == 1 if result else False
\ No newline at end of file
+    return result[0] == 1 if result else False
+
+@tracing.traced("action.post_job_opening")
+@llm_priority(BATCH)
+def post_job_opening(job_role, job_description, job_type, internship_duration, posted_by):
+    """
+    Insert a new job posting, then score every existing candidate against it
+    a chunk at a time (see batch.py).
+    Returns False if the job role already exists.
+    """
+    conn, cursor = initialize_db()
+    try:
+        # Check if the job role already exists
+        cursor.execute("SELECT job_id FROM job_postings WHERE job_role = ?", (job_role,))
+        if cursor.fetchone():
+            return False
+
+        # Insert the new job posting
+        job_id = storage.insert_returning_id(
+            cursor,
+            "INSERT INTO job_postings (job_role, job_description, job_type, internship_duration, posted_by) VALUES (?, ?, ?, ?, ?)",
+            (job_role, job_description, job_type, internship_duration, posted_by),
+            "job_id",
+        )
+        store_job_skills(cursor, job_id, job_description)
+        conn.commit()
+    finally:
+        conn.close()
+
+    # Score the existing candidates a chunk at a time; each chunk is stored as it finishes
+    chunks = _keyset_chunks("SELECT user_id, resume_path, skills, experience, education FROM candidate_profiles", "user_id")
+    seen = 0
+    for chunk, _, errors in batch.process_chunks(
+        chunks, partial(_score_candidate_for_job, job_description), partial(_store_job_scores, job_role),
+    ):
+        seen += len(chunk)
+        for candidate_id, error in errors.items():
+            if isinstance(error, FileNotFoundError):
+                print(f"Resume file not found for candidate ID {candidate_id}")
+            else:
+                print(f"Scoring candidate {candidate_id} for {job_role} failed: {error}")
+
+    if not seen:
+        # Mark the job posting as pending for future candidates
+        conn, cursor = initialize_db()
+        try:
+            cursor.execute("INSERT INTO pending_jobs (job_role) VALUES (?)", (job_role,))
+            conn.commit()
+        finally:
+            conn.close()
+    return True
+
+def _score_candidate_for_job(job_description, row):
+    _, resume_path, skills, experience, education = row
+    return calculate_similarity_score(_read_resume_file(resume_path, skills, experience, education), job_description)
+
+def _store_job_scores(job_role, scores):
+    conn, cursor = initialize_db()
+    try:
+        # A candidate who registered after the posting was committed already has a score for it
+        cursor.executemany(
+            "INSERT INTO resumes (candidate_profile_id, job_role, similarity_score, score_degraded) VALUES (?, ?, ?, ?)"
+            + on_resume_conflict("DO NOTHING"),
+            [(candidate_id, job_role, score, degraded_flag(score)) for candidate_id, score in scores.items()],
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+def get_candidate_documents(candidate_ids=None):
+    """
+    (user_id, full_name, email, skills, experience, education, resume_text) for
+    every candidate (or only the given ones), as the corpus for local ranking.
+    """
+    conn, cursor = initialize_db()
+    try:
+        query = "SELECT user_id, full_name, email, skills, experience, education, resume_text FROM candidate_profiles"
+        if candidate_ids is None:
+            cursor.execute(query)
+            return cursor.fetchall()
+        rows = []
+        candidate_ids = list(candidate_ids)
+        for start in range(0, len(candidate_ids), 500):
+            chunk = candidate_ids[start:start + 500]
+            cursor.execute(query + " WHERE user_id IN (%s)" % ", ".join("?" * len(chunk)), chunk)
+            rows.extend(cursor.fetchall())
+        return rows
+    finally:
+        conn.close()
+
+def get_candidate_corpus_version():
+    """Cheap (count, max id) check used to notice new candidates without reloading the corpus."""
+    conn, cursor = initialize_db()
+    try:
+        cursor.execute("SELECT COUNT(*), MAX(user_id) FROM candidate_profiles")
+        return cursor.fetchone()
+    finally:
+        conn.close()
+
+def get_candidate_skill_rows():
+    """(candidate_id, canonical skill name) for every candidate skill, to build the in-memory skill index."""
+    conn, cursor = initialize_db()
+    try:
+        cursor.execute('''
+            SELECT candidate_skills.candidate_id, skills.name
+            FROM candidate_skills
+            JOIN skills ON skills.skill_id = candidate_skills.skill_id
+            ORDER BY candidate_skills.candidate_id
+        ''')
+        return cursor.fetchall()
+    finally:
+        conn.close()
+
+def get_candidate_skills_version():
+    """
+    Cheap (count, max rowid) check on candidate_skills. Links are replaced rather
+    than updated in place, so any change to a candidate's skills moves it.
+    PostgreSQL has no rowid; the newest row version's transaction id moves the same way.
+    """
+    conn, cursor = initialize_db()
+    try:
+        if storage.dialect() == "postgresql":
+            cursor.execute("SELECT COUNT(*), MAX(xmin::text::bigint) FROM candidate_skills")
+        else:
+            cursor.execute("SELECT COUNT(*), MAX(rowid) FROM candidate_skills")
+        return cursor.fetchone()
+    finally:
+        conn.close()
+
+def get_all_scores():
+    """
+    (last change id, rows) where rows are (candidate_id, job_role, similarity_score)
+    for every stored job score, oldest first, to rebuild the score matrix.
+    """
+    conn, cursor = initialize_db()
+    try:
+        cursor.execute("SELECT COALESCE(MAX(change_id), 0) FROM score_changes")
+        last_change_id = cursor.fetchone()[0]
+        cursor.execute("SELECT candidate_profile_id, job_role, similarity_score FROM resumes WHERE job_role != 'General' ORDER BY id")
+        return last_change_id, cursor.fetchall()
+    finally:
+        conn.close()
+
+def get_score_changes(after_change_id):
+    """
+    (last change id, rows) where rows are (change_id, candidate_id, job_role,
+    similarity_score) for score writes after after_change_id, oldest first.
+    """
+    conn, cursor = initialize_db()
+    try:
+        cursor.execute("SELECT COALESCE(MAX(change_id), 0) FROM score_changes")
+        last_change_id = cursor.fetchone()[0]
+        cursor.execute(
+            "SELECT change_id, candidate_id, job_role, similarity_score FROM score_changes WHERE change_id > ? ORDER BY change_id",
+            (after_change_id,),
+        )
+        return last_change_id, cursor.fetchall()
+    finally:
+        conn.close()
+
+def prune_score_changes(before_change_id):
+    """Drop applied score changes. The newest one is kept so a reset database can be told apart from a synced one."""
+    conn, cursor = initialize_db()
+    try:
+        cursor.execute("DELETE FROM score_changes WHERE change_id < ?", (before_change_id,))
+        conn.commit()
+    finally:
+        conn.close()
+
+def get_candidate_names(candidate_ids, snapshot=False):
+    """
+    {user_id: (full_name, email, resume_path)} for the given candidates.
+    snapshot=True reads through analytics_db(); candidates newer than the
+    snapshot are then looked up in the live database.
+    """
+    candidate_ids = list(candidate_ids)
+    if snapshot:
+        names = _candidate_names(analytics_db(), candidate_ids)
+        missing = [user_id for user_id in candidate_ids if user_id not in names]
+        if missing:
+            names.update(_candidate_names(initialize_db(), missing))
+        return names
+    return _candidate_names(initialize_db(), candidate_ids)
+
+
+def _candidate_names(db, candidate_ids):
+    conn, cursor = db
+    try:
+        names = {}
+        # Stay well under SQLite's bound-parameter limit
+        for start in range(0, len(candidate_ids), 500):
+            chunk = candidate_ids[start:start + 500]
+            cursor.execute(
+                "SELECT user_id, full_name, email, resume_path FROM candidate_profiles WHERE user_id IN (%s)" % ", ".join("?" * len(chunk)),
+                chunk,
+            )
+            names.update((row[0], row[1:]) for row in cursor.fetchall())
+        return names
+    finally:
+        conn.close()
+
+def get_job_description(job_role):
+    conn, cursor = initialize_db()
+    try:
+        cursor.execute("SELECT job_description FROM job_postings WHERE job_role = ?", (job_role,))
+        row = cursor.fetchone()
+        return row[0] if row else None
+    finally:
+        conn.close()
+
+# Recently used roadmap plans, so a batch over many candidates does not reopen the database per candidate
+ROADMAP_PLAN_CACHE_SIZE = 1024
+_roadmap_plans = {}
+_roadmap_plans_lock = threading.Lock()
+
+def _remember_roadmap_plan(key, roadmap):
+    with _roadmap_plans_lock:
+        if len(_roadmap_plans) >= ROADMAP_PLAN_CACHE_SIZE:
+            # Dicts keep insertion order, so this evicts the oldest plan
+            _roadmap_plans.pop(next(iter(_roadmap_plans)))
+        _roadmap_plans[key] = roadmap
+
+def job_description_hash(job_description):
+    """Hash of a job description, ignoring whitespace and case."""
+    return hashlib.sha256(" ".join(job_description.split()).lower().encode()).hexdigest()[:16]
+
+@tracing.traced("action.gap_roadmap")
+def candidate_roadmap(resume_path, skills, experience, education, job_description):
+    """
+    Roadmap JSON for one candidate and job, or None if it could not be generated.
+    Uses the shared plan for the candidate's skill gap when the job names known
+    skills, and a full per-candidate roadmap otherwise. A gap plan that fails
+    is not retried as a full roadmap, which would double the calls to an
+    upstream that is already failing.
+    """
+    # The profile fields are enough for the skill gap; only parse the
+    # resume when the profile has none
+    candidate_skills = f"{skills or ''}\n{experience or ''}".strip()
+    resume_text = None
+    if not candidate_skills:
+        with open(resume_path, "rb") as f:
+            resume_text = input_pdf_text(f)
+        candidate_skills = resume_text
+
+    if extract_skills(job_description):
+        return get_gap_roadmap(candidate_skills, job_description)
+    return generate_roadmap_for_candidate(candidate_text(resume_text, skills, experience, education), job_description)
+
+def get_gap_roadmap(candidate_skills, job_description):
+    """
+    Roadmap for the skills the job asks for that candidate_skills does not
+    mention. Plans are cached per (gap signature, job description hash), so
+    candidates sharing a gap for the same job share one LLM call.
+    Returns None when the plan could not be generated, or when the job
+    description names no known skills; callers that want a full per-candidate
+    roadmap for such jobs check extract_skills first.
+    """
+    if not extract_skills(job_description):
+        return None
+    missing_skills = skill_gap(candidate_skills, job_description)
+    key = (gap_signature(missing_skills), job_description_hash(job_description))
+    if key in _roadmap_plans:
+        LLM_METRICS.record_cache("roadmap", hit=True)
+        return _roadmap_plans[key]
+
+    conn, cursor = initialize_db()
+    try:
+        cursor.execute("SELECT roadmap FROM roadmap_plans WHERE gap_signature = ? AND jd_hash = ?", key)
+        row = cursor.fetchone()
+    finally:
+        conn.close()
+    LLM_METRICS.record_cache("roadmap", hit=row is not None)
+    if row:
+        _remember_roadmap_plan(key, row[0])
+        return row[0]
+
+    # The connection goes back to the pool while the plan is generated
+    roadmap = generate_gap_roadmap(missing_skills, job_description)
+    if roadmap is not None:
+        conn, cursor = initialize_db()
+        try:
+            cursor.execute(
+                """INSERT INTO roadmap_plans (gap_signature, jd_hash, roadmap) VALUES (?, ?, ?)
+                   ON CONFLICT (gap_signature, jd_hash) DO UPDATE SET roadmap = excluded.roadmap, created_at = CURRENT_TIMESTAMP""",
+                key + (roadmap,),
+            )
+            conn.commit()
+        finally:
+            conn.close()
+        _remember_roadmap_plan(key, roadmap)
+    return roadmap
+
+def _quote_search_terms(query):
+    """Fallback for input that is not valid FTS5 syntax (e.g. C#): match every term literally."""
+    terms = []
+    for term in query.split():
+        if term in ("AND", "OR", "NOT"):
+            terms.append(term)
+        else:
+            terms.append('"%s"' % term.replace('"', '""'))
+    return " ".join(terms)
+
+def _search_postgres(cursor, search_table, columns, snippet_column, query, page, page_size):
+    # websearch_to_tsquery takes "phrases", OR and -negation, and accepts any input
+    base_table, _, _ = SEARCH_TABLES[search_table]
+    document = search_document(search_table)
+    cursor.execute(f"SELECT COUNT(*) FROM {base_table} WHERE {document} @@ websearch_to_tsquery('english', ?)", (query,))
+    total = cursor.fetchone()[0]
+    cursor.execute(f'''
+        SELECT {columns}, ts_headline('english', COALESCE({snippet_column}, ''), terms, 'StartSel=**, StopSel=**, MaxWords=16, MinWords=8')
+        FROM {base_table}, websearch_to_tsquery('english', ?) AS terms
+        WHERE {document} @@ terms
+        ORDER BY ts_rank({document}, terms) DESC
+        LIMIT ? OFFSET ?
+    ''', (query, page_size, (page - 1) * page_size))
+    return cursor.fetchall(), total
+
+def _search(cursor, select, search_table, query, page, page_size):
+    # Operators (AND, OR, NOT), "phrases" and prefix* queries follow FTS5 syntax
+    for match in (query, _quote_search_terms(query)):
+        try:
+            cursor.execute(f"SELECT COUNT(*) FROM {search_table} WHERE {search_table} MATCH ?", (match,))
+            total = cursor.fetchone()[0]
+            cursor.execute(select + " LIMIT ? OFFSET ?", (match, page_size, (page - 1) * page_size))
+            return cursor.fetchall(), total
+        except storage.Error as e:
+            if "fts5" not in str(e) and "syntax" not in str(e):
+                raise
+    return [], 0
+
+@tracing.traced("db.search_candidates")
+def search_candidates(query, page=1, page_size=20):
+    """
+    Full-text search over candidate names, skills, experience, education and
+    resume text. Returns (rows, total) where rows are
+    (user_id, full_name, email, skills, snippet) best match first; skills
+    matches weigh most.
+    """
+    conn, cursor = initialize_db()
+    try:
+        if storage.dialect() == "postgresql":
+            return _search_postgres(cursor, "candidate_search", "user_id, full_name, email, skills", "resume_text",
+                                    query, page, page_size)
+        return _search(cursor, '''
+            SELECT candidate_profiles.user_id, candidate_profiles.full_name, candidate_profiles.email,
+                   candidate_profiles.skills, snippet(candidate_search, 4, '**', '**', '…', 16)
+            FROM candidate_search
+            JOIN candidate_profiles ON candidate_profiles.user_id = candidate_search.rowid
+            WHERE candidate_search MATCH ?
+            ORDER BY bm25(candidate_search, 1.0, 4.0, 2.0, 1.0, 1.0)
+        ''', "candidate_search", query, page, page_size)
+    finally:
+        conn.close()
+
+@tracing.traced("db.search_jobs")
+def search_jobs(query, page=1, page_size=20):
+    """
+    Full-text search over job roles and descriptions. Returns (rows, total)
+    where rows are (job_id, job_role, job_type, snippet) best match first.
+    """
+    conn, cursor = initialize_db()
+    try:
+        if storage.dialect() == "postgresql":
+            return _search_postgres(cursor, "job_search", "job_id, job_role, job_type", "job_description",
+                                    query, page, page_size)
+        return _search(cursor, '''
+            SELECT job_postings.job_id, job_postings.job_role, job_postings.job_type,
+                   snippet(job_search, 1, '**', '**', '…', 16)
+            FROM job_search
+            JOIN job_postings ON job_postings.job_id = job_search.rowid
+            WHERE job_search MATCH ?
+            ORDER BY bm25(job_search, 2.0, 1.0)
+        ''', "job_search", query, page, page_size)
+    finally:
+        conn.close()
@@ -0,0 +1,260 @@
+"""
+SQL query profiler.
+
+`connect()` returns a sqlite3 connection whose cursors time every statement
+(storage.py wraps PostgreSQL connections the same way),
+group statements by a normalized fingerprint and count rows. Statements slower
+than SLOW_QUERY_MS are printed together with their EXPLAIN QUERY PLAN and kept
+in a small in-memory slow-query log. Per-rerun counters let the UI show how many
+statements and connections a single page render produced.
+"""
+import contextvars
+import functools
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+
+import tracing
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+SLOW_QUERY_LOG_SIZE = 100
+
+_current_rerun = contextvars.ContextVar("sql_rerun_stats", default=None)
+
+
+@functools.lru_cache(maxsize=1024)
+def fingerprint(sql):
+    """Normalize a statement so queries differing only in literals group together."""
+    normalized = re.sub(r"'(?:[^']|'')*'", "?", sql)
+    normalized = re.sub(r"\b\d+(?:\.\d+)?\b", "?", normalized)
+    normalized = re.sub(r"\s+", " ", normalized).strip()
+    return normalized
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+
+    def add(self, elapsed_ms, rows):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.rows += rows
+
+
+class RerunStats:
+    """Statement and connection counters for one Streamlit rerun."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.connections = 0
+        self.statements = 0
+        self.total_ms = 0.0
+        self.queries = {}
+
+    def summary(self, top=5):
+        ranked = sorted(self.queries.items(), key=lambda item: item[1].total_ms, reverse=True)
+        return {
+            "connections": self.connections,
+            "statements": self.statements,
+            "sql_ms": self.total_ms,
+            "render_ms": (time.perf_counter() - self.started) * 1000.0,
+            "top_queries": [
+                {"fingerprint": fp, "count": stats.count, "total_ms": stats.total_ms, "rows": stats.rows}
+                for fp, stats in ranked[:top]
+            ],
+        }
+
+
+class QueryProfiler:
+    """Process-wide aggregate of statement timings and the slow-query log."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.queries = {}
+        self.connections = 0
+        self.slow_queries = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+
+    def record_connection(self):
+        with self._lock:
+            self.connections += 1
+        rerun = _current_rerun.get()
+        if rerun is not None:
+            rerun.connections += 1
+
+    def record(self, sql, elapsed_ms, rows):
+        fp = fingerprint(sql)
+        with self._lock:
+            self.queries.setdefault(fp, QueryStats()).add(elapsed_ms, rows)
+        rerun = _current_rerun.get()
+        if rerun is not None:
+            rerun.statements += 1
+            rerun.total_ms += elapsed_ms
+            rerun.queries.setdefault(fp, QueryStats()).add(elapsed_ms, rows)
+
+    def record_slow(self, sql, elapsed_ms, plan):
+        entry = {
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "elapsed_ms": elapsed_ms,
+            "fingerprint": fingerprint(sql),
+            "plan": plan,
+            "trace_id": tracing.current_trace_id(),
+        }
+        with self._lock:
+            self.slow_queries.append(entry)
+        print(f"Slow query ({elapsed_ms:.1f} ms, trace {entry['trace_id']}): {entry['fingerprint']}")
+        for line in plan:
+            print(f"    {line}")
+
+    def top_queries(self, limit=20):
+        with self._lock:
+            ranked = sorted(self.queries.items(), key=lambda item: item[1].total_ms, reverse=True)
+            return [
+                {"fingerprint": fp, "count": stats.count, "total_ms": stats.total_ms,
+                 "max_ms": stats.max_ms, "rows": stats.rows}
+                for fp, stats in ranked[:limit]
+            ]
+
+
+PROFILER = QueryProfiler()
+
+
+def begin_rerun():
+    """Start counting statements for the current script run."""
+    _current_rerun.set(RerunStats())
+
+
+def rerun_summary():
+    rerun = _current_rerun.get()
+    return rerun.summary() if rerun is not None else None
+
+
+class ProfiledCursor:
+    def __init__(self, cursor, connection):
+        self._cursor = cursor
+        self._connection = connection
+        self._last_sql = None
+        self._last_parameters = ()
+        self._last_ms = 0.0
+        self._slow_logged = False
+
+    def execute(self, sql, parameters=()):
+        with tracing.span("db.query", kind="SPAN_KIND_CLIENT", statement=fingerprint(sql)):
+            start = time.perf_counter()
+            self._cursor.execute(sql, parameters)
+            elapsed_ms = (time.perf_counter() - start) * 1000.0
+        PROFILER.record(sql, elapsed_ms, max(self._cursor.rowcount, 0))
+        self._last_sql = sql
+        self._last_parameters = parameters
+        self._last_ms = elapsed_ms
+        self._slow_logged = False
+        self._check_slow()
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        self._cursor.executemany(sql, seq_of_parameters)
+        elapsed_ms = (time.perf_counter() - start) * 1000.0
+        PROFILER.record(sql, elapsed_ms, max(self._cursor.rowcount, 0))
+        self._last_sql = None
+        return self
+
+    def _check_slow(self):
+        if not self._slow_logged and self._last_ms >= SLOW_QUERY_MS:
+            self._slow_logged = True
+            PROFILER.record_slow(self._last_sql, self._last_ms,
+                                 self._connection.explain(self._last_sql, self._last_parameters))
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = self._cursor.fetchone()
+        self._account_fetch([row] if row is not None else [], (time.perf_counter() - start) * 1000.0)
+        return row
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = self._cursor.fetchall()
+        elapsed_ms = (time.perf_counter() - start) * 1000.0
+        self._account_fetch(rows, elapsed_ms)
+        return rows
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = self._cursor.fetchmany(size) if size is not None else self._cursor.fetchmany()
+        elapsed_ms = (time.perf_counter() - start) * 1000.0
+        self._account_fetch(rows, elapsed_ms)
+        return rows
+
+    def _account_fetch(self, rows, elapsed_ms):
+        # SQLite steps SELECTs lazily, so much of their cost lands in the fetch.
+        if self._last_sql is None:
+            return
+        fp = fingerprint(self._last_sql)
+        with PROFILER._lock:
+            stats = PROFILER.queries.get(fp)
+            if stats is not None:
+                stats.total_ms += elapsed_ms
+                stats.rows += len(rows)
+        rerun = _current_rerun.get()
+        if rerun is not None:
+            rerun.total_ms += elapsed_ms
+            stats = rerun.queries.get(fp)
+            if stats is not None:
+                stats.total_ms += elapsed_ms
+                stats.rows += len(rows)
+        self._last_ms += elapsed_ms
+        self._check_slow()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class ProfiledConnection:
+    def __init__(self, connection):
+        self._connection = connection
+        PROFILER.record_connection()
+
+    def cursor(self):
+        return ProfiledCursor(self._connection.cursor(), self)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def explain(self, sql, parameters):
+        if not sql.lstrip().upper().startswith(("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")):
+            return []
+        # The caller's transaction is still open. On PostgreSQL a failed statement
+        # aborts it, so the EXPLAIN runs in a savepoint that is undone on error.
+        self._connection.execute("SAVEPOINT explain_slow_query")
+        try:
+            rows = self._connection.execute("EXPLAIN QUERY PLAN " + sql, parameters).fetchall()
+            return [row[-1] for row in rows]
+        except Exception as e:  # sqlite3.Error, or the PostgreSQL driver's error (see storage.py)
+            self._connection.execute("ROLLBACK TO SAVEPOINT explain_slow_query")
+            return [f"EXPLAIN failed: {e}"]
+        finally:
+            self._connection.execute("RELEASE SAVEPOINT explain_slow_query")
+
+    def __enter__(self):
+        self._connection.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return self._connection.__exit__(exc_type, exc_value, traceback)
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+def connect(database, **kwargs):
+    """sqlite3.connect() returning a profiled connection."""
+    return ProfiledConnection(sqlite3.connect(database, **kwargs))
@@ -4,16 +4,38 @@ import io
 import os
 import re
 import base64
-
-from database import initialize_db, hire_candidate
-from utils import calculate_similarity_score
-from pdf_processor import input_pdf_text
-from utils import format_name
-from ai_response import parse_roadmap, generate_roadmap_for_candidate
+import time
+import uuid
+import batch
+import storage
+import tracing
+
+from functools import partial
+from database import (hire_candidate, post_job_opening, candidate_roadmap, get_job_description, search_candidates, search_jobs, get_candidate_names,
+                      get_score_statuses, get_job_roles_posted_by, get_persona, get_applicant_scores,
+                      get_applicants, get_candidate_analysis, count_roadmap_candidates, get_roadmap_candidate_chunks,
+                      save_roadmap_drafts, get_roadmap_draft_names, get_roadmap_draft, discard_roadmap_drafts, notify_roadmap_drafts)
+from utils import format_name, is_degraded
+from ai_response import parse_roadmap, roadmap_markdown
 from candidate_ui import CandidateUI 
+from llm_client import METRICS as LLM_METRICS, SCHEDULER as LLM_SCHEDULER, BREAKER as LLM_BREAKER, llm_priority, BATCH
+from ranking import rank_candidates, RERANK_TOP_K, SKILL_INDEX
+from skills import SKILL_SYNONYMS
+from score_matrix import SCORE_MATRIX
+from idempotency import run_once
+from artifacts import ARTIFACTS, SESSION_KEY, remember, recall, forget, forget_session
 
 ci = CandidateUI(st.session_state)
 
+def roadmap_for_row(job_description, row):
+    """Roadmap JSON for one (candidate_id, full_name, resume_path, skills, experience, education) row, or None."""
+    _, _, resume_path, skills, experience, education = row
+    # Check if the resume file exists
+    if not os.path.exists(resume_path):
+        raise FileNotFoundError(resume_path)
+    return candidate_roadmap(resume_path, skills, experience, education, job_description)
+
+
 class HRUI:
     def __init__(self, session_state):
         self.session_state = session_state
@@ -27,6 +49,7 @@ class HRUI:
     def render_sidebar(self):
         st.sidebar.title(f"Welcome, {self.session_state['username']} 👋")
         if st.sidebar.button("Logout"):
+            forget_session(self.session_state)
             self.session_state["logged_in"] = False
             self.session_state["username"] = None
             st.rerun()
@@ -35,11 +58,8 @@ class HRUI:
         st.title("HR Dashboard")
 
     def render_job_role_selection(self):
-        conn, cursor = initialize_db()
         # Fetch job roles posted by the current HR
-        cursor.execute("SELECT job_role FROM job_postings WHERE posted_by = ?", (self.session_state["user_id"],))
-        job_roles_list = [row[0] for row in cursor.fetchall()]
-        conn.close()
+        job_roles_list = get_job_roles_posted_by(self.session_state["user_id"])
 
         if job_roles_list:
             self.selected_job_role = st.selectbox("Select Job Role", job_roles_list)
@@ -48,7 +68,7 @@ class HRUI:
             self.selected_job_role = None
 
     def render_actions(self):
-        action = st.radio("Select Action", ["Screen Resumes", "View Analysis", "Generate Training Roadmaps", "Scan Candidates", "Post Job Openings"])
+        action = st.radio("Select Action", ["Screen Resumes", "View Analysis", "Generate Training Roadmaps", "Scan Candidates", "Search", "Score Overview", "Post Job Openings", "LLM Metrics", "Session Memory"])
 
         if action == "Screen Resumes":
             self.handle_screen_resumes()
@@ -58,8 +78,24 @@ class HRUI:
             self.handle_generate_training_roadmaps()
         elif action == "Scan Candidates":
             self.handle_scan_candidates()
+        elif action == "Search":
+            self.handle_search()
+        elif action == "Score Overview":
+            self.handle_score_overview()
         elif action == "Post Job Openings":
             self.handle_post_job_openings()
+        elif action == "LLM Metrics":
+            self.handle_llm_metrics()
+        elif action == "Session Memory":
+            self.handle_session_memory()
+
+    def show_snapshot_age(self):
+        """Say how current the report data read through the analytics snapshot is."""
+        age = storage.snapshot_age()
+        if age is None:
+            st.caption("Report data is live.")
+        else:
+            st.caption(f"Report data as of {age:.0f} s ago (refreshed every {storage.ANALYTICS_SNAPSHOT_SECONDS:.0f} s).")
 
     def handle_generate_training_roadmaps(self):
         st.subheader("🗺️ Generate Training Roadmaps")
@@ -82,10 +118,7 @@ class HRUI:
                 return
         else:
             # Use existing job role selection
-            conn, cursor = initialize_db()
-            cursor.execute("SELECT job_role FROM job_postings WHERE posted_by = ?", (self.session_state["user_id"],))
-            job_roles_list = [row[0] for row in cursor.fetchall()]
-            conn.close()
+            job_roles_list = get_job_roles_posted_by(self.session_state["user_id"])
             
             if not job_roles_list:
                 st.warning("You have not posted any job openings yet. Please enter a new job description instead.")
@@ -94,35 +127,20 @@ class HRUI:
             job_role = st.selectbox("Select Job Role", job_roles_list)
             
             # Fetch the job description for the selected role
-            conn, cursor = initialize_db()
-            cursor.execute("SELECT job_description FROM job_postings WHERE job_role = ?", (job_role,))
-            result = cursor.fetchone()
-            conn.close()
+            job_description = get_job_description(job_role)
             
-            if result:
-                job_description = result[0]
+            if job_description is not None:
                 st.info(f"Using job description for: {job_role}")
             else:
                 st.error("Could not retrieve job description for the selected role.")
                 return
         
-        # Get candidates based on selection (employees or all candidates)
-        conn, cursor = initialize_db()
-        if target_audience == "Employees":
-            cursor.execute('''
-                SELECT user_id, full_name, resume_path 
-                FROM candidate_profiles
-                WHERE is_employee = 1
-            ''')
-        else:
-            cursor.execute('''
-                SELECT user_id, full_name, resume_path 
-                FROM candidate_profiles
-            ''')
-        candidates = cursor.fetchall()
-        conn.close()
+        # Count candidates based on selection (employees or all candidates); they are read in chunks later
+        employees_only = target_audience == "Employees"
+        total = count_roadmap_candidates(employees_only=employees_only, snapshot=True)
+        self.show_snapshot_age()
         
-        if not candidates:
+        if not total:
             if target_audience == "Employees":
                 st.warning("No employees found in the system. Hire candidates first.")
             else:
@@ -131,64 +149,41 @@ class HRUI:
             
         # Button to generate roadmaps for all candidates
         if st.button("Analyze All"):
+            # Roadmaps are stored as drafts of this run; the session only keeps the run id
+            previous = self.session_state.get("roadmap_run")
+            run_id = uuid.uuid4().hex
+            discard_roadmap_drafts(previous["run_id"] if previous else run_id)
             with st.spinner(f"Generating training roadmaps for all {target_audience.lower()}..."):
-                # Store the generated roadmaps in session state
-                if "candidate_roadmaps" not in self.session_state:
-                    self.session_state["candidate_roadmaps"] = {}
-                    
-                for candidate_id, full_name, resume_path in candidates:
-                    try:
-                        # Check if the resume file exists
-                        if not os.path.exists(resume_path):
-                            st.warning(f"Resume file not found for {full_name}")
-                            continue
-                            
-                        # Read the resume text
-                        with open(resume_path, "rb") as f:
-                            resume_text = input_pdf_text(f)
-                            
-                        # Generate roadmap for this candidate based on the job description
-                        roadmap = generate_roadmap_for_candidate(resume_text, job_description)
-                        
-                        # Parse the roadmap and store it
-                        roadmap_parsed = parse_roadmap(roadmap)
-                        self.session_state["candidate_roadmaps"][candidate_id] = {
-                            "name": full_name,
-                            "roadmap": roadmap,
-                            "parsed": roadmap_parsed
-                        }
-                    except Exception as e:
-                        st.error(f"Error processing {full_name}'s resume: {str(e)}")
-                
-                st.success(f"✅ Generated roadmaps for {len(self.session_state['candidate_roadmaps'])} {target_audience.lower()}!")
+                generated = self.analyze_all(
+                    get_roadmap_candidate_chunks(employees_only=employees_only, snapshot=True),
+                    job_description, job_role, run_id, total,
+                )
+            self.session_state["roadmap_run"] = {"run_id": run_id, "target_audience": target_audience}
+            st.success(f"✅ Generated roadmaps for {generated} {target_audience.lower()}!")
         
         # Display dropdown to select a candidate if roadmaps have been generated
-        if "candidate_roadmaps" in self.session_state and self.session_state["candidate_roadmaps"]:
+        run = self.session_state.get("roadmap_run")
+        drafts = get_roadmap_draft_names(run["run_id"]) if run else []
+        if drafts:
             candidate_options = {
-                format_name(data["name"]): candidate_id  # Use format_name to clean up names
-                for candidate_id, data in self.session_state["candidate_roadmaps"].items()
+                format_name(full_name): candidate_id  # Use format_name to clean up names
+                for candidate_id, full_name in drafts
             }
             selected_candidate_name = st.selectbox("Select to View Roadmap", list(candidate_options.keys()))
             
             if selected_candidate_name:
                 selected_candidate_id = candidate_options[selected_candidate_name]
-                roadmap_data = self.session_state["candidate_roadmaps"][selected_candidate_id]
+                roadmap = get_roadmap_draft(run["run_id"], selected_candidate_id)
                 
                 # Get the candidate's persona
-                conn, cursor = initialize_db()
-                cursor.execute(
-                    "SELECT evaluation FROM resumes WHERE candidate_profile_id = ? AND job_role = ?",
-                    (selected_candidate_id, "General")
-                )
-                persona = cursor.fetchone()
-                conn.close()
+                persona = get_persona(selected_candidate_id)
                 
                 # Create tabs for roadmap and persona
                 tab1, tab2 = st.tabs(["Training Roadmap", "Persona"])
                 
                 with tab1:
                     # Display the roadmap for the selected candidate
-                    self.display_candidate_roadmap(roadmap_data["parsed"])
+                    self.display_candidate_roadmap(parse_roadmap(roadmap))
                 
                 with tab2:
                     # Display the persona
@@ -197,36 +192,51 @@ class HRUI:
             # Add notification button
             if st.button("Notify About Roadmaps"):
                 with st.spinner("Sending notifications..."):
-                    conn, cursor = initialize_db()
+                    # Copy the run's roadmaps into the candidates' notifications
+                    sent = notify_roadmap_drafts(run["run_id"])
                     
-                    # Save roadmaps to database for each candidate
-                    for candidate_id, data in self.session_state["candidate_roadmaps"].items():
-                        # Check if a roadmap entry already exists for this candidate and job role
-                        cursor.execute(
-                            "SELECT id FROM roadmap_notifications WHERE candidate_id = ? AND job_role = ?",
-                            (candidate_id, job_role)
-                        )
-                        existing_entry = cursor.fetchone()
-                        
-                        roadmap_json = str(data["roadmap"])
-                        
-                        if existing_entry:
-                            # Update existing entry
-                            cursor.execute(
-                                "UPDATE roadmap_notifications SET roadmap = ?, notification_date = CURRENT_TIMESTAMP, is_read = 0 WHERE id = ?",
-                                (roadmap_json, existing_entry[0])
-                            )
-                        else:
-                            # Create new entry
-                            cursor.execute(
-                                "INSERT INTO roadmap_notifications (candidate_id, job_role, roadmap, notification_date, is_read) VALUES (?, ?, ?, CURRENT_TIMESTAMP, 0)",
-                                (candidate_id, job_role, roadmap_json)
-                            )
-                    
-                    conn.commit()
-                    conn.close()
-                    
-                    st.success(f"✅ Notifications sent to {len(self.session_state['candidate_roadmaps'])} {target_audience.lower()}!")
+                    st.success(f"✅ Notifications sent to {sent} {run['target_audience'].lower()}!")
+
+    @tracing.traced("action.analyze_all")
+    @llm_priority(BATCH)
+    def analyze_all(self, chunks, job_description, job_role, run_id, total=None):
+        """
+        Generate a roadmap for each (candidate_id, full_name, resume_path,
+        skills, experience, education) row of the chunks, storing every
+        chunk's roadmaps as drafts of the run before the next chunk is read
+        (see batch.py). Returns the number of roadmaps generated.
+        """
+        generated = processed = 0
+        # Live view of the progress and the latest finished roadmap
+        progress = st.progress(0.0)
+        live = st.empty()
+        for chunk, roadmaps, errors in batch.process_chunks(
+            chunks, partial(roadmap_for_row, job_description), partial(self.save_roadmaps, run_id, job_role),
+        ):
+            processed += len(chunk)
+            for candidate_id, full_name, *_ in chunk:
+                if isinstance(errors.get(candidate_id), FileNotFoundError):
+                    st.warning(f"Resume file not found for {full_name}")
+                elif candidate_id in errors:
+                    st.error(f"Error processing {full_name}'s resume: {errors[candidate_id]}")
+                elif roadmaps[candidate_id] is None:
+                    st.warning(f"Could not generate a roadmap for {full_name}")
+                else:
+                    generated += 1
+                    latest = full_name, roadmaps[candidate_id]
+            if generated:
+                live.markdown(f"**{format_name(latest[0])}**\n\n" + roadmap_markdown(latest[1]))
+            progress.progress(min(processed / total, 1.0) if total else 1.0,
+                              text=f"Generated {generated} roadmaps ({processed} of {total or processed} processed)")
+        progress.empty()
+        live.empty()
+        return generated
+
+    @staticmethod
+    def save_roadmaps(run_id, job_role, roadmaps):
+        save_roadmap_drafts(run_id, job_role, {
+            candidate_id: roadmap for candidate_id, roadmap in roadmaps.items() if roadmap is not None
+        })
 
     def display_candidate_roadmap(self, roadmap_parsed):
         tab1, tab2 = st.tabs(["📚 Training Roadmap", "📈 Learning Resources"])
@@ -279,48 +289,147 @@ class HRUI:
 
         if st.button("Post Job"):
             if job_role and job_description and job_type:
-                conn, cursor = initialize_db()
-
-                # Check if the job role already exists
-                cursor.execute("SELECT job_id FROM job_postings WHERE job_role = ?", (job_role,))
-                job_exists = cursor.fetchone()
-
-                if job_exists:
-                    st.warning("Job role already exists.")
+                # A rerun or double click posts and scores the job once
+                posted, duplicate = run_once(
+                    self.session_state["user_id"], "post_job",
+                    {"job_role": job_role, "job_description": job_description, "job_type": job_type,
+                     "internship_duration": internship_duration},
+                    lambda: post_job_opening(job_role, job_description, job_type, internship_duration, self.session_state["user_id"]),
+                )
+                if posted:
+                    st.success("Job already posted." if duplicate else "Job posted successfully!")
                 else:
-                    # Insert the new job posting
-                    cursor.execute(
-                        "INSERT INTO job_postings (job_role, job_description, job_type, internship_duration, posted_by) VALUES (?, ?, ?, ?, ?)",
-                        (job_role, job_description, job_type, internship_duration, self.session_state["user_id"]),
-                    )
+                    st.warning("Job role already exists.")
+            else:
+                st.warning("Please fill in all the required fields.")
 
-                    # Fetch all existing candidates
-                    cursor.execute("SELECT user_id, resume_path FROM candidate_profiles")
-                    candidates = cursor.fetchall()
 
-                    if candidates:
-                        # Calculate similarity scores for all candidates
-                        for candidate_id, resume_path in candidates:
-                            try:
-                                with open(resume_path, "rb") as f:
-                                    resume_text = f.read().decode('utf-8', errors='ignore')
-                                similarity_score = calculate_similarity_score(resume_text, job_description)
-                                cursor.execute(
-                                    "INSERT INTO resumes (candidate_profile_id, job_role, similarity_score) VALUES (?, ?, ?)",
-                                    (candidate_id, job_role, similarity_score),
-                                )
-                            except FileNotFoundError:
-                                print(f"Resume file not found for candidate ID {candidate_id}")
-                    else:
-                        # Mark the job posting as pending for future candidates
-                        cursor.execute("INSERT INTO pending_jobs (job_role) VALUES (?)", (job_role,))
+    def handle_llm_metrics(self):
+        st.subheader("📈 LLM Call Metrics")
+        snapshot = LLM_METRICS.snapshot()
+        if not snapshot:
+            st.info("No LLM calls have been made by this server process yet.")
+            return
+
+        rows = []
+        for call_site, stats in sorted(snapshot.items()):
+            rows.append({
+                "Call Site": call_site,
+                "Calls": stats["calls"],
+                "Errors": stats["errors"],
+                "Retries": stats["retries"],
+                "Cache Hits": stats["cache_hits"],
+                "Coalesced": stats["coalesced"],
+                "Short-circuited": stats["short_circuited"],
+                "Hedged (won)": f"{stats['hedged']} ({stats['hedge_wins']})",
+                "Avg Prompt Tokens": round(stats["prompt_tokens"] / stats["calls"]) if stats["calls"] else 0,
+                "Avg Response Tokens": round(stats["response_tokens"] / stats["calls"]) if stats["calls"] else 0,
+                "p50 (s)": f"{stats['p50']:.2f}" if stats["p50"] is not None else "N/A",
+                "p95 (s)": f"{stats['p95']:.2f}" if stats["p95"] is not None else "N/A",
+                "p99 (s)": f"{stats['p99']:.2f}" if stats["p99"] is not None else "N/A",
+                "First Chunk p50 (s)": f"{stats['first_chunk_p50']:.2f}" if stats["first_chunk_p50"] is not None else "-",
+            })
+        st.markdown(pd.DataFrame(rows).to_html(index=False), unsafe_allow_html=True)
+
+        # Scheduler queues: interactive calls should barely wait even while batch work runs
+        st.markdown(pd.DataFrame([{
+            "Priority": priority_class,
+            "Slot Limit": stats["limit"],
+            "Running": stats["running"],
+            "Queued": stats["queue_depth"],
+            "Admitted": stats["admitted"],
+            "Wait p50 (s)": f"{stats['wait_p50']:.2f}" if stats["wait_p50"] is not None else "N/A",
+            "Wait p95 (s)": f"{stats['wait_p95']:.2f}" if stats["wait_p95"] is not None else "N/A",
+            "Max Wait (s)": f"{stats['wait_max']:.2f}" if stats["wait_max"] is not None else "N/A",
+        } for priority_class, stats in LLM_SCHEDULER.snapshot().items()]).to_html(index=False), unsafe_allow_html=True)
+
+        breaker = LLM_BREAKER.snapshot()
+        if breaker["state"] == "closed":
+            st.caption(f"Circuit breaker closed: {breaker['window_errors']} errors and {breaker['window_slow']} slow calls "
+                       f"in the last {breaker['window_calls']} calls; tripped {breaker['trips']} times.")
+        else:
+            st.warning(f"Circuit breaker {breaker['state'].replace('_', ' ')} for {breaker['open_for']:.0f}s "
+                       f"(tripped {breaker['trips']} times). Scores are being estimated locally and flagged.")
+
+        # Latency histogram for one call site
+        call_site = st.selectbox("Latency Histogram", sorted(snapshot.keys()))
+        buckets = snapshot[call_site]["buckets"]
+        histogram = pd.DataFrame(
+            {"Calls": [count for _, count in buckets]},
+            index=[f"≤ {bound}s" if bound != float("inf") else "> 32s" for bound, _ in buckets],
+        )
+        st.bar_chart(histogram)
+
+        prometheus_text = LLM_METRICS.to_prometheus()
+        st.download_button("Download Prometheus Metrics", prometheus_text, file_name="llm_metrics.prom", mime="text/plain")
+        if st.button("Write llm_metrics.prom"):
+            path = LLM_METRICS.export_prometheus()
+            st.success(f"Metrics written to {os.path.abspath(path)}")
+
+    def handle_session_memory(self):
+        """Size of the shared artifact store, in total and per session (see artifacts.py)."""
+        st.subheader("🧠 Session Memory")
+        usage = ARTIFACTS.usage()
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Artifacts", usage["artifacts"])
+        col2.metric("In Memory", f"{usage['memory_bytes'] / 1e6:.1f} MB", help=f"Limit {usage['max_memory_bytes'] / 1e6:.0f} MB")
+        col3.metric("Spilled to Disk", f"{usage['disk_bytes'] / 1e6:.1f} MB", help=f"Limit {usage['max_disk_bytes'] / 1e6:.0f} MB")
+        st.caption(f"{usage['spills']} artifacts spilled to disk and {usage['drops']} dropped since the server started.")
+        if not usage["sessions"]:
+            st.info("No session is holding artifacts.")
+            return
+        own = self.session_state.get(SESSION_KEY)
+        st.markdown(pd.DataFrame([{
+            "Session": session[:8] + (" (you)" if session == own else ""),
+            "Artifacts": stats["artifacts"],
+            "In Memory (KB)": f"{stats['memory_bytes'] / 1e3:.1f}",
+            "On Disk (KB)": f"{stats['disk_bytes'] / 1e3:.1f}",
+        } for session, stats in sorted(usage["sessions"].items(), key=lambda item: -(item[1]["memory_bytes"] + item[1]["disk_bytes"]))
+        ]).to_html(index=False), unsafe_allow_html=True)
+
+    def handle_score_overview(self):
+        """Score statistics across every job role at once, from the score matrix."""
+        st.subheader("📊 Score Overview")
+        candidates, roles = SCORE_MATRIX.shape()
+        if not roles:
+            st.info("No candidates have been scored yet.")
+            return
 
-                    conn.commit()
-                    st.success("Job posted successfully!")
-                conn.close()
+        threshold = st.slider("Shortlist threshold (%)", min_value=0, max_value=100, value=70, step=5)
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Candidates", candidates)
+        col2.metric("Job Roles", roles)
+        col3.metric("Matrix Size", f"{SCORE_MATRIX.nbytes / 1e6:.1f} MB")
+
+        summary = SCORE_MATRIX.role_summary(threshold)
+        top = SCORE_MATRIX.top_k_per_role(k=1)
+        names = get_candidate_names({ranked[0][0] for ranked in top.values() if ranked})
+        rows = []
+        for job_role, stats in sorted(summary.items(), key=lambda item: -item[1]["above"]):
+            best = top.get(job_role)
+            rows.append({
+                "Job Role": job_role,
+                "Scored": stats["scored"],
+                f"≥ {threshold}%": stats["above"],
+                "Mean": f"{stats['mean']:.1f}%" if stats["mean"] is not None else "N/A",
+                "Top Candidate": format_name(names[best[0][0]][0]) if best and best[0][0] in names else "N/A",
+                "Top Score": f"{best[0][1]:.1f}%" if best else "N/A",
+            })
+        st.markdown(pd.DataFrame(rows).to_html(index=False), unsafe_allow_html=True)
+
+        candidate_id = st.number_input("Best roles for candidate ID", min_value=0, value=0, step=1)
+        if candidate_id:
+            fits = SCORE_MATRIX.best_fits(int(candidate_id), k=5)
+            if fits:
+                st.table(pd.DataFrame([{"Job Role": job_role, "Similarity Score": f"{score:.2f}%"} for job_role, score in fits]))
             else:
-                st.warning("Please fill in all the required fields.")
+                st.info("No stored scores for this candidate.")
 
+        edges, histograms = SCORE_MATRIX.histograms(bins=10)
+        selected = st.multiselect("Score distribution", sorted(histograms), default=sorted(histograms)[:3])
+        if selected:
+            labels = [f"{edges[i]:.0f}–{edges[i + 1]:.0f}" for i in range(len(edges) - 1)]
+            st.bar_chart(pd.DataFrame({job_role: histograms[job_role] for job_role in selected}, index=labels))
 
     def handle_scan_candidates(self):
         st.subheader("🔍 Scan Candidates for Job Role")
@@ -329,38 +438,39 @@ class HRUI:
             st.warning("Please select a job role first.")
             return
 
-        # Fetch candidates and their stored similarity scores
-        conn, cursor = initialize_db()
-        cursor.execute('''
-            SELECT candidate_profiles.user_id, candidate_profiles.full_name, candidate_profiles.email, resumes.similarity_score, candidate_profiles.resume_path
-            FROM resumes
-            JOIN candidate_profiles ON resumes.candidate_profile_id = candidate_profiles.user_id
-            WHERE resumes.job_role = ?
-        ''', (self.selected_job_role,))
-        candidates = cursor.fetchall()
-        conn.close()
-
-        if not candidates:
+        source = st.radio("Rank by", ["Stored scores", "Search all candidates"], horizontal=True)
+        if source == "Search all candidates":
+            self.scan_all_candidates()
+            return
+
+        # Stored scores come from the score matrix, best first
+        ranked = SCORE_MATRIX.top_k(self.selected_job_role, k=SCORE_MATRIX.shape()[0])
+
+        if not ranked:
             st.info(f"No candidates found for the role '{self.selected_job_role}'.")
             return
 
         # Hardcoded threshold: 75%
         threshold = 30
+        above = [(user_id, score) for user_id, score in ranked if score >= threshold]
+        # Only the candidates above the threshold are read from the database
+        names = get_candidate_names((user_id for user_id, _ in above), snapshot=True)
+        statuses = get_score_statuses(self.selected_job_role)
         results = []
         candidate_options = {"Select a Candidate": None}  # Add placeholder option
-        for candidate in candidates:
-            user_id, full_name, email, similarity_score, resume_path = candidate
+        for user_id, similarity_score in above:
+            if user_id not in names:
+                continue
+            full_name, email, resume_path = names[user_id]
             # Format the name properly using the format_name function
             formatted_name = format_name(full_name)
-            
-            if similarity_score is not None and similarity_score >= threshold:  # Apply threshold filter
-                results.append({
-                    "Name": formatted_name,
-                    "Email": email,
-                    "Similarity Score": f"{similarity_score:.2f}%" if similarity_score is not None else "N/A",
-                    "Resume Path": resume_path
-                })
-                candidate_options[f"{formatted_name} ({email})"] = user_id
+            results.append({
+                "Name": formatted_name,
+                "Email": email,
+                "Similarity Score": f"{similarity_score:.2f}%" + (f" ({statuses[user_id]})" if user_id in statuses else ""),
+                "Resume Path": resume_path
+            })
+            candidate_options[f"{formatted_name} ({email})"] = user_id
 
         if results:
             st.success(f"Found {len(results)} candidates for the role '{self.selected_job_role}' above the threshold of {threshold}%.")
@@ -380,21 +490,77 @@ class HRUI:
             ci.view_persona(candidate_id)
 
 
+    @tracing.traced("action.rank_candidates")
+    def scan_all_candidates(self):
+        """Rank every candidate for the selected role: local keyword ranking, then an AI rerank of the top k."""
+        job_description = get_job_description(self.selected_job_role)
+        if not job_description:
+            st.error("Could not retrieve job description for the selected role.")
+            return
+
+        col1, col2 = st.columns(2)
+        k = col1.slider("Candidates to shortlist (k)", min_value=5, max_value=100, value=RERANK_TOP_K, step=5)
+        rerank = col2.checkbox("AI rerank the shortlist", value=True)
+        required_skills = st.multiselect("Required skills", list(SKILL_SYNONYMS))
+        if required_skills:
+            st.caption(f"{SKILL_INDEX.get().count_with_all(required_skills)} candidates have all of the required skills.")
+        if not st.button("Rank Candidates"):
+            return
+
+        with st.spinner("Ranking candidates..."):
+            ranked = rank_candidates(job_description, k=k, rerank=rerank, required_skills=required_skills)
+        if not ranked:
+            st.info("No candidates match this job description.")
+            return
+
+        df = pd.DataFrame([{
+            "Name": format_name(result["full_name"]),
+            "Email": result["email"],
+            "Keyword Score": f"{result['lexical_score']:.2f}",
+            "Skill Coverage": f"{result['skill_coverage']:.0%}",
+            "Similarity Score": (f"{result['llm_score']:.2f}%" + (" (estimated)" if is_degraded(result["llm_score"]) else ""))
+                                if result["llm_score"] is not None else "N/A",
+        } for result in ranked])
+        st.success(f"Top {len(ranked)} candidates for the role '{self.selected_job_role}'.")
+        st.markdown(df.to_html(index=False, escape=False), unsafe_allow_html=True)
+
+    def handle_search(self):
+        st.subheader("🔎 Search")
+        col1, col2 = st.columns([3, 1])
+        query = col1.text_input("Search terms", placeholder='Kubernetes AND Go, "data pipeline", pyth*')
+        target = col2.radio("Search in", ["Candidates", "Jobs"])
+        if not query.strip():
+            st.info("Use AND, OR, NOT, \"exact phrases\" and prefix* to refine the search.")
+            return
+
+        page_size = 20
+        page = st.number_input("Page", min_value=1, value=1, step=1)
+        start = time.perf_counter()
+        if target == "Candidates":
+            rows, total = search_candidates(query, page=page, page_size=page_size)
+            results = [{"Name": format_name(full_name), "Email": email, "Skills": skills, "Match": snippet}
+                       for _, full_name, email, skills, snippet in rows]
+        else:
+            rows, total = search_jobs(query, page=page, page_size=page_size)
+            results = [{"Job Role": job_role, "Job Type": job_type, "Match": snippet}
+                       for _, job_role, job_type, snippet in rows]
+        elapsed_ms = (time.perf_counter() - start) * 1000.0
+
+        if not results:
+            st.warning(f"No {target.lower()} match '{query}'." if total == 0 else "No results on this page.")
+            return
+        first = (page - 1) * page_size + 1
+        st.caption(f"Showing {first}–{first + len(results) - 1} of {total} {target.lower()} ({elapsed_ms:.0f} ms)")
+        st.table(pd.DataFrame(results))
+
     def handle_screen_resumes(self):
         # Add import at the top of the fil   
         if st.button("Start Screening"):
             self.clear_session_state()
             with st.spinner("Processing Resumes..."):
                 # Fetch candidates who have applied for the selected job role
-                conn, cursor = initialize_db()
-                cursor.execute('''
-                    SELECT candidate_profiles.full_name, candidate_profiles.email, resumes.similarity_score, candidate_profiles.resume_path
-                    FROM resumes
-                    JOIN candidate_profiles ON resumes.candidate_profile_id = candidate_profiles.user_id
-                    WHERE resumes.job_role = ? AND resumes.has_applied = 1
-                ''', (self.selected_job_role,))
-                ranked_resumes = cursor.fetchall()
-                conn.close()
+                ranked_resumes = get_applicant_scores(self.selected_job_role, snapshot=True)
+                self.show_snapshot_age()
 
                 if not ranked_resumes:
                     st.warning(f"No candidates have applied for the '{self.selected_job_role}' job role yet.")
@@ -402,8 +568,8 @@ class HRUI:
 
                 threshold = 0
                 new_ranked_resumes = []
-                for i, result in ranked_resumes:
-                    full_name, email, similarity_score, resume_path = result  # Unpack tuple
+                for i, result in enumerate(ranked_resumes):
+                    full_name, email, similarity_score, resume_path, score_status = result  # Unpack tuple
                     if similarity_score is not None and similarity_score >= threshold:  # Apply threshold filter
                         # Format the name properly using the format_name function
                         formatted_name = format_name(full_name)
@@ -412,7 +578,8 @@ class HRUI:
                             "Index": i + 1,
                             "Name": formatted_name,
                             "Email": f'<a href="mailto:{email}">{email}</a>',
-                            "Score": f"{similarity_score:.2f}%" if similarity_score is not None else "N/A",
+                            "Score": (f"{similarity_score:.2f}%" if similarity_score is not None else "N/A")
+                                     + (f" ({score_status})" if score_status else ""),
                         }
 
                         # Add resume download link if the file exists
@@ -447,20 +614,8 @@ class HRUI:
 
     def render_candidate_selection(self):
         if self.selected_job_role:
-            conn, cursor = initialize_db()
             # Fetch candidates and their persona (evaluation) for the selected job role
-            cursor.execute(
-                """
-                SELECT DISTINCT candidate_profiles.full_name, resumes.candidate_profile_id, resumes.evaluation, 
-                candidate_profiles.is_employee
-                FROM resumes
-                JOIN candidate_profiles ON resumes.candidate_profile_id = candidate_profiles.user_id
-                WHERE resumes.job_role = ? AND resumes.has_applied = 1
-                """,
-                (self.selected_job_role,),
-            )
-            results = cursor.fetchall()
-            conn.close()
+            results = get_applicants(self.selected_job_role)
 
             candidate_data = []
             if results:
@@ -529,24 +684,13 @@ class HRUI:
             
     def render_analysis_display(self):
         if self.selected_candidate_id:
-            conn, cursor = initialize_db()
-            
-            # Fetch evaluation (persona) independent of job role
-            cursor.execute("SELECT evaluation FROM resumes WHERE candidate_profile_id = ?", (self.selected_candidate_id,))
-            persona_result = cursor.fetchone()
-
-            # Fetch match_response based on job role
-            cursor.execute("SELECT match_response FROM resumes WHERE candidate_profile_id = ? AND job_role = ?", (self.selected_candidate_id, self.selected_job_role))
-            analysis_result = cursor.fetchone()
-            conn.close()
+            persona_result, analysis_result = get_candidate_analysis(self.selected_candidate_id, self.selected_job_role)
 
-            if persona_result:
-                self.session_state["evaluation"] = persona_result[0]  # Persona from resumes table
-            else:
-                self.session_state["evaluation"] = None
+            # Persona from resumes table; the session keeps only the artifact id
+            remember(self.session_state, "evaluation", persona_result[0] if persona_result else None)
 
             if analysis_result:
-                self.session_state["match_response"] = analysis_result[0]
+                remember(self.session_state, "match_response", analysis_result[0])
                 
                 # Display only the persona and compatibility tabs
                 self.display_analysis_tabs()
@@ -562,27 +706,25 @@ class HRUI:
             self.display_compatibility(tab2)
 
     def clear_session_state(self):
-        if "evaluation" in self.session_state:
-            del self.session_state["evaluation"]
-        if "match_response" in self.session_state:
-            del self.session_state["match_response"]
-        if "roadmap" in self.session_state:
-            del self.session_state["roadmap"]
+        forget(self.session_state, "evaluation")
+        forget(self.session_state, "match_response")
+        forget(self.session_state, "roadmap")
         if "free_courses" in self.session_state:
             del self.session_state["free_courses"]
         if "paid_courses" in self.session_state:
             del self.session_state["paid_courses"]
-        if "candidate_roadmaps" in self.session_state:
-            del self.session_state["candidate_roadmaps"]
+        if "roadmap_run" in self.session_state:
+            del self.session_state["roadmap_run"]
 
     def display_persona(self, tab):
         st.subheader("📝 User Persona")
-        if "evaluation" in st.session_state and st.session_state["evaluation"] is not None:
+        evaluation = recall(st.session_state, "evaluation")
+        if evaluation is not None:
             try:
                 # Extract the table from the evaluation response
-                table_start = st.session_state["evaluation"].find("| Category |")
+                table_start = evaluation.find("| Category |")
                 if table_start != -1:
-                    table_markdown = st.session_state["evaluation"][table_start:]
+                    table_markdown = evaluation[table_start:]
                     # Convert Markdown to CSV-like string for pandas
                     import io
                     table_csv = io.StringIO(table_markdown.replace("| ", "|").replace(" |", "|"))
@@ -604,20 +746,21 @@ class HRUI:
                     )
                 else:
                     st.error("Table not found in Gemini's response.")
-                    st.write(st.session_state["evaluation"])
+                    st.write(evaluation)
 
             except Exception as e:
                 st.error(f"Could not display User Persona in table format: {e}")
-                st.write(st.session_state["evaluation"])
+                st.write(evaluation)
 
     def display_compatibility(self, tab):
         st.subheader("📊 Compatibility Score")
-        if "match_response" in st.session_state and st.session_state["match_response"] is not None:
+        match_response = recall(st.session_state, "match_response")
+        if match_response is not None:
             try:
                 # Extract the table from the match_response
-                table_start = st.session_state["match_response"].find("| Category |")
+                table_start = match_response.find("| Category |")
                 if table_start != -1:
-                    table_markdown = st.session_state["match_response"][table_start:]
+                    table_markdown = match_response[table_start:]
                     # Convert Markdown to CSV-like string for pandas
                     import io
                     table_csv = io.StringIO(table_markdown.replace("| ", "|").replace(" |", "|"))
@@ -639,11 +782,11 @@ class HRUI:
                     )
                 else:
                     st.error("Table not found in Gemini's response.")
-                    st.write(st.session_state["match_response"])
+                    st.write(match_response)
 
             except Exception as e:
                 st.error(f"Could not display Compatibility Score in table format: {e}")
-                st.write(st.session_state["match_response"])
+                st.write(match_response)
 
     def display_learning_pathway(self, tab, roadmap_parsed):
         st.subheader("📚 Training Roadmap")
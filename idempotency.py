@@ -0,0 +1,58 @@
+"""
+Idempotency keys for heavy user actions.
+
+Registering, applying for a job and posting a job each fan out into many LLM
+calls and database writes, and a Streamlit rerun or a double click can submit
+them twice. Each action runs under a key derived from the user, the action and
+a hash of its payload:
+
+* a submission whose twin is still running in this process waits for it and
+  gets the same result;
+* a submission whose twin completed within IDEMPOTENCY_TTL_SECONDS gets the
+  stored result without running again.
+
+Only results the caller marks as worth remembering are stored, so a failed
+attempt can be retried with the same input.
+"""
+import hashlib
+import json
+import os
+
+from database import get_idempotent_result, store_idempotent_result
+from llm_client import SingleFlight
+
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+
+_running = SingleFlight()
+
+
+def idempotency_key(user, action, payload):
+    """Key for one submission of an action. The payload must be JSON-serializable (other values use str())."""
+    body = json.dumps([str(user), action, payload], sort_keys=True, default=str)
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def run_once(user, action, payload, func, remember=bool):
+    """
+    Run func() unless the same (user, action, payload) is already running or
+    recently completed. Returns (result, duplicate) where duplicate is True
+    when the result came from the earlier submission. Results must be
+    JSON-serializable; those for which remember(result) is false are not
+    stored. With remember=None only in-flight submissions are deduplicated,
+    for actions whose results are already persisted elsewhere.
+    """
+    key = idempotency_key(user, action, payload)
+
+    def first_run():
+        if remember is None:
+            return func(), False
+        stored = get_idempotent_result(key, IDEMPOTENCY_TTL_SECONDS)
+        if stored is not None:
+            return json.loads(stored), True
+        result = func()
+        if remember(result):
+            store_idempotent_result(key, action, json.dumps(result))
+        return result, False
+
+    (result, stored), attached = _running.do(key, first_run)
+    return result, stored or attached
@@ -0,0 +1,774 @@
+"""
+Shared Gemini client.
+
+Every model call goes through `generate_content` so it is timed, counted and
+tagged with the call site that made it (scoring, summary, resume_analysis,
+roadmap, match). Metrics are kept in process and can be exported in the
+Prometheus text format.
+
+Identical calls made concurrently from different threads (sessions opening the
+same job, two HR users viewing the same role) are coalesced: the first caller
+makes the request and the others wait for and share its response.
+
+Calls are admitted by a priority scheduler. Work a user is waiting on runs in
+the "interactive" class; bulk work (rescoring everyone for a new job, roadmaps
+for every candidate) runs inside `llm_priority(BATCH)`. Batch calls may use only
+a share of the concurrent request slots, queued interactive calls are admitted
+before queued batch calls, and each class has its own fan-out pool so
+interactive tasks never queue behind batch tasks.
+
+Each call has a deadline (LLM_CALL_DEADLINE_SECONDS) covering its retries. A
+circuit breaker watches recent calls and opens when too many fail or run slow;
+while it is open calls fail fast with CircuitOpenError so callers can fall back
+to a local estimate instead of waiting on a struggling upstream. With
+LLM_HEDGE_AFTER_SECONDS set, a request still running after that long is sent a
+second time and whichever answer arrives first is used.
+"""
+import bisect
+import contextlib
+import contextvars
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import google.generativeai as genai
+from dotenv import load_dotenv
+from google.api_core import exceptions as google_exceptions
+
+import tracing
+
+load_dotenv()
+genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+
+MODEL_NAME = 'gemini-2.0-flash-lite'
+CALL_SITES = ("scoring", "summary", "resume_analysis", "roadmap", "match")
+
+# Transient upstream errors worth retrying.
+RETRYABLE_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.DeadlineExceeded,
+)
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+STREAMING_ENABLED = os.getenv("LLM_STREAMING", "1") == "1"
+RETRY_BACKOFF_SECONDS = float(os.getenv("LLM_RETRY_BACKOFF_SECONDS", "0.5"))
+FAN_OUT_WORKERS = int(os.getenv("LLM_FAN_OUT_WORKERS", "8"))
+FAN_OUT_DEADLINE_SECONDS = float(os.getenv("LLM_FAN_OUT_DEADLINE_SECONDS", "60"))
+COALESCE_ENABLED = os.getenv("LLM_COALESCE", "1") == "1"
+# Wall-time budget for one call, including retries
+CALL_DEADLINE_SECONDS = float(os.getenv("LLM_CALL_DEADLINE_SECONDS", "30"))
+# Send a second identical request when the first has run this long (0 disables hedging)
+HEDGE_AFTER_SECONDS = float(os.getenv("LLM_HEDGE_AFTER_SECONDS", "0"))
+
+# Circuit breaker: over the last BREAKER_WINDOW calls (once BREAKER_MIN_CALLS have
+# been seen), open when the error rate or the share of calls slower than
+# BREAKER_SLOW_SECONDS reaches its limit. After BREAKER_COOLDOWN_SECONDS one probe
+# call is let through; it closes the breaker if it succeeds in time.
+BREAKER_ENABLED = os.getenv("LLM_BREAKER", "1") == "1"
+BREAKER_WINDOW = int(os.getenv("LLM_BREAKER_WINDOW", "20"))
+BREAKER_MIN_CALLS = int(os.getenv("LLM_BREAKER_MIN_CALLS", "10"))
+BREAKER_ERROR_RATE = float(os.getenv("LLM_BREAKER_ERROR_RATE", "0.5"))
+BREAKER_SLOW_SECONDS = float(os.getenv("LLM_BREAKER_SLOW_SECONDS", "10"))
+BREAKER_SLOW_RATE = float(os.getenv("LLM_BREAKER_SLOW_RATE", "0.5"))
+BREAKER_COOLDOWN_SECONDS = float(os.getenv("LLM_BREAKER_COOLDOWN_SECONDS", "30"))
+
+# Priority classes, highest first
+INTERACTIVE = "interactive"
+BATCH = "batch"
+PRIORITY_CLASSES = (INTERACTIVE, BATCH)
+PRIORITY_SCHEDULING = os.getenv("LLM_PRIORITY_SCHEDULING", "1") == "1"
+MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+# Batch work may hold at most this share of the request slots; interactive work may use all of them
+BATCH_SHARE = float(os.getenv("LLM_BATCH_SHARE", "0.5"))
+BATCH_FAN_OUT_WORKERS = int(os.getenv("LLM_BATCH_FAN_OUT_WORKERS", str(FAN_OUT_WORKERS)))
+
+# Latency histogram bucket upper bounds, in seconds.
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0)
+ROLLING_WINDOW = 1000
+
+
+class CallSiteStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.coalesced = 0
+        self.short_circuited = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.prompt_tokens = 0
+        self.response_tokens = 0
+        self.latency_sum = 0.0
+        self.bucket_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.recent = deque(maxlen=ROLLING_WINDOW)
+        self.recent_first_chunk = deque(maxlen=ROLLING_WINDOW)
+
+
+class LLMMetrics:
+    """Thread-safe per-call-site counters plus a rolling window of recent latencies."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _site(self, call_site):
+        if call_site not in self._stats:
+            self._stats[call_site] = CallSiteStats()
+        return self._stats[call_site]
+
+    def record_call(self, call_site, seconds, prompt_tokens=0, response_tokens=0, error=False, retries=0,
+                    first_chunk_seconds=None):
+        with self._lock:
+            stats = self._site(call_site)
+            stats.calls += 1
+            stats.errors += int(error)
+            stats.retries += retries
+            stats.prompt_tokens += prompt_tokens
+            stats.response_tokens += response_tokens
+            stats.latency_sum += seconds
+            stats.bucket_counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            stats.recent.append(seconds)
+            if first_chunk_seconds is not None:
+                stats.recent_first_chunk.append(first_chunk_seconds)
+
+    def record_cache(self, call_site, hit):
+        with self._lock:
+            stats = self._site(call_site)
+            if hit:
+                stats.cache_hits += 1
+            else:
+                stats.cache_misses += 1
+
+    def record_coalesced(self, call_site):
+        """Count a call that was served by an identical call already in flight."""
+        with self._lock:
+            self._site(call_site).coalesced += 1
+
+    def record_short_circuit(self, call_site):
+        """Count a call rejected by the open circuit breaker without reaching the model."""
+        with self._lock:
+            self._site(call_site).short_circuited += 1
+
+    def record_hedge(self, call_site, won):
+        """Count a hedged second request, and whether it answered before the first."""
+        with self._lock:
+            stats = self._site(call_site)
+            stats.hedged += 1
+            stats.hedge_wins += int(won)
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+
+    def snapshot(self):
+        """Return a plain dict per call site, including percentiles over the rolling window."""
+        with self._lock:
+            result = {}
+            for call_site, stats in self._stats.items():
+                recent = sorted(stats.recent)
+                first_chunk = sorted(stats.recent_first_chunk)
+                result[call_site] = {
+                    "calls": stats.calls,
+                    "errors": stats.errors,
+                    "retries": stats.retries,
+                    "cache_hits": stats.cache_hits,
+                    "cache_misses": stats.cache_misses,
+                    "coalesced": stats.coalesced,
+                    "short_circuited": stats.short_circuited,
+                    "hedged": stats.hedged,
+                    "hedge_wins": stats.hedge_wins,
+                    "prompt_tokens": stats.prompt_tokens,
+                    "response_tokens": stats.response_tokens,
+                    "latency_sum": stats.latency_sum,
+                    "p50": _percentile(recent, 50),
+                    "p95": _percentile(recent, 95),
+                    "p99": _percentile(recent, 99),
+                    "first_chunk_p50": _percentile(first_chunk, 50),
+                    "first_chunk_p95": _percentile(first_chunk, 95),
+                    "buckets": list(zip(LATENCY_BUCKETS + (float("inf"),), stats.bucket_counts)),
+                }
+            return result
+
+    def to_prometheus(self):
+        """Render the metrics in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = []
+
+        def counter(name, help_text, field):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for call_site, stats in snapshot.items():
+                lines.append(f'{name}{{call_site="{call_site}"}} {stats[field]}')
+
+        counter("llm_requests_total", "LLM calls made.", "calls")
+        counter("llm_errors_total", "LLM calls that failed after retries.", "errors")
+        counter("llm_retries_total", "Retries of transient LLM errors.", "retries")
+        counter("llm_cache_hits_total", "LLM results served from a cache.", "cache_hits")
+        counter("llm_cache_misses_total", "LLM cache lookups that missed.", "cache_misses")
+        counter("llm_coalesced_total", "LLM calls served by an identical call already in flight.", "coalesced")
+        counter("llm_short_circuited_total", "LLM calls rejected by the open circuit breaker.", "short_circuited")
+        counter("llm_hedged_total", "Hedged second LLM requests sent.", "hedged")
+        counter("llm_hedge_wins_total", "Hedged requests that answered first.", "hedge_wins")
+        counter("llm_prompt_tokens_total", "Prompt tokens sent.", "prompt_tokens")
+        counter("llm_response_tokens_total", "Response tokens received.", "response_tokens")
+
+        name = "llm_request_duration_seconds"
+        lines.append(f"# HELP {name} Wall time of LLM calls.")
+        lines.append(f"# TYPE {name} histogram")
+        for call_site, stats in snapshot.items():
+            cumulative = 0
+            for bound, count in stats["buckets"]:
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else bound
+                lines.append(f'{name}_bucket{{call_site="{call_site}",le="{le}"}} {cumulative}')
+            lines.append(f'{name}_sum{{call_site="{call_site}"}} {stats["latency_sum"]}')
+            lines.append(f'{name}_count{{call_site="{call_site}"}} {stats["calls"]}')
+        lines.extend(SCHEDULER.prometheus_lines())
+        lines.extend(BREAKER.prometheus_lines())
+        return "\n".join(lines) + "\n"
+
+    def export_prometheus(self, path="llm_metrics.prom"):
+        with open(path, "w") as f:
+            f.write(self.to_prometheus())
+        return path
+
+
+def _percentile(ordered, pct):
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+METRICS = LLMMetrics()
+
+
+def _token_counts(response):
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return 0, 0
+    return (getattr(usage, "prompt_token_count", 0) or 0,
+            getattr(usage, "candidates_token_count", 0) or 0)
+
+
+_priority = contextvars.ContextVar("llm_priority", default=INTERACTIVE)
+
+
+@contextlib.contextmanager
+def llm_priority(priority_class):
+    """Run the LLM calls made in this block (and in fan-out work it submits) in the given priority class."""
+    token = _priority.set(priority_class)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority():
+    return _priority.get()
+
+
+class ClassStats:
+    def __init__(self, limit):
+        self.limit = limit
+        self.running = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.wait_sum = 0.0
+        self.recent_waits = deque(maxlen=ROLLING_WINDOW)
+
+
+class LLMScheduler:
+    """
+    Admits at most max_concurrency model requests at once, at most `limits[c]`
+    of them from class c. When a slot frees up, a waiting request of a higher
+    class is admitted before any waiting request of a lower class.
+    """
+
+    def __init__(self, max_concurrency, limits, enabled=True):
+        self.max_concurrency = max_concurrency
+        self.enabled = enabled
+        self._cond = threading.Condition()
+        self._classes = {priority_class: ClassStats(limits.get(priority_class, max_concurrency))
+                         for priority_class in PRIORITY_CLASSES}
+
+    def _can_run(self, priority_class):
+        stats = self._classes[priority_class]
+        if stats.running >= stats.limit:
+            return False
+        if sum(c.running for c in self._classes.values()) >= self.max_concurrency:
+            return False
+        for higher in PRIORITY_CLASSES[:PRIORITY_CLASSES.index(priority_class)]:
+            higher_stats = self._classes[higher]
+            if higher_stats.waiting and higher_stats.running < higher_stats.limit:
+                return False
+        return True
+
+    @contextlib.contextmanager
+    def slot(self, priority_class=None):
+        """Hold one request slot for the current (or given) priority class."""
+        if not self.enabled:
+            yield
+            return
+        priority_class = priority_class or _priority.get()
+        stats = self._classes[priority_class]
+        start = time.perf_counter()
+        with self._cond:
+            stats.waiting += 1
+            while not self._can_run(priority_class):
+                self._cond.wait()
+            stats.waiting -= 1
+            stats.running += 1
+            stats.admitted += 1
+            waited = time.perf_counter() - start
+            stats.wait_sum += waited
+            stats.recent_waits.append(waited)
+        try:
+            yield
+        finally:
+            with self._cond:
+                stats.running -= 1
+                self._cond.notify_all()
+
+    def snapshot(self):
+        """Per class: limit, running, queue depth, admitted count and wait percentiles over the rolling window."""
+        with self._cond:
+            result = {}
+            for priority_class, stats in self._classes.items():
+                waits = sorted(stats.recent_waits)
+                result[priority_class] = {
+                    "limit": stats.limit,
+                    "running": stats.running,
+                    "queue_depth": stats.waiting,
+                    "admitted": stats.admitted,
+                    "wait_sum": stats.wait_sum,
+                    "wait_p50": _percentile(waits, 50),
+                    "wait_p95": _percentile(waits, 95),
+                    "wait_max": waits[-1] if waits else None,
+                }
+            return result
+
+    def prometheus_lines(self):
+        snapshot = self.snapshot()
+        lines = []
+        for name, kind, help_text, field in (
+            ("llm_queue_depth", "gauge", "LLM requests waiting for a slot.", "queue_depth"),
+            ("llm_running_requests", "gauge", "LLM requests holding a slot.", "running"),
+            ("llm_queue_wait_seconds_sum", "counter", "Total time LLM requests waited for a slot.", "wait_sum"),
+            ("llm_queue_admitted_total", "counter", "LLM requests admitted by the scheduler.", "admitted"),
+        ):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for priority_class, stats in snapshot.items():
+                lines.append(f'{name}{{priority="{priority_class}"}} {stats[field]}')
+        return lines
+
+
+SCHEDULER = LLMScheduler(
+    MAX_CONCURRENCY,
+    {INTERACTIVE: MAX_CONCURRENCY, BATCH: max(1, int(MAX_CONCURRENCY * BATCH_SHARE))},
+    enabled=PRIORITY_SCHEDULING,
+)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the model while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Closed: calls go through and their outcomes are recorded. Open: calls are
+    rejected until the cooldown has passed. Half open: a single probe call is
+    let through and its outcome closes or reopens the breaker.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, window, min_calls, error_rate, slow_seconds, slow_rate, cooldown, enabled=True):
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_seconds = slow_seconds
+        self.slow_rate = slow_rate
+        self.cooldown = cooldown
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=window)
+        self.state = self.CLOSED
+        self._opened_at = 0.0
+        self._probing = False
+        self.trips = 0
+        self.rejected = 0
+
+    def allow(self):
+        """Whether a call may go ahead now. Callers that are allowed must report back with record()."""
+        if not self.enabled:
+            return True
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record(self, ok, seconds):
+        """Report the outcome of an allowed call: ok is False for upstream failures and timeouts."""
+        if not self.enabled:
+            return
+        with self._lock:
+            healthy = ok and seconds < self.slow_seconds
+            if self.state == self.HALF_OPEN:
+                self._probing = False
+                if healthy:
+                    self.state = self.CLOSED
+                    self._outcomes.clear()
+                else:
+                    self._trip()
+                return
+            if self.state == self.OPEN:
+                return
+            self._outcomes.append((ok, seconds))
+            if len(self._outcomes) < self.min_calls:
+                return
+            errors = sum(1 for ok, _ in self._outcomes if not ok) / len(self._outcomes)
+            slow = sum(1 for _, seconds in self._outcomes if seconds >= self.slow_seconds) / len(self._outcomes)
+            if errors >= self.error_rate or slow >= self.slow_rate:
+                self._trip()
+
+    def release(self):
+        """Report an allowed call whose outcome says nothing about upstream health (a bad request)."""
+        if not self.enabled:
+            return
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._probing = False
+
+    def _trip(self):
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        self.trips += 1
+
+    def reset(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self._outcomes.clear()
+            self._probing = False
+
+    def snapshot(self):
+        with self._lock:
+            outcomes = list(self._outcomes)
+            return {
+                "state": self.state,
+                "trips": self.trips,
+                "rejected": self.rejected,
+                "window_calls": len(outcomes),
+                "window_errors": sum(1 for ok, _ in outcomes if not ok),
+                "window_slow": sum(1 for _, seconds in outcomes if seconds >= self.slow_seconds),
+                "open_for": time.monotonic() - self._opened_at if self.state != self.CLOSED else None,
+            }
+
+    def prometheus_lines(self):
+        snapshot = self.snapshot()
+        state = {self.CLOSED: 0, self.HALF_OPEN: 1, self.OPEN: 2}[snapshot["state"]]
+        return [
+            "# HELP llm_circuit_state Circuit breaker state (0 closed, 1 half open, 2 open).",
+            "# TYPE llm_circuit_state gauge",
+            f"llm_circuit_state {state}",
+            "# HELP llm_circuit_trips_total Times the circuit breaker opened.",
+            "# TYPE llm_circuit_trips_total counter",
+            f"llm_circuit_trips_total {snapshot['trips']}",
+        ]
+
+
+BREAKER = CircuitBreaker(
+    BREAKER_WINDOW, BREAKER_MIN_CALLS, BREAKER_ERROR_RATE, BREAKER_SLOW_SECONDS, BREAKER_SLOW_RATE,
+    BREAKER_COOLDOWN_SECONDS, enabled=BREAKER_ENABLED,
+)
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time. Callers arriving while a call
+    with the same key is running wait for it and get its result (or error).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._flights)
+
+    def do(self, key, func):
+        """Return (result, shared) where shared is True if another caller's call was reused."""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+        try:
+            flight.result = func()
+            return flight.result, False
+        except Exception as e:
+            flight.error = e
+            raise
+        except BaseException as e:
+            # The leader is being interrupted or shut down; its followers must
+            # not mistake that for a result, but need not stop with it either
+            flight.error = RuntimeError(f"Shared call was interrupted: {e!r}")
+            flight.error.__cause__ = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+
+IN_FLIGHT = SingleFlight()
+
+
+def _flight_key(prompt, call_site, kwargs):
+    options = json.dumps(kwargs, sort_keys=True, default=str)
+    return hashlib.sha256(f"{MODEL_NAME}\0{call_site}\0{prompt}\0{options}".encode()).hexdigest()
+
+
+def generate_content(prompt, call_site, **kwargs):
+    """
+    Call Gemini with the given prompt and return the raw response.
+    Transient errors are retried; the final error is re-raised to the caller.
+    An identical call already in flight is awaited instead of sent again.
+    """
+    if not COALESCE_ENABLED:
+        return _generate_content(prompt, call_site, **kwargs)
+    response, shared = IN_FLIGHT.do(_flight_key(prompt, call_site, kwargs),
+                                    lambda: _generate_content(prompt, call_site, **kwargs))
+    if shared:
+        METRICS.record_coalesced(call_site)
+    return response
+
+
+def _generate_content(prompt, call_site, **kwargs):
+    if not BREAKER.allow():
+        METRICS.record_short_circuit(call_site)
+        raise CircuitOpenError(f"LLM circuit breaker is open; {call_site} call not sent")
+    model = genai.GenerativeModel(MODEL_NAME)
+    with tracing.span(f"llm.{call_site}", kind="SPAN_KIND_CLIENT", call_site=call_site, model=MODEL_NAME) as span:
+        start = time.perf_counter()
+        deadline = time.monotonic() + CALL_DEADLINE_SECONDS
+        retries = 0
+        while True:
+            try:
+                response = _attempt(model, prompt, call_site, kwargs, deadline)
+                break
+            except RETRYABLE_ERRORS:
+                backoff = RETRY_BACKOFF_SECONDS * 2 ** retries
+                if retries >= MAX_RETRIES or time.monotonic() + backoff >= deadline:
+                    elapsed = time.perf_counter() - start
+                    METRICS.record_call(call_site, elapsed, error=True, retries=retries)
+                    BREAKER.record(False, elapsed)
+                    raise
+                retries += 1
+                time.sleep(backoff)
+            except Exception:
+                METRICS.record_call(call_site, time.perf_counter() - start, error=True, retries=retries)
+                BREAKER.release()
+                raise
+
+        elapsed = time.perf_counter() - start
+        prompt_tokens, response_tokens = _token_counts(response)
+        METRICS.record_call(call_site, elapsed, prompt_tokens, response_tokens, retries=retries)
+        BREAKER.record(True, elapsed)
+        if span:
+            span.set_attribute("prompt_tokens", prompt_tokens)
+            span.set_attribute("response_tokens", response_tokens)
+            span.set_attribute("retries", retries)
+        return response
+
+
+def _with_timeout(kwargs, deadline):
+    """The call's kwargs with the SDK request timeout set to the time left before the deadline."""
+    request_options = dict(kwargs.get("request_options") or {})
+    request_options.setdefault("timeout", max(0.001, deadline - time.monotonic()))
+    return dict(kwargs, request_options=request_options)
+
+
+def _send(model, prompt, kwargs, deadline):
+    # A request slot is held per attempt, not across retry backoff
+    with SCHEDULER.slot():
+        return model.generate_content(prompt, **_with_timeout(kwargs, deadline))
+
+
+def _attempt(model, prompt, call_site, kwargs, deadline):
+    """
+    One attempt at the call. With hedging enabled, a second identical request
+    is sent if the first has not answered after HEDGE_AFTER_SECONDS, and the
+    first answer wins. The losing request is left to finish in the background.
+    """
+    if HEDGE_AFTER_SECONDS <= 0:
+        return _send(model, prompt, kwargs, deadline)
+    context = contextvars.copy_context()
+    first = _hedge_executor.submit(context.run, _send, model, prompt, kwargs, deadline)
+    done, _ = wait([first], timeout=min(HEDGE_AFTER_SECONDS, max(0.0, deadline - time.monotonic())))
+    if done:
+        return first.result()
+    second = _hedge_executor.submit(context.copy().run, _send, model, prompt, kwargs, deadline)
+    pending = {first, second}
+    while pending:
+        done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for future in done:
+            if future.exception() is None:
+                METRICS.record_hedge(call_site, won=future is second)
+                return future.result()
+        if not pending:
+            METRICS.record_hedge(call_site, won=False)
+            raise first.exception()
+    METRICS.record_hedge(call_site, won=False)
+    raise google_exceptions.DeadlineExceeded(f"{call_site} call did not finish within {CALL_DEADLINE_SECONDS}s")
+
+
+def stream_content(prompt, call_site, **kwargs):
+    """
+    Yield response text chunks as Gemini produces them. Transient errors are
+    retried only until the first chunk has been yielded. With LLM_STREAMING=0
+    the whole response is yielded as a single chunk.
+    """
+    if not STREAMING_ENABLED:
+        response = generate_content(prompt, call_site, **kwargs)
+        yield response.text if response and response.text else ""
+        return
+
+    if not BREAKER.allow():
+        METRICS.record_short_circuit(call_site)
+        raise CircuitOpenError(f"LLM circuit breaker is open; {call_site} call not sent")
+    model = genai.GenerativeModel(MODEL_NAME)
+    start_ns = time.time_ns()
+    start = time.perf_counter()
+    deadline = time.monotonic() + CALL_DEADLINE_SECONDS
+    first_chunk = None
+    retries = 0
+    response = None
+    # Set once the outcome has been reported with record() or release()
+    reported = False
+    try:
+        while True:
+            try:
+                with SCHEDULER.slot():
+                    response = model.generate_content(prompt, stream=True, **_with_timeout(kwargs, deadline))
+                    for chunk in response:
+                        text = chunk.text
+                        if first_chunk is None:
+                            first_chunk = time.perf_counter() - start
+                        if text:
+                            yield text
+                break
+            except RETRYABLE_ERRORS as e:
+                backoff = RETRY_BACKOFF_SECONDS * 2 ** retries
+                if first_chunk is None and retries < MAX_RETRIES and time.monotonic() + backoff < deadline:
+                    retries += 1
+                    time.sleep(backoff)
+                    continue
+                _finish_stream(call_site, start, start_ns, first_chunk, None, retries, error=e)
+                reported = True
+                BREAKER.record(False, time.perf_counter() - start)
+                raise
+            except Exception as e:
+                _finish_stream(call_site, start, start_ns, first_chunk, None, retries, error=e)
+                reported = True
+                BREAKER.release()
+                raise
+        _finish_stream(call_site, start, start_ns, first_chunk, response, retries)
+        reported = True
+        # A stream's health is judged by how soon it started answering, not by its length
+        BREAKER.record(True, first_chunk if first_chunk is not None else time.perf_counter() - start)
+    finally:
+        # A stream the caller abandoned (GeneratorExit on a Streamlit rerun or stop)
+        # must not leave a half-open probe in flight forever
+        if not reported:
+            BREAKER.release()
+
+
+def _finish_stream(call_site, start, start_ns, first_chunk, response, retries, error=None):
+    prompt_tokens, response_tokens = _token_counts(response) if response is not None else (0, 0)
+    METRICS.record_call(call_site, time.perf_counter() - start, prompt_tokens, response_tokens,
+                        error=error is not None, retries=retries, first_chunk_seconds=first_chunk)
+    # Spans cannot be held open across yields, so the stream is recorded once it ends.
+    tracing.record_span(
+        f"llm.{call_site}", start_ns, kind="SPAN_KIND_CLIENT", error=error,
+        call_site=call_site, model=MODEL_NAME, streaming=True, retries=retries,
+        prompt_tokens=prompt_tokens, response_tokens=response_tokens,
+        first_chunk_ms=round(first_chunk * 1000, 1) if first_chunk is not None else -1,
+    )
+
+
+# One pool per priority class, so interactive tasks never queue behind batch tasks
+_executors = {
+    INTERACTIVE: ThreadPoolExecutor(max_workers=FAN_OUT_WORKERS, thread_name_prefix="llm-fan-out"),
+    BATCH: ThreadPoolExecutor(max_workers=BATCH_FAN_OUT_WORKERS, thread_name_prefix="llm-fan-out-batch"),
+}
+# Runs the requests of hedged calls; each request still waits for a scheduler slot
+_hedge_executor = ThreadPoolExecutor(max_workers=2 * MAX_CONCURRENCY, thread_name_prefix="llm-hedge")
+
+
+def submit(func, *args, **kwargs):
+    """
+    Start func on the fan-out pool of the current priority class and return
+    its Future. The caller's context (trace span, priority, per-rerun SQL
+    counters) is carried into the worker. Tasks must not call Streamlit or
+    submit and wait on further fan-out work.
+    """
+    context = contextvars.copy_context()
+    executor = _executors[_priority.get()] if PRIORITY_SCHEDULING else _executors[INTERACTIVE]
+    return executor.submit(context.run, func, *args, **kwargs)
+
+
+def fan_out(calls, deadline=FAN_OUT_DEADLINE_SECONDS):
+    """
+    Run independent calls of one user action concurrently, so the action takes
+    as long as the slowest call instead of the sum of all of them.
+
+    `calls` maps a key to a zero-argument callable. All calls share one
+    deadline in seconds. Returns (results, errors): results maps each key that
+    completed to its return value, errors maps each key that raised or missed
+    the deadline to its exception (TimeoutError for the latter).
+    """
+    futures = {key: submit(func) for key, func in calls.items()}
+    _, not_done = wait(futures.values(), timeout=deadline)
+    results, errors = {}, {}
+    for key, future in futures.items():
+        if future in not_done:
+            future.cancel()
+            errors[key] = TimeoutError(f"{key} did not finish within {deadline}s")
+        elif future.exception() is not None:
+            errors[key] = future.exception()
+        else:
+            results[key] = future.result()
+    return results, errors
@@ -1,7 +1,6 @@
 import streamlit as st
-from database import register_user, login_user
-from ai_response import extract_details_with_gemini
-from pdf_processor import input_pdf_text
+from database import register_candidate, login_user, hash_password, content_hash
+from idempotency import run_once
 
 class LoginUI:
     def __init__(self, session_state):
@@ -22,29 +21,18 @@ class LoginUI:
 
                 if st.button("Register"):
                     if uploaded_file:
-                        file_path = f"resumes/{new_user}.pdf"
-                        with open(file_path, "wb") as f:
-                            f.write(uploaded_file.getvalue())
-
-                        # Extract details from the resume using Gemini
-                        with open(file_path, "rb") as f:
-                            resume_text = input_pdf_text(f)
-
-                        # Use Gemini to extract details from the resume
-                        extracted_data = extract_details_with_gemini(resume_text)
-
-                        if extracted_data:
-                            full_name = extracted_data.get("full_name")
-                            email = extracted_data.get("email")
-                            phone_number = extracted_data.get("phone_number")
-                            education = extracted_data.get("education")
-                            skills = extracted_data.get("skills")
-                            experience = extracted_data.get("experience")
-
-                            if register_user(new_user, new_password, "candidate", full_name, email, phone_number, education, skills, experience, file_path, None):
-                                st.success("✅ Account Created! Go to Login Page.")
-                            else:
-                                st.error("❌ Username already taken. Try another.")
+                        resume_bytes = uploaded_file.getvalue()
+                        # A rerun or double click with the same details returns the first attempt's outcome
+                        outcome, _ = run_once(
+                            new_user, "register",
+                            {"password": hash_password(new_password), "resume": content_hash(resume_bytes)},
+                            lambda: register_candidate(new_user, new_password, resume_bytes),
+                            remember=lambda outcome: outcome == "created",
+                        )
+                        if outcome == "created":
+                            st.success("✅ Account Created! Go to Login Page.")
+                        elif outcome == "taken":
+                            st.error("❌ Username already taken. Try another.")
                         else:
                             st.error("❌ Could not extract details from the resume. Please try again.")
                     else:
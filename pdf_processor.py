@@ -1,6 +1,10 @@
 import PyPDF2 as pdf
+import tracing
 
 def input_pdf_text(uploaded_file):
-    reader = pdf.PdfReader(uploaded_file)
-    text = "".join([page.extract_text() or "" for page in reader.pages])
-    return text.strip()
\ No newline at end of file
+    with tracing.span("pdf.extract") as span:
+        reader = pdf.PdfReader(uploaded_file)
+        text = "".join([page.extract_text() or "" for page in reader.pages])
+        if span:
+            span.set_attribute("pages", len(reader.pages))
+        return text.strip()
\ No newline at end of file
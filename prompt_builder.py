@@ -0,0 +1,104 @@
+"""
+Prompt builder.
+
+Scoring, match and roadmap prompts used to embed the whole extracted resume and
+job description. In the default "compact" mode a candidate is represented by the
+profile fields extracted at sign-up (skills, experience, education) and a job by
+a digest of its requirement sentences, each trimmed to a token budget. Set
+PROMPT_MODE=full to send the full texts as before.
+"""
+import functools
+import os
+import re
+
+PROMPT_MODE = os.getenv("PROMPT_MODE", "compact")
+CANDIDATE_TOKEN_BUDGET = int(os.getenv("PROMPT_CANDIDATE_TOKENS", "400"))
+JOB_TOKEN_BUDGET = int(os.getenv("PROMPT_JOB_TOKENS", "300"))
+
+# Rough token estimate, close enough for budgeting English prompts.
+CHARS_PER_TOKEN = 4
+
+REQUIREMENT_PATTERN = re.compile(
+    r"\b(requir|skill|experience|qualif|must|responsib|degree|knowledge|proficien|familiar|years)", re.IGNORECASE)
+PAGE_NUMBER_PATTERN = re.compile(r"^(page\s*)?\d+(\s*(of|/)\s*\d+)?$", re.IGNORECASE)
+
+
+def estimate_tokens(text):
+    return len(text or "") // CHARS_PER_TOKEN
+
+
+def normalize(text):
+    """
+    Collapse whitespace and drop empty lines, page numbers and lines repeated
+    on every page (headers and footers).
+    """
+    lines = [" ".join(line.split()) for line in (text or "").splitlines()]
+    lines = [line for line in lines if line and not PAGE_NUMBER_PATTERN.match(line)]
+    counts = {}
+    for line in lines:
+        counts[line] = counts.get(line, 0) + 1
+    seen = set()
+    kept = []
+    for line in lines:
+        if counts[line] > 1:
+            if line in seen:
+                continue
+            seen.add(line)
+        kept.append(line)
+    return "\n".join(kept)
+
+
+def truncate(text, budget):
+    """Cut text to roughly `budget` tokens, on a word boundary."""
+    limit = budget * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    return text[:limit].rsplit(" ", 1)[0] + " ..."
+
+
+def candidate_text(resume_text, skills=None, experience=None, education=None, budget=CANDIDATE_TOKEN_BUDGET):
+    """
+    Candidate representation for a prompt. Compact mode uses the extracted
+    profile fields and falls back to the normalized resume text when the
+    profile is empty; full mode returns the resume text unchanged.
+    """
+    fields = [(label, value.strip()) for label, value in
+              (("Skills", skills), ("Experience", experience), ("Education", education)) if value and value.strip()]
+    if PROMPT_MODE == "full":
+        return resume_text if resume_text else "\n".join(f"{label}: {value}" for label, value in fields)
+    if fields:
+        # Skills matter most for matching, so they get the first share of the budget
+        return truncate("\n".join(f"{label}: {' '.join(value.split())}" for label, value in fields), budget)
+    return truncate(normalize(resume_text), budget)
+
+
+def job_text(job_description, budget=JOB_TOKEN_BUDGET):
+    """
+    Job representation for a prompt. Compact mode keeps requirement sentences
+    first when the description exceeds the budget; full mode returns it unchanged.
+    """
+    if PROMPT_MODE == "full" or not job_description:
+        return job_description
+    return _job_digest(job_description, budget)
+
+
+@functools.lru_cache(maxsize=256)
+def _job_digest(job_description, budget):
+    sentences = []
+    for sentence in re.split(r"(?<=[.!?;])\s+|\n", normalize(job_description)):
+        sentence = sentence.strip(" -*•")
+        if sentence and sentence not in sentences:
+            sentences.append(sentence)
+    if estimate_tokens(" ".join(sentences)) <= budget:
+        return " ".join(sentences)
+
+    ranked = sorted(range(len(sentences)), key=lambda i: (not REQUIREMENT_PATTERN.search(sentences[i]), i))
+    chosen, used = set(), 0
+    for i in ranked:
+        cost = estimate_tokens(sentences[i]) + 1
+        if used + cost > budget:
+            continue
+        chosen.add(i)
+        used += cost
+    # Keep the original order so the digest still reads naturally
+    return " ".join(sentences[i] for i in sorted(chosen)) or truncate(sentences[0], budget)
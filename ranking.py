@@ -0,0 +1,304 @@
+"""
+Two-stage ranking of candidates for a job and of jobs for a candidate.
+
+Stage one is local BM25 retrieval over the candidate's resume text and profile
+fields (skills, experience, education) or over job descriptions. Skill
+synonyms are folded to canonical names (see skills.py), so "k8s" matches
+"Kubernetes". Stage two optionally rescores only the top k with the LLM
+scorer, so the number of LLM calls no longer grows with the size of the
+platform.
+
+Hard skill filters ("has all of Kubernetes, Go and Terraform") and skill
+coverage come from the bitmap SkillIndex over the candidate_skills table.
+"""
+import math
+import os
+import re
+import threading
+import time
+from functools import partial
+
+from database import initialize_db, get_candidate_documents, get_candidate_corpus_version, get_candidate_skill_rows, get_candidate_skills_version
+from llm_client import fan_out
+from pdf_processor import input_pdf_text
+from prompt_builder import candidate_text
+from skills import extract_skills, SkillIndex
+from utils import calculate_similarity_score, calculate_similarity_score_simple, summarize_job_description
+
+RERANK_TOP_K = int(os.getenv("RANKING_RERANK_TOP_K", "20"))
+INDEX_TTL_SECONDS = float(os.getenv("RANKING_INDEX_TTL_SECONDS", "300"))
+# Minimum similarity score for a job to be recommended
+RECOMMEND_THRESHOLD = 80
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9][a-z0-9+#]*")
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have in is it of on or our that the this to we will with you your
+""".split())
+
+
+def tokenize(text):
+    """Lowercase word tokens without stopwords, plus one token per canonical skill mentioned."""
+    if not text:
+        return []
+    tokens = [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+    tokens.extend("skill:" + skill.lower() for skill in extract_skills(text))
+    return tokens
+
+
+class BM25Index:
+    """Inverted index with Okapi BM25 scoring."""
+
+    def __init__(self, documents, k1=1.5, b=0.75):
+        """`documents` is an iterable of (doc_id, text)."""
+        self.k1 = k1
+        self.b = b
+        self.ids = []
+        self.lengths = []
+        self.postings = {}
+        for doc_id, text in documents:
+            index = len(self.ids)
+            self.ids.append(doc_id)
+            counts = {}
+            tokens = tokenize(text)
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, count in counts.items():
+                self.postings.setdefault(token, []).append((index, count))
+            self.lengths.append(len(tokens))
+        self.average_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+
+    def __len__(self):
+        return len(self.ids)
+
+    def idf(self, token):
+        frequency = len(self.postings.get(token, ()))
+        return math.log(1.0 + (len(self.ids) - frequency + 0.5) / (frequency + 0.5))
+
+    def search(self, query, limit=None):
+        """Return [(doc_id, score)] for documents sharing a term with the query, best first."""
+        scores = {}
+        average_length = self.average_length or 1.0
+        for token in set(tokenize(query)):
+            postings = self.postings.get(token)
+            if not postings:
+                continue
+            idf = self.idf(token)
+            for index, count in postings:
+                norm = self.k1 * (1.0 - self.b + self.b * self.lengths[index] / average_length)
+                scores[index] = scores.get(index, 0.0) + idf * count * (self.k1 + 1.0) / (count + norm)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        if limit is not None:
+            ranked = ranked[:limit]
+        return [(self.ids[index], score) for index, score in ranked]
+
+
+def candidate_document(skills, experience, education, resume_text):
+    # Skills are repeated so they weigh more than a passing mention in the resume body
+    return "\n".join(part for part in (skills, skills, experience, education, resume_text) if part)
+
+
+class CandidateIndex:
+    """BM25 over every candidate profile, rebuilt when candidates are added or after INDEX_TTL_SECONDS."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = None
+        self._profiles = {}
+        self._version = None
+        self._built_at = 0.0
+
+    def invalidate(self):
+        with self._lock:
+            self._index = None
+
+    def get(self):
+        version = get_candidate_corpus_version()
+        with self._lock:
+            fresh = (self._index is not None and self._version == version
+                     and time.monotonic() - self._built_at < INDEX_TTL_SECONDS)
+            if not fresh:
+                rows = get_candidate_documents()
+                self._profiles = {row[0]: row for row in rows}
+                self._index = BM25Index(
+                    (user_id, candidate_document(skills, experience, education, resume_text))
+                    for user_id, _, _, skills, experience, education, resume_text in rows
+                )
+                self._version = version
+                self._built_at = time.monotonic()
+            return self._index, self._profiles
+
+
+CANDIDATE_INDEX = CandidateIndex()
+
+
+class CandidateSkillIndex:
+    """SkillIndex over candidate_skills, rebuilt when the table changes or after INDEX_TTL_SECONDS."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = None
+        self._version = None
+        self._built_at = 0.0
+
+    def invalidate(self):
+        with self._lock:
+            self._index = None
+
+    def get(self):
+        version = get_candidate_skills_version()
+        with self._lock:
+            fresh = (self._index is not None and self._version == version
+                     and time.monotonic() - self._built_at < INDEX_TTL_SECONDS)
+            if not fresh:
+                self._index = SkillIndex(get_candidate_skill_rows())
+                self._version = version
+                self._built_at = time.monotonic()
+            return self._index
+
+
+SKILL_INDEX = CandidateSkillIndex()
+
+
+def invalidate_candidate_index():
+    """Call after a candidate's profile text changes."""
+    CANDIDATE_INDEX.invalidate()
+    SKILL_INDEX.invalidate()
+
+
+def rank_candidates(job_description, k=RERANK_TOP_K, rerank=True, required_skills=()):
+    """
+    Best candidates for a job description. All candidates are ranked locally;
+    with rerank=True only the top k are scored by the LLM and reordered by that
+    score. With required_skills only candidates having every one of them are
+    considered. Returns up to k dicts with user_id, full_name, email,
+    lexical_score, skill_coverage (share of the job's skills the candidate has)
+    and llm_score (None when not reranked or the call failed).
+    """
+    index, profiles = CANDIDATE_INDEX.get()
+    skill_index = SKILL_INDEX.get()
+    if required_skills:
+        allowed = set(skill_index.candidates_with_all(required_skills))
+        shortlist = [(user_id, score) for user_id, score in index.search(job_description) if user_id in allowed][:k]
+    else:
+        shortlist = index.search(job_description, limit=k)
+    job_skills = extract_skills(job_description)
+
+    llm_scores = {}
+    if rerank and shortlist:
+        calls = {}
+        for user_id, _ in shortlist:
+            _, _, _, skills, experience, education, resume_text = profiles[user_id]
+            calls[user_id] = partial(calculate_similarity_score,
+                                     candidate_text(resume_text, skills, experience, education), job_description)
+        llm_scores, errors = fan_out(calls)
+        for user_id, error in errors.items():
+            print(f"Error reranking candidate {user_id}: {error}")
+
+    results = []
+    for user_id, lexical_score in shortlist:
+        _, full_name, email = profiles[user_id][:3]
+        results.append({
+            "user_id": user_id,
+            "full_name": full_name,
+            "email": email,
+            "lexical_score": lexical_score,
+            "skill_coverage": skill_index.coverage(user_id, job_skills),
+            "llm_score": llm_scores.get(user_id),
+        })
+    if rerank:
+        # Reranked candidates by LLM score; any the LLM failed on keep their lexical order after them
+        results.sort(key=lambda result: (result["llm_score"] is None, -(result["llm_score"] or 0)))
+    return results
+
+
+def rank_jobs(candidate, jobs, k=RERANK_TOP_K, rerank=True, scorer=calculate_similarity_score):
+    """
+    Best jobs for a candidate. `candidate` is the prompt text from
+    prompt_builder.candidate_text and `jobs` a list of rows whose first three
+    columns are (job_id, job_role, job_description). Returns up to k
+    (row, lexical_score, llm_score) tuples, best first.
+    """
+    index = BM25Index((i, row[2]) for i, row in enumerate(jobs))
+    shortlist = index.search(candidate, limit=k)
+    llm_scores = {}
+    if rerank and shortlist:
+        llm_scores, errors = fan_out({i: partial(scorer, candidate, jobs[i][2]) for i, _ in shortlist})
+        for i, error in errors.items():
+            print(f"Error reranking job {jobs[i][1]}: {error}")
+    results = [(jobs[i], lexical_score, llm_scores.get(i)) for i, lexical_score in shortlist]
+    if rerank:
+        results.sort(key=lambda result: (result[2] is None, -(result[2] or 0)))
+    return results
+
+
+def recommend_jobs(candidate_id, threshold=RECOMMEND_THRESHOLD):
+    """
+    Jobs the candidate has not applied for whose similarity score is at least
+    threshold, best first, as dicts with job_id, job_role, summary,
+    similarity_score, job_type and internship_duration.
+    """
+    conn, cursor = initialize_db()
+
+    # Fetch the candidate's resume path and extracted profile fields
+    cursor.execute("SELECT resume_path, skills, experience, education FROM candidate_profiles WHERE user_id = ?", (candidate_id,))
+    row = cursor.fetchone()
+
+    # Fetch job roles the candidate has already applied for
+    cursor.execute(
+        "SELECT job_role FROM resumes WHERE candidate_profile_id = ? AND has_applied = 1",
+        (candidate_id,)
+    )
+    applied_jobs = {row[0] for row in cursor.fetchall()}  # Use a set for faster lookups
+    conn.close()
+
+    if row is None:
+        return []
+    resume_path, skills, experience, education = row
+    if not resume_path or not os.path.exists(resume_path):
+        return []
+
+    try:
+        with open(resume_path, "rb") as f:
+            resume_text = input_pdf_text(f)
+        candidate = candidate_text(resume_text, skills, experience, education)
+
+        conn, cursor = initialize_db()
+        cursor.execute("SELECT job_id, job_role, job_description, job_type, internship_duration FROM job_postings")
+        jobs = cursor.fetchall()
+        conn.close()
+
+        # Rank open jobs locally and LLM-score only the best RERANK_TOP_K of them
+        open_jobs = [job for job in jobs if job[1] not in applied_jobs]
+        ranked = rank_jobs(candidate, open_jobs, scorer=calculate_similarity_score_simple)
+
+        recommendations = []
+        for (job_id, job_role, job_description, job_type, internship_duration), _, similarity_score in ranked:
+            if similarity_score is not None and similarity_score >= threshold:
+                recommendations.append({
+                    "job_id": job_id,
+                    "job_role": job_role,
+                    "summary": summarize_job_description(job_description),
+                    "similarity_score": similarity_score,
+                    "job_type": job_type,
+                    "internship_duration": internship_duration,
+                })
+
+        # Sort recommendations by similarity score (descending)
+        recommendations.sort(key=lambda x: x["similarity_score"], reverse=True)
+        return recommendations
+    except Exception as e:
+        print(f"Error generating recommendations: {e}")
+        return []
+
+
+def recall_report(ranked_ids, exhaustive_scores, ks=(5, 10, 20, 50), relevant=10):
+    """
+    Recall of a stage-one ranking against exhaustive scoring: for each k, the
+    share of the `relevant` best candidates by exhaustive score that appear in
+    the first k ranked ids.
+    """
+    best = sorted(exhaustive_scores, key=exhaustive_scores.get, reverse=True)[:relevant]
+    if not best:
+        return {}
+    best = set(best)
+    return {k: len(best.intersection(ranked_ids[:k])) / len(best) for k in ks}
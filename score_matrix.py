@@ -0,0 +1,303 @@
+"""
+Dense candidates x job roles matrix of similarity scores.
+
+Scores are stored as one `resumes` row per (candidate, job role), so views
+across every role (best fits per candidate, threshold counts, histograms) mean
+a full scan and Python loops per request. The matrix keeps the same scores in a
+memory-mapped numpy array on disk, one row per candidate and one column per
+job role, NaN where there is no score. A trigger on `resumes` appends every
+score write to `score_changes`, and `sync()` applies only the writes since the
+last sync.
+
+The files are written by a single process; set SCORE_MATRIX_PATH per process
+if several servers share a working directory. Every process applies the same
+change log, so a matrix that finds changes it has not applied already pruned
+(by another process) rebuilds itself. Processes that share the database with
+others should set `prune = False`.
+
+On PostgreSQL, change ids come from a sequence and become visible in commit
+order, so a change can appear after a higher id was already applied. sync()
+therefore re-reads the last RESYNC_WINDOW ids and applies the ones it has not
+seen. Replaying them in id order is safe because two writes to the same
+resumes row commit in id order (the second waits for the first's row lock).
+A transaction that commits more than RESYNC_WINDOW ids late is still missed;
+call rebuild() periodically if that can happen.
+"""
+import json
+import os
+import threading
+
+import numpy as np
+
+import storage
+from database import get_all_scores, get_score_changes, prune_score_changes
+
+MATRIX_PATH = os.getenv("SCORE_MATRIX_PATH", "score_matrix")
+MATRIX_DTYPE = os.getenv("SCORE_MATRIX_DTYPE", "float32")
+# Applied changes are pruned from score_changes once this many have accumulated
+PRUNE_AFTER_CHANGES = 1000
+# Trailing change ids re-read on PostgreSQL for changes that committed late
+RESYNC_WINDOW = int(os.getenv("SCORE_MATRIX_RESYNC_WINDOW", "1000"))
+
+
+class ScoreMatrix:
+    """Memory-mapped score matrix with vectorized queries. All methods are thread-safe."""
+
+    def __init__(self, path=MATRIX_PATH, dtype=MATRIX_DTYPE):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self._lock = threading.RLock()
+        self._scores = None
+        self.candidate_ids = []
+        self._rows = {}
+        self.job_roles = []
+        self._columns = {}
+        self.last_change_id = 0
+        self._unpruned = 0
+        # Whether this process deletes applied changes from the shared log
+        self.prune = True
+        # Ids applied within the resync window on PostgreSQL; None after a
+        # rebuild or load, when the whole window is replayed once
+        self._recent = None
+
+    @property
+    def data_path(self):
+        return self.path + ".dat"
+
+    @property
+    def meta_path(self):
+        return self.path + ".json"
+
+    def _load(self):
+        """Open the matrix saved by an earlier process. Returns False if there is none or it does not match."""
+        try:
+            with open(self.meta_path) as f:
+                meta = json.load(f)
+            if meta["dtype"] != self.dtype.name:
+                return False
+            self._scores = np.memmap(self.data_path, dtype=self.dtype, mode="r+", shape=tuple(meta["shape"]))
+        except (OSError, ValueError, KeyError):
+            return False
+        self.candidate_ids = meta["candidate_ids"]
+        self._rows = {candidate_id: row for row, candidate_id in enumerate(self.candidate_ids)}
+        self.job_roles = meta["job_roles"]
+        self._columns = {job_role: column for column, job_role in enumerate(self.job_roles)}
+        self.last_change_id = meta["last_change_id"]
+        return True
+
+    def _save(self):
+        self._scores.flush()
+        meta = {
+            "dtype": self.dtype.name,
+            "shape": list(self._scores.shape),
+            "candidate_ids": self.candidate_ids,
+            "job_roles": self.job_roles,
+            "last_change_id": self.last_change_id,
+        }
+        temp_path = self.meta_path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(temp_path, self.meta_path)
+
+    def _allocate(self, rows, columns):
+        """Replace the backing file with a larger one, keeping the scores already in it."""
+        temp_path = self.data_path + ".tmp"
+        scores = np.memmap(temp_path, dtype=self.dtype, mode="w+", shape=(max(rows, 1), max(columns, 1)))
+        scores[:] = np.nan
+        if self._scores is not None:
+            old_rows, old_columns = self._scores.shape
+            scores[:old_rows, :old_columns] = self._scores
+        scores.flush()
+        os.replace(temp_path, self.data_path)
+        self._scores = scores
+
+    def _cell(self, candidate_id, job_role):
+        row = self._rows.get(candidate_id)
+        if row is None:
+            row = self._rows[candidate_id] = len(self.candidate_ids)
+            self.candidate_ids.append(candidate_id)
+        column = self._columns.get(job_role)
+        if column is None:
+            column = self._columns[job_role] = len(self.job_roles)
+            self.job_roles.append(job_role)
+        capacity_rows, capacity_columns = self._scores.shape
+        if row >= capacity_rows or column >= capacity_columns:
+            # Grow geometrically so appending candidates stays amortized O(1)
+            self._allocate(max(capacity_rows, row + 1) * (2 if row >= capacity_rows else 1),
+                           max(capacity_columns, column + 1) * (2 if column >= capacity_columns else 1))
+        return row, column
+
+    def rebuild(self):
+        """Reload every score from the resumes table."""
+        with self._lock:
+            last_change_id, rows = get_all_scores()
+            # Later rows win, as they would in the change log
+            latest = {(candidate_id, job_role): score for candidate_id, job_role, score in rows}
+            self.candidate_ids = sorted({candidate_id for candidate_id, _ in latest})
+            self._rows = {candidate_id: row for row, candidate_id in enumerate(self.candidate_ids)}
+            self.job_roles = sorted({job_role for _, job_role in latest})
+            self._columns = {job_role: column for column, job_role in enumerate(self.job_roles)}
+            self._scores = None
+            self._allocate(len(self.candidate_ids), len(self.job_roles))
+            if latest:
+                cells = np.array([(self._rows[c], self._columns[j]) for c, j in latest], dtype=np.int64)
+                values = np.array([np.nan if score is None else score for score in latest.values()], dtype=self.dtype)
+                self._scores[cells[:, 0], cells[:, 1]] = values
+            self.last_change_id = last_change_id
+            self._recent = None
+            self._save()
+            self._unpruned = 0
+            if last_change_id and self.prune:
+                prune_score_changes(self._prune_before())
+
+    def sync(self):
+        """Apply score writes made since the last sync (or load / rebuild the matrix the first time)."""
+        with self._lock:
+            if self._scores is None and not self._load():
+                self.rebuild()
+                return
+            late_commits = storage.dialect() == "postgresql"
+            after = max(0, self.last_change_id - RESYNC_WINDOW) if late_commits else self.last_change_id
+            last_change_id, changes = get_score_changes(after)
+            if last_change_id < self.last_change_id:
+                # The change log is behind the matrix, so the database was replaced
+                self.rebuild()
+                return
+            if late_commits:
+                changes = self._unseen(changes)
+            if not changes:
+                return
+            if not late_commits and changes[0][0] > self.last_change_id + 1:
+                # Changes after ours were pruned by another process, so they cannot be replayed
+                self.rebuild()
+                return
+            for _, candidate_id, job_role, score in changes:
+                row, column = self._cell(candidate_id, job_role)
+                self._scores[row, column] = np.nan if score is None else score
+            self.last_change_id = max(self.last_change_id, changes[-1][0])
+            self._save()
+            self._unpruned += len(changes)
+            if self.prune and self._unpruned >= PRUNE_AFTER_CHANGES:
+                prune_score_changes(self._prune_before())
+                self._unpruned = 0
+
+    def _unseen(self, changes):
+        """The changes in the resync window not applied yet, oldest first."""
+        if self._recent is None:
+            # Replaying the whole window in id order leaves every cell at its newest value
+            unseen = changes
+        else:
+            unseen = [change for change in changes if change[0] not in self._recent]
+        floor = max(self.last_change_id, unseen[-1][0] if unseen else 0) - RESYNC_WINDOW
+        self._recent = {change[0] for change in changes if change[0] > floor}
+        return unseen
+
+    def _prune_before(self):
+        # On PostgreSQL the resync window must stay in the log
+        if storage.dialect() == "postgresql":
+            return self.last_change_id - RESYNC_WINDOW
+        return self.last_change_id
+
+    def _view(self):
+        """The filled part of the matrix, with NaN for missing scores."""
+        self.sync()
+        return self._scores[:len(self.candidate_ids), :len(self.job_roles)]
+
+    @property
+    def nbytes(self):
+        with self._lock:
+            return 0 if self._scores is None else self._scores.nbytes
+
+    def shape(self):
+        with self._lock:
+            self.sync()
+            return len(self.candidate_ids), len(self.job_roles)
+
+    def top_k(self, job_role, k=10, threshold=None):
+        """[(candidate_id, score)] for the k best scored candidates for a role, best first."""
+        with self._lock:
+            scores = self._view()
+            column = self._columns.get(job_role)
+            if column is None:
+                return []
+            column_scores = np.nan_to_num(scores[:, column].astype(np.float32), nan=-np.inf)
+            return self._best(column_scores, self.candidate_ids, k, threshold)
+
+    def best_fits(self, candidate_id, k=3, threshold=None):
+        """[(job_role, score)] for the candidate's k best scored roles, best first."""
+        with self._lock:
+            scores = self._view()
+            row = self._rows.get(candidate_id)
+            if row is None:
+                return []
+            row_scores = np.nan_to_num(scores[row].astype(np.float32), nan=-np.inf)
+            return self._best(row_scores, self.job_roles, k, threshold)
+
+    @staticmethod
+    def _best(scores, labels, k, threshold):
+        k = min(k, len(scores))
+        if k <= 0:
+            return []
+        # argpartition finds the k best in linear time; only those k are sorted
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        floor = -np.inf if threshold is None else threshold
+        return [(labels[i], float(scores[i])) for i in best if scores[i] > -np.inf and scores[i] >= floor]
+
+    def top_k_per_role(self, k=5):
+        """{job_role: [(candidate_id, score)]} for every role at once."""
+        with self._lock:
+            scores = np.nan_to_num(self._view().astype(np.float32), nan=-np.inf)
+            if not scores.size:
+                return {}
+            k = min(k, scores.shape[0])
+            best = np.argpartition(-scores, k - 1, axis=0)[:k]
+            best_scores = np.take_along_axis(scores, best, axis=0)
+            order = np.argsort(-best_scores, axis=0, kind="stable")
+            best = np.take_along_axis(best, order, axis=0)
+            best_scores = np.take_along_axis(best_scores, order, axis=0)
+            return {
+                job_role: [(self.candidate_ids[best[i, column]], float(best_scores[i, column]))
+                           for i in range(k) if best_scores[i, column] > -np.inf]
+                for column, job_role in enumerate(self.job_roles)
+            }
+
+    def role_summary(self, threshold=None):
+        """{job_role: {"scored", "mean", "max", "above"}} for every role at once."""
+        with self._lock:
+            scores = self._view().astype(np.float32)
+            if not scores.size:
+                return {}
+            scored = ~np.isnan(scores)
+            counts = scored.sum(axis=0)
+            means = np.where(counts > 0, np.nansum(scores, axis=0) / np.maximum(counts, 1), np.nan)
+            maxima = np.where(counts > 0, np.where(scored, scores, -np.inf).max(axis=0), np.nan)
+            with np.errstate(invalid="ignore"):
+                above = (scores >= threshold).sum(axis=0) if threshold is not None else counts
+            return {
+                job_role: {
+                    "scored": int(counts[column]),
+                    "mean": None if np.isnan(means[column]) else float(means[column]),
+                    "max": None if np.isnan(maxima[column]) else float(maxima[column]),
+                    "above": int(above[column]),
+                }
+                for column, job_role in enumerate(self.job_roles)
+            }
+
+    def threshold_counts(self, threshold):
+        """{job_role: number of candidates scoring at least threshold}."""
+        return {job_role: summary["above"] for job_role, summary in self.role_summary(threshold).items()}
+
+    def histograms(self, bins=10, low=0.0, high=100.0):
+        """(bin edges, {job_role: counts per bin}) over every role at once."""
+        with self._lock:
+            scores = self._view().astype(np.float32)
+            edges = np.linspace(low, high, bins + 1)
+            # Bin index per cell; the top edge is inclusive and missing scores get index -1
+            index = np.clip(((scores - low) / (high - low) * bins).astype(np.float32), 0, bins - 1)
+            index = np.where(np.isnan(scores), -1, index).astype(np.int64)
+            counts = np.stack([(index == b).sum(axis=0) for b in range(bins)], axis=1)
+            return edges.tolist(), {job_role: counts[column].tolist() for column, job_role in enumerate(self.job_roles)}
+
+
+SCORE_MATRIX = ScoreMatrix()
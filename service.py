@@ -0,0 +1,322 @@
+"""
+Headless HTTP API for scoring, recommendations and roadmaps.
+
+Exposes the same database and AI functions the Streamlit pages use, so an ATS
+can integrate with the platform and scoring can be scaled separately from UI
+sessions. Built on the standard library's ThreadingHTTPServer:
+
+    python service.py --host 0.0.0.0 --port 8600 --workers 4
+
+Every endpoint except GET /health and GET /metrics takes and returns JSON:
+
+    POST /score            {"candidate_id" or "resume_text", "job_role" or "job_description"}
+    POST /batch-score      {"candidate_ids": [...], "job_role" or "job_description"}
+    POST /recommend        {"candidate_id", "threshold" (optional)}
+    POST /top-candidates   {"job_role", "k" (optional), "threshold" (optional)}
+    POST /ingest-resume    {"username", "password", "resume_base64"}
+    POST /roadmap          {"candidate_id", "job_role" or "job_description"}
+
+Scores carry "estimated": true when they were estimated locally because the
+LLM was unavailable (see utils.DegradedScore).
+
+Connections use HTTP/1.1 keep-alive, so a client can send many requests over
+one connection. Each batch-score request runs its calls concurrently in the
+batch priority class, and identical concurrent requests share one LLM call
+(see llm_client). With --workers N the listening socket is opened once and N
+forked processes accept on it, each with its own score matrix file. Set
+SERVICE_API_KEY to require an "Authorization: Bearer <key>" header.
+"""
+import argparse
+import base64
+import binascii
+import hmac
+import json
+import os
+import signal
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import score_matrix
+import tracing
+from database import (initialize_db, candidate_roadmap, content_hash, get_candidate_documents, get_candidate_names,
+                      get_job_description, get_score_statuses, hash_password, register_candidate)
+from idempotency import run_once
+from llm_client import METRICS as LLM_METRICS, BREAKER as LLM_BREAKER, fan_out, llm_priority, BATCH
+from prompt_builder import candidate_text
+from ranking import recommend_jobs, RECOMMEND_THRESHOLD
+from utils import calculate_similarity_score, is_degraded
+
+API_KEY = os.getenv("SERVICE_API_KEY")
+MAX_BODY_BYTES = int(os.getenv("SERVICE_MAX_BODY_BYTES", str(10 * 1024 * 1024)))
+MAX_BATCH_SIZE = int(os.getenv("SERVICE_MAX_BATCH_SIZE", "500"))
+ACCESS_LOG = os.getenv("SERVICE_ACCESS_LOG", "0") == "1"
+
+
+class ServiceError(Exception):
+    """An error reported to the client with the given HTTP status."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _require(payload, *fields):
+    """The first of the fields present in the payload, or a 400 naming them."""
+    for field in fields:
+        if payload.get(field) not in (None, ""):
+            return field, payload[field]
+    raise ServiceError(400, f"Missing {' or '.join(fields)}")
+
+
+def _job_description(payload):
+    field, value = _require(payload, "job_description", "job_role")
+    if field == "job_description":
+        return value
+    job_description = get_job_description(value)
+    if job_description is None:
+        raise ServiceError(404, f"Unknown job role {value!r}")
+    return job_description
+
+
+def _candidate_texts(candidate_ids):
+    """{candidate_id: prompt text} for stored candidates; unknown ids are left out."""
+    return {
+        user_id: candidate_text(resume_text, skills, experience, education)
+        for user_id, _, _, skills, experience, education, resume_text in get_candidate_documents(candidate_ids)
+    }
+
+
+def _score_result(score):
+    return {"score": None if score is None else float(score), "estimated": is_degraded(score)}
+
+
+def score(payload):
+    job_description = _job_description(payload)
+    field, value = _require(payload, "resume_text", "candidate_id")
+    if field == "resume_text":
+        candidate = candidate_text(value)
+    else:
+        candidate = _candidate_texts([value]).get(value)
+        if candidate is None:
+            raise ServiceError(404, f"Unknown candidate {value!r}")
+    return _score_result(calculate_similarity_score(candidate, job_description))
+
+
+def batch_score(payload):
+    job_description = _job_description(payload)
+    _, candidate_ids = _require(payload, "candidate_ids")
+    if not isinstance(candidate_ids, list) or len(candidate_ids) > MAX_BATCH_SIZE:
+        raise ServiceError(400, f"candidate_ids must be a list of at most {MAX_BATCH_SIZE} ids")
+    candidates = _candidate_texts(candidate_ids)
+    with llm_priority(BATCH):
+        scores, errors = fan_out({
+            candidate_id: partial(calculate_similarity_score, candidate, job_description)
+            for candidate_id, candidate in candidates.items()
+        })
+    results = []
+    for candidate_id in candidate_ids:
+        if candidate_id not in candidates:
+            results.append({"candidate_id": candidate_id, "error": "unknown candidate"})
+        elif candidate_id in errors:
+            results.append({"candidate_id": candidate_id, "error": str(errors[candidate_id])})
+        else:
+            results.append({"candidate_id": candidate_id, **_score_result(scores[candidate_id])})
+    return {"results": results}
+
+
+def recommend(payload):
+    _, candidate_id = _require(payload, "candidate_id")
+    recommendations = recommend_jobs(candidate_id, payload.get("threshold", RECOMMEND_THRESHOLD))
+    return {"recommendations": [
+        {**job, "similarity_score": float(job["similarity_score"]), "estimated": is_degraded(job["similarity_score"])}
+        for job in recommendations
+    ]}
+
+
+def top_candidates(payload):
+    _, job_role = _require(payload, "job_role")
+    ranked = score_matrix.SCORE_MATRIX.top_k(job_role, int(payload.get("k", 10)), payload.get("threshold"))
+    names = get_candidate_names(user_id for user_id, _ in ranked)
+    statuses = get_score_statuses(job_role)
+    return {"candidates": [
+        {
+            "candidate_id": user_id,
+            "full_name": names[user_id][0],
+            "email": names[user_id][1],
+            # The matrix stores float32, so drop the representation noise
+            "score": round(score, 2),
+            "status": statuses.get(user_id),
+        }
+        for user_id, score in ranked if user_id in names
+    ]}
+
+
+def ingest_resume(payload):
+    _, username = _require(payload, "username")
+    _, password = _require(payload, "password")
+    _, encoded = _require(payload, "resume_base64")
+    try:
+        resume_bytes = base64.b64decode(encoded, validate=True)
+    except (binascii.Error, ValueError):
+        raise ServiceError(400, "resume_base64 is not valid base64")
+    # A retried request with the same details returns the first attempt's outcome
+    outcome, duplicate = run_once(
+        username, "register",
+        {"password": hash_password(password), "resume": content_hash(resume_bytes)},
+        lambda: register_candidate(username, password, resume_bytes),
+        remember=lambda outcome: outcome == "created",
+    )
+    if outcome == "taken":
+        raise ServiceError(409, "Username already taken")
+    if outcome == "unreadable":
+        raise ServiceError(422, "Could not extract details from the resume")
+    return {"outcome": outcome, "duplicate": duplicate}
+
+
+def roadmap(payload):
+    job_description = _job_description(payload)
+    _, candidate_id = _require(payload, "candidate_id")
+    documents = get_candidate_documents([candidate_id])
+    names = get_candidate_names([candidate_id])
+    if not documents or candidate_id not in names:
+        raise ServiceError(404, f"Unknown candidate {candidate_id!r}")
+    _, _, _, skills, experience, education, _ = documents[0]
+    resume_path = names[candidate_id][2]
+    result = candidate_roadmap(resume_path, skills, experience, education, job_description)
+    if result is None:
+        raise ServiceError(503, "Could not generate a roadmap")
+    return {"roadmap": json.loads(result) if result.lstrip().startswith("{") else result}
+
+
+ROUTES = {
+    "/score": score,
+    "/batch-score": batch_score,
+    "/recommend": recommend,
+    "/top-candidates": top_candidates,
+    "/ingest-resume": ingest_resume,
+    "/roadmap": roadmap,
+}
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps connections open between requests
+    protocol_version = "HTTP/1.1"
+    server_version = "SmartHiringService/1.0"
+
+    def _send(self, status, body, content_type="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, data):
+        self._send(status, json.dumps(data, ensure_ascii=False).encode())
+
+    def _authorized(self):
+        if not API_KEY:
+            return True
+        return hmac.compare_digest(self.headers.get("Authorization", ""), f"Bearer {API_KEY}")
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok", "llm_circuit": LLM_BREAKER.snapshot()["state"]})
+        elif self.path == "/metrics":
+            self._send(200, LLM_METRICS.to_prometheus().encode(), "text/plain; version=0.0.4")
+        else:
+            self._send_json(404, {"error": f"Unknown endpoint {self.path}"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_BYTES:
+            # The body is not read, so the connection cannot be reused
+            self.close_connection = True
+            self._send_json(413, {"error": f"Request body over {MAX_BODY_BYTES} bytes"})
+            return
+        body = self.rfile.read(length)
+        route = ROUTES.get(self.path)
+        if route is None:
+            self._send_json(404, {"error": f"Unknown endpoint {self.path}"})
+            return
+        if not self._authorized():
+            self._send_json(401, {"error": "Missing or invalid API key"})
+            return
+        with tracing.span(f"http{self.path}", kind="SPAN_KIND_SERVER", root=True):
+            try:
+                payload = json.loads(body or b"{}")
+                if not isinstance(payload, dict):
+                    raise ServiceError(400, "Request body must be a JSON object")
+                self._send_json(200, route(payload))
+            except json.JSONDecodeError as e:
+                self._send_json(400, {"error": f"Invalid JSON: {e}"})
+            except ServiceError as e:
+                self._send_json(e.status, {"error": str(e)})
+            except Exception as e:
+                print(f"Error handling {self.path}: {e}")
+                self._send_json(500, {"error": "Internal error"})
+
+    def log_message(self, format, *args):
+        if ACCESS_LOG:
+            super().log_message(format, *args)
+
+
+class ServiceServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Deeper accept queue for bursts from several workers sharing the socket
+    request_queue_size = 128
+
+
+def serve(host, port, workers=1):
+    """Serve until interrupted, in this process or in `workers` forked processes sharing the socket."""
+    os.makedirs("resumes", exist_ok=True)
+    # Run migrations once before any worker starts
+    conn, _ = initialize_db()
+    conn.close()
+    server = ServiceServer((host, port), ServiceHandler)
+    print(f"Serving on http://{host}:{server.server_port} with {workers} worker(s)")
+    if workers <= 1 or not hasattr(os, "fork"):
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        return
+
+    # Fork before any request has started a thread pool
+    children = []
+    for worker in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            # The score matrix files are written by a single process
+            score_matrix.SCORE_MATRIX.path = f"{score_matrix.MATRIX_PATH}.worker{worker}"
+            # Workers read the change log at their own pace, so none of them prunes it
+            score_matrix.SCORE_MATRIX.prune = False
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            try:
+                server.serve_forever()
+            finally:
+                os._exit(0)
+        children.append(pid)
+    try:
+        for pid in children:
+            os.waitpid(pid, 0)
+    except KeyboardInterrupt:
+        for pid in children:
+            os.kill(pid, signal.SIGTERM)
+    finally:
+        server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default=os.getenv("SERVICE_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("SERVICE_PORT", "8600")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("SERVICE_WORKERS", "1")),
+                        help="Processes accepting on the shared socket")
+    args = parser.parse_args(argv)
+    serve(args.host, args.port, args.workers)
+
+
+if __name__ == "__main__":
+    main()
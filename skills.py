@@ -0,0 +1,208 @@
+"""
+Skill vocabulary.
+
+Canonical skill names with the spellings they appear under in resumes and job
+descriptions, and a matcher that finds them in free text. This gives a cheap
+local skill gap between a candidate and a job without asking the LLM, and an
+in-memory bitmap index over candidate skill sets for "has all of" filters.
+"""
+import functools
+import re
+
+# Canonical name -> other spellings. Matching is case-insensitive except for
+# names of two characters or fewer ("Go", "R"), which must match exactly.
+SKILL_SYNONYMS = {
+    # Languages
+    "Python": ["python3"],
+    "Java": [],
+    "Go": ["Golang"],
+    "Rust": [],
+    "C++": ["cpp"],
+    "C#": ["csharp", "c sharp"],
+    "JavaScript": ["JS", "ecmascript"],
+    "TypeScript": [],
+    "Kotlin": [],
+    "Scala": [],
+    "Ruby": [],
+    "PHP": [],
+    "SQL": [],
+    "R": [],
+    # Web
+    "React": ["react.js", "reactjs"],
+    "Angular": ["angularjs"],
+    "Vue": ["vue.js", "vuejs"],
+    "Django": [],
+    "Flask": [],
+    "FastAPI": [],
+    "Spring Boot": [],
+    "Node.js": ["nodejs"],
+    "GraphQL": [],
+    "REST APIs": ["rest api", "restful"],
+    "HTML": ["html5"],
+    "CSS": ["css3"],
+    # Data
+    "Pandas": [],
+    "NumPy": [],
+    "Spark": ["pyspark", "apache spark"],
+    "Hadoop": [],
+    "Kafka": ["apache kafka"],
+    "Airflow": ["apache airflow"],
+    "dbt": [],
+    "Snowflake": [],
+    "PostgreSQL": ["postgres"],
+    "MySQL": [],
+    "MongoDB": ["mongo"],
+    "Redis": [],
+    "Elasticsearch": ["elastic search"],
+    # Machine learning
+    "TensorFlow": [],
+    "PyTorch": [],
+    "scikit-learn": ["sklearn", "scikit learn"],
+    "NLP": ["natural language processing"],
+    "Computer Vision": [],
+    "LLMs": ["llm", "large language models"],
+    "MLOps": [],
+    "Machine Learning": ["ML"],
+    "Deep Learning": [],
+    "Statistics": [],
+    # Cloud and operations
+    "AWS": ["amazon web services"],
+    "GCP": ["google cloud"],
+    "Azure": [],
+    "Docker": [],
+    "Kubernetes": ["k8s"],
+    "Terraform": [],
+    "Ansible": [],
+    "CI/CD": ["ci-cd", "continuous integration"],
+    "Linux": [],
+    "Prometheus": [],
+    "Git": [],
+    # Practices
+    "Communication": [],
+    "Leadership": [],
+    "Agile": [],
+    "Scrum": [],
+    "Mentoring": [],
+    "Stakeholder Management": [],
+}
+
+# Skill names can contain characters (+, #, ., /) that defeat \b, so boundaries
+# are spelled out: not preceded or followed by a word character or +/#/&.
+_BOUNDARY_BEFORE = r"(?<![\w+#&])"
+_BOUNDARY_AFTER = r"(?![\w+#&]|\.\w)"
+
+
+def _build_matchers():
+    lookup = {}
+    exact, folded = [], []
+    for canonical, aliases in SKILL_SYNONYMS.items():
+        for name in [canonical] + aliases:
+            if len(name) <= 2:
+                lookup[name] = canonical
+                exact.append(name)
+            else:
+                lookup[name.lower()] = canonical
+                folded.append(name)
+
+    def pattern(names, flags=0):
+        # Longest first so "Spring Boot" wins over "Spring"
+        alternation = "|".join(re.escape(name) for name in sorted(names, key=len, reverse=True))
+        return re.compile(f"{_BOUNDARY_BEFORE}({alternation}){_BOUNDARY_AFTER}", flags)
+
+    return lookup, pattern(exact), pattern(folded, re.IGNORECASE)
+
+
+_LOOKUP, _EXACT_PATTERN, _FOLDED_PATTERN = _build_matchers()
+
+
+@functools.lru_cache(maxsize=4096)
+def extract_skills(text):
+    """Return the frozenset of canonical skills mentioned in text."""
+    if not text:
+        return frozenset()
+    found = {_LOOKUP[match] for match in _EXACT_PATTERN.findall(text)}
+    found.update(_LOOKUP[match.lower()] for match in _FOLDED_PATTERN.findall(text))
+    return frozenset(found)
+
+
+def skill_gap(candidate_skills, job_description):
+    """
+    Canonical skills the job asks for that the candidate's skills text does not
+    mention, sorted for a stable signature.
+    """
+    return tuple(sorted(extract_skills(job_description) - extract_skills(candidate_skills), key=str.lower))
+
+
+def gap_signature(missing_skills):
+    """Normalized key for a skill gap: the same missing skills give the same signature."""
+    return "|".join(sorted(skill.lower() for skill in missing_skills))
+
+
+def canonical_skill(name):
+    """Canonical name for a skill or one of its synonyms, or None if it is not in the vocabulary."""
+    name = name.strip()
+    return _LOOKUP.get(name) or _LOOKUP.get(name.lower())
+
+
+class SkillIndex:
+    """
+    Inverted index from canonical skill to the candidates having it, stored as
+    one bitmap per skill (a Python int with one bit per candidate), so "has all
+    of X, Y and Z" is a few big-int ANDs and a popcount.
+    """
+
+    def __init__(self, rows):
+        """`rows` is an iterable of (candidate_id, canonical skill name)."""
+        self.candidate_ids = []
+        self._position = {}
+        self.skills_by_candidate = {}
+        positions = {}
+        for candidate_id, skill in rows:
+            position = self._position.get(candidate_id)
+            if position is None:
+                position = self._position[candidate_id] = len(self.candidate_ids)
+                self.candidate_ids.append(candidate_id)
+                self.skills_by_candidate[candidate_id] = set()
+            self.skills_by_candidate[candidate_id].add(skill)
+            positions.setdefault(skill, []).append(position)
+        # Build each bitmap in a bytearray; OR-ing bits into a big int one at a time is quadratic
+        size = (len(self.candidate_ids) + 7) // 8
+        self.bitmaps = {}
+        for skill, skill_positions in positions.items():
+            bits = bytearray(size)
+            for position in skill_positions:
+                bits[position >> 3] |= 1 << (position & 7)
+            self.bitmaps[skill] = int.from_bytes(bits, "little")
+
+    def __len__(self):
+        return len(self.candidate_ids)
+
+    def _all_of(self, skills):
+        canonical = [canonical_skill(skill) for skill in skills]
+        if not canonical or None in canonical:
+            return 0
+        bitmap = -1
+        for skill in canonical:
+            bitmap &= self.bitmaps.get(skill, 0)
+        return max(bitmap, 0)
+
+    def count_with_all(self, skills):
+        """Number of candidates having every one of the skills."""
+        return self._all_of(skills).bit_count()
+
+    def candidates_with_all(self, skills, limit=None):
+        """Ids of candidates having every one of the skills, in index order."""
+        bitmap = self._all_of(skills)
+        result = []
+        while bitmap and (limit is None or len(result) < limit):
+            lowest = bitmap & -bitmap
+            result.append(self.candidate_ids[lowest.bit_length() - 1])
+            bitmap ^= lowest
+        return result
+
+    def coverage(self, candidate_id, skills):
+        """Share of the given skills the candidate has (1.0 when skills is empty)."""
+        wanted = {canonical_skill(skill) or skill for skill in skills}
+        if not wanted:
+            return 1.0
+        return len(wanted & self.skills_by_candidate.get(candidate_id, set())) / len(wanted)
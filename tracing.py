@@ -0,0 +1,167 @@
+"""
+Lightweight request tracing.
+
+Each Streamlit rerun opens a root span; UI actions, database statements, LLM
+calls and PDF parsing open nested spans under it. Sampled traces are appended
+to a JSONL file with OpenTelemetry (OTLP/JSON) field names and the most recent
+ones are kept in memory for the admin debug sidebar.
+"""
+import contextvars
+import functools
+import json
+import os
+import random
+import secrets
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.1"))
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", "traces.jsonl")
+RECENT_TRACES = 20
+SERVICE_NAME = "smart-hiring-system"
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_export_lock = threading.Lock()
+_recent = deque(maxlen=RECENT_TRACES)
+
+
+class Span:
+    def __init__(self, name, trace, parent, kind, attributes):
+        self.name = name
+        self.trace = trace
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent else None
+        self.depth = parent.depth + 1 if parent else 0
+        self.kind = kind
+        self.attributes = dict(attributes)
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+
+    @property
+    def duration_ms(self):
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def to_otlp(self):
+        return {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in self.attributes.items()],
+            "status": {"code": "STATUS_CODE_ERROR", "message": self.error} if self.error else {"code": "STATUS_CODE_OK"},
+            "resource": {"service.name": SERVICE_NAME},
+        }
+
+
+class Trace:
+    def __init__(self, sampled):
+        self.trace_id = secrets.token_hex(16)
+        self.sampled = sampled
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def current_trace_id():
+    span = _current_span.get()
+    return span.trace.trace_id if span else None
+
+
+@contextmanager
+def span(name, kind="SPAN_KIND_INTERNAL", root=False, **attributes):
+    """
+    Open a span under the current one. With root=True a new trace is started
+    and a sampling decision made; otherwise spans outside a sampled trace are
+    no-ops and yield None.
+    """
+    parent = None if root else _current_span.get()
+    if root:
+        trace = Trace(sampled=random.random() < TRACE_SAMPLE_RATE)
+    elif parent is None:
+        yield None
+        return
+    else:
+        trace = parent.trace
+    if not trace.sampled:
+        # Keep the trace id available for logs even when spans are not recorded.
+        if root:
+            token = _current_span.set(Span(name, trace, None, kind, {}))
+            try:
+                yield None
+            finally:
+                _current_span.reset(token)
+        else:
+            yield None
+        return
+
+    current = Span(name, trace, parent, kind, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.end_ns = time.time_ns()
+        _current_span.reset(token)
+        trace.add(current)
+        if root:
+            _finish(trace)
+
+
+def record_span(name, start_ns, kind="SPAN_KIND_INTERNAL", error=None, **attributes):
+    """Record an already finished span (started at start_ns) under the current span."""
+    parent = _current_span.get()
+    if parent is None or not parent.trace.sampled:
+        return
+    finished = Span(name, parent.trace, parent, kind, attributes)
+    finished.start_ns = start_ns
+    finished.end_ns = time.time_ns()
+    if error is not None:
+        finished.error = f"{type(error).__name__}: {error}"
+    parent.trace.add(finished)
+
+
+def traced(name, kind="SPAN_KIND_INTERNAL"):
+    """Decorator that wraps each call of the function in a span."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name, kind=kind):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _finish(trace):
+    _recent.append(trace)
+    lines = [json.dumps(s.to_otlp(), ensure_ascii=False) for s in trace.spans]
+    with _export_lock:
+        with open(TRACE_EXPORT_PATH, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+def recent_traces():
+    return list(_recent)
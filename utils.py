@@ -1,14 +1,75 @@
-from dotenv import load_dotenv
-import google.generativeai as genai
-import os
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+from llm_client import generate_content
+from prompt_builder import job_text
+from skills import extract_skills
+
+# Recent LLM scores by prompt, reused when the LLM is unavailable
+RECENT_SCORES_SIZE = 4096
+_recent_scores = OrderedDict()
+_recent_scores_lock = threading.Lock()
+
+
+class DegradedScore(float):
+    """
+    A score estimated locally because the LLM could not be reached. It behaves
+    like a float, but is stored with resumes.score_degraded set so it is not
+    mistaken for a real score.
+    """
+    degraded = True
+
+
+def is_degraded(score):
+    return getattr(score, "degraded", False)
+
+
+def local_similarity_score(resume_text, job_description):
+    """
+    Estimate a 0-100 similarity without the LLM: the share of the job's skills
+    the resume mentions, or of the job's longer words when it names no known
+    skills.
+    """
+    job = job_text(job_description)
+    job_skills = extract_skills(job)
+    if job_skills:
+        overlap = len(extract_skills(resume_text) & job_skills) / len(job_skills)
+    else:
+        job_words = set(re.findall(r"[a-z][a-z+#]{3,}", job.lower()))
+        resume_words = set(re.findall(r"[a-z][a-z+#]{3,}", (resume_text or "").lower()))
+        overlap = len(job_words & resume_words) / len(job_words) if job_words else 0.0
+    return DegradedScore(round(100 * overlap, 2))
+
+
+def _score(prompt, resume_text, job_description):
+    """
+    Ask the LLM for a similarity score. If the call fails or the answer is not
+    a number, fall back to the last score given for the same prompt, then to a
+    local estimate.
+    """
+    key = hashlib.sha256(prompt.encode()).hexdigest()
+    try:
+        response = generate_content(prompt, call_site="scoring")
+        score = float(response.text.strip())
+    except Exception as e:
+        print(f"Error calculating contextual similarity score: {e}")
+        with _recent_scores_lock:
+            cached = _recent_scores.get(key)
+        return cached if cached is not None else local_similarity_score(resume_text, job_description)
+    with _recent_scores_lock:
+        _recent_scores[key] = score
+        _recent_scores.move_to_end(key)
+        if len(_recent_scores) > RECENT_SCORES_SIZE:
+            _recent_scores.popitem(last=False)
+    return score
 
-# Load environment variables and configure the Gemini API
-load_dotenv()
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 
 def calculate_similarity_score(resume_text, job_description, job_requirements=None):
     """
     Calculate the contextual similarity score between a resume and a job description.
+    Returns a DegradedScore estimate when the LLM is unavailable.
     """
     try:
         # Define the prompt for contextual similarity evaluation
@@ -19,16 +80,14 @@ def calculate_similarity_score(resume_text, job_description, job_requirements=No
         {resume_text}
         
         Job Description:
-        {job_description}
+        {job_text(job_description)}
         
         Provide only the similarity score as a  between 0 - 100.
         """
-        model = genai.GenerativeModel('gemini-2.0-flash-lite')
-        response = model.generate_content(prompt)
-        return float(response.text.strip())
+        return _score(prompt, resume_text, job_description)
     except Exception as e:
         print(f"Error calculating contextual similarity score: {e}")
-        return 0
+        return local_similarity_score(resume_text, job_description)
 
 def summarize_job_description(job_description):
     """
@@ -41,20 +100,21 @@ def summarize_job_description(job_description):
         {job_description}
         """
         # Use the Gemini API to generate the summary
-        model = genai.GenerativeModel('gemini-2.0-flash-lite')
-        response = model.generate_content(prompt)
+        response = generate_content(prompt, call_site="summary")
         
         # Extract and return the summary
         return response.text if response and response.text else "Error: No summary generated."
     except Exception as e:
         print(f"Error summarizing job description using Gemini: {e}")
-        return "Error summarizing job description."
+        # Without the LLM, show the locally condensed description rather than an error
+        return job_text(job_description) or "Error summarizing job description."
     
 
 # Similarity for personalized job recommendations
 def calculate_similarity_score_simple(resume_text, job_description):
     """
     Calculate the contextual similarity score between a resume and a job description.
+    Returns a DegradedScore estimate when the LLM is unavailable.
     """
     try:
         # Define the prompt for contextual similarity evaluation
@@ -65,16 +125,14 @@ def calculate_similarity_score_simple(resume_text, job_description):
         {resume_text}
         
         Job Description:
-        {job_description}
+        {job_text(job_description)}
         
         Provide only the similarity score as a number between 0 - 100.
         """
-        model = genai.GenerativeModel('gemini-2.0-flash-lite')
-        response = model.generate_content(prompt)
-        return float(response.text.strip())
+        return _score(prompt, resume_text, job_description)
     except Exception as e:
         print(f"Error calculating contextual similarity score: {e}")
-        return 0
+        return local_similarity_score(resume_text, job_description)
 
 def format_name(raw_name):
     """